@@ -0,0 +1,429 @@
+'''
+asyncio engine of the downloaders: ODATA pages, '$count' probes and
+documents are requested concurrently on 1 event loop, under a global
+bound of in-flight requests and per-host limits.
+Pages and documents are saved by the downloaders' own methods,
+on the same folders and files as the synchronous engine.
+Requires aiohttp.
+'''
+import os
+import json
+import time
+import asyncio
+import logging
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from odata_query import build_page_url, build_count_url, apply_client_paging
+from http_client import RETRY_STATUSES, backoff_delay, retry_after_delay
+from file_utils import AtomicStreamWriter
+from crawl_metrics import get_metrics, span
+from blob_store import NOT_MODIFIED
+
+
+def import_aiohttp():
+    try:
+        import aiohttp
+    except ImportError as err:
+        raise ImportError("aiohttp is required for the async engine, 'pip install aiohttp'") from err
+    return aiohttp
+
+
+def read_json(path:str):
+    with open(path, "r", encoding="utf-8") as _fin:
+        return json.load(_fin)
+
+
+class AsyncHostRateLimiter():
+    """
+    asyncio counterpart of HostRateLimiter: bound in-flight requests
+    per host and keep a minimal interval between requests to a host.
+    """
+
+    def __init__(self, max_connections_per_host:int=None, min_interval:float=None) -> None:
+        if max_connections_per_host is None:
+            max_connections_per_host=config.max_connections_per_host
+        if min_interval is None:
+            min_interval=config.min_request_interval_per_host
+        self.max_connections_per_host=max_connections_per_host
+        self.min_interval=min_interval
+        self._semaphores={}
+        self._next_slot={}
+
+    def semaphore(self, url:str)->asyncio.Semaphore:
+        host=urlparse(url).netloc
+        if host not in self._semaphores:
+            self._semaphores[host]=asyncio.Semaphore(self.max_connections_per_host)
+        return self._semaphores[host]
+
+    async def wait_for_slot(self, url:str):
+        # Reserve the next free time slot of the host, then sleep until it.
+        host=urlparse(url).netloc
+        now=time.monotonic()
+        slot=max(now, self._next_slot.get(host, now))
+        self._next_slot[host]=slot+self.min_interval
+        if slot>now:
+            await asyncio.sleep(slot-now)
+
+
+class AsyncHttpClient():
+    """
+    aiohttp session with a global bound of in-flight requests,
+    per-host limits, timeouts and the retries policy of HttpClient.
+    Create and use inside a running event loop.
+    """
+
+    def __init__(self, max_concurrency:int=None, rate_limiter:AsyncHostRateLimiter=None,
+            max_retries:int=None, timeout:tuple=None) -> None:
+        aiohttp=import_aiohttp()
+        self.log=logging.getLogger('default')
+        self.aiohttp=aiohttp
+        max_concurrency=max_concurrency if max_concurrency is not None else config.async_max_concurrency
+        self.semaphore=asyncio.Semaphore(max_concurrency)
+        self.rate_limiter=rate_limiter if rate_limiter is not None else AsyncHostRateLimiter()
+        self.max_retries=max_retries if max_retries is not None else config.http_max_retries
+        connect_timeout, read_timeout=timeout if timeout is not None else config.http_timeout
+        self.session=aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=max_concurrency),
+            timeout=aiohttp.ClientTimeout(connect=connect_timeout, sock_read=read_timeout))
+
+    async def request(self, url:str, handle_response, headers:dict=None):
+        """
+        GET url with headers and await handle_response(response) while the request
+        is in flight, retried on connection errors, timeouts and retryable
+        statuses. handle_response gets the last response once retries
+        are exhausted, the last connection error is raised.
+        """
+        for attempt in range(self.max_retries+1):
+            delay=None
+            try:
+                async with self.semaphore, self.rate_limiter.semaphore(url):
+                    await self.rate_limiter.wait_for_slot(url)
+                    async with self.session.get(url, headers=headers) as response:
+                        if response.status not in RETRY_STATUSES or attempt==self.max_retries:
+                            return await handle_response(response)
+                        delay=retry_after_delay(response.headers)
+                        get_metrics().inc("http_retries")
+                        self.log.info(f"Status {response.status} on {url}, retry")
+            except (self.aiohttp.ClientConnectionError, self.aiohttp.ClientPayloadError,
+                    asyncio.TimeoutError) as err:
+                if attempt==self.max_retries:
+                    raise
+                get_metrics().inc("http_retries")
+                self.log.info(f"{type(err).__name__} on {url}, retry")
+            if delay is None:
+                delay=backoff_delay(attempt)
+            await asyncio.sleep(delay)
+
+    async def get_text(self, url:str)->str:
+        async def read_text(response):
+            return await response.text()
+        return await self.request(url, read_text)
+
+    async def get_json(self, url:str, required_key:str="value")->dict:
+        """
+        GET ODATA JSON, retried while the response lacks required_key.
+        """
+        async def read_json(response):
+            try:
+                return await response.json(content_type=None)
+            except ValueError:
+                return {}
+        for attempt in range(self.max_retries+1):
+            json_obj=await self.request(url, read_json)
+            if isinstance(json_obj, dict) and required_key in json_obj:
+                return json_obj
+            if attempt==self.max_retries:
+                break
+            self.log.info(f"No '{required_key}' key on response.json, retry")
+            await asyncio.sleep(backoff_delay(attempt))
+        raise ValueError(f"No '{required_key}' key on response of {url}")
+
+    async def close(self):
+        await self.session.close()
+
+
+class AsyncCorpusEngine():
+    """
+    Runs a DownloadKnessetCorpus on the event loop: '$count' probes
+    of all sources concurrently, next pages listed while documents
+    of the current page are downloaded concurrently.
+    Skip rules, manifest, checkpoints, logs and text extraction are
+    the downloader's, run on 1 bookkeeping thread (the manifest is used
+    from 1 thread at a time), documents are written on worker threads,
+    so disk and extraction don't block requests in flight.
+    """
+
+    def __init__(self, downloader) -> None:
+        self.log=logging.getLogger('default')
+        self.downloader=downloader
+        self.http_client=None
+        self.bookkeeping_executor=None
+
+    def run(self):
+        asyncio.run(self._run())
+
+    async def bookkeeping(self, func, *args):
+        """
+        Await func(*args) of the downloader on the bookkeeping thread.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.bookkeeping_executor, func, *args)
+
+    async def _run(self):
+        dkc=self.downloader
+        self.http_client=AsyncHttpClient()
+        self.bookkeeping_executor=ThreadPoolExecutor(max_workers=1, thread_name_prefix="corpus-bookkeeping")
+        get_metrics().start_exporter()
+        try:
+            if dkc.plan is not None:
+                await self.run_plan()
+                await self.bookkeeping(dkc.close)
+                return
+            counts=await asyncio.gather(*[
+                self.http_client.get_text(build_count_url(source, dkc.get_query_options(source)))
+                for source in config.datasets_sources])
+            for source, count in zip(config.datasets_sources, counts):
+                self.log.info(f"** TOTAL {count} documents on {source} **")
+
+            for source in config.datasets_sources:
+                dkc.mkdir_per_source(source)
+                if not dkc.resume:
+                    await self.bookkeeping(dkc.checkpoint.reset, source)
+                    await self.download_dataset(source, skip_token=None)
+                    continue
+                checkpoint=dkc.checkpoint.get(source)
+                if checkpoint["completed"]:
+                    self.log.info(f"Source {source} already completed")
+                    continue
+                await self.download_dataset(source, skip_token=checkpoint["page_token"],
+                    page_file=checkpoint["page_file"], done_docs=checkpoint["done_docs"])
+            await self.bookkeeping(dkc.close)
+        except Exception as err:
+            self.log.exception(err)
+            self.log.info("End run")
+        finally:
+            await self.http_client.close()
+            self.bookkeeping_executor.shutdown()
+
+    async def run_plan(self):
+        """
+        Crawl work items of downloader's plan in order, as DownloadKnessetCorpus.run_plan,
+        '$count' probes of all items concurrently.
+        """
+        dkc=self.downloader
+        items=dkc.plan.work_items()
+        counts=await asyncio.gather(*[
+            self.http_client.get_text(build_count_url(item["source"], dkc.get_query_options(item["source"], item)))
+            for item in items])
+        for idx, (item, count) in enumerate(zip(items, counts)):
+            await self.bookkeeping(dkc.start_work_item, idx, len(items), item, count)
+            if count.strip()=="0":
+                continue
+            await self.download_dataset(item["source"], skip_token=None)
+        dkc.work_item=None
+
+    async def download_dataset(self, source_name:str, skip_token:str, page_file:str=None, done_docs:list=None):
+        dkc=self.downloader
+        try:
+            await self.bookkeeping(dkc.start_dataset, source_name)
+            rounds=1
+            if page_file is not None and os.path.exists(page_file):
+                # Resumed page is read from disk, as the synchronous engine does
+                self.log.info(f"*** Resuming page {page_file} ***")
+                page=await asyncio.to_thread(read_json, page_file)
+                self.log.info(f"*** ROUND {rounds} ***")
+                rounds+=1
+                errors_list=await self.download_one_page_docs(source_name, page, len(page["value"]),
+                    skip_token, page_file, done_docs)
+                await self.bookkeeping(dkc.page_done, source_name, page, errors_list)
+                skip_token=page.get("odata.nextLink")
+                if not skip_token:
+                    return
+            async for skip_token, page, num_of_docs in self.iter_pages(source_name, skip_token):
+                self.log.info(f"*** ROUND {rounds} ***")
+                rounds+=1
+                errors_list=await self.download_one_page_docs(source_name, page, num_of_docs, skip_token)
+                await self.bookkeeping(dkc.page_done, source_name, page, errors_list)
+        except Exception as err:
+            self.log.exception(err)
+
+    async def iter_pages(self, source_name:str, skip_token:str):
+        """
+        Yield (skip_token, page, num_of_docs) per source page,
+        up to config.prefetch_pages pages are listed ahead.
+        """
+        pages=asyncio.Queue(maxsize=config.prefetch_pages)
+
+        async def list_pages(skip_token):
+            try:
+                while True:
+                    page=await self.get_page(source_name, skip_token)
+                    await pages.put((skip_token, page, len(page["value"])))
+                    skip_token=page.get("odata.nextLink")
+                    if not skip_token:
+                        break
+            except Exception as err:
+                await pages.put(err)
+                return
+            await pages.put(None)
+
+        producer=asyncio.create_task(list_pages(skip_token))
+        try:
+            while True:
+                item=await pages.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            producer.cancel()
+
+    async def get_page(self, source_name:str, skip_token:str)->dict:
+        url=build_page_url(source_name, skip_token, self.downloader.walk_options[source_name])
+        self.log.info(f"*** Download main ODATA {url} ***")
+        with span("list_page"):
+            page=await self.http_client.get_json(url)
+        get_metrics().inc("pages_listed")
+        return apply_client_paging(source_name, skip_token, page, self.downloader.walk_options[source_name])
+
+    async def download_one_page_docs(self, source_name:str, page:dict, num_of_docs:int,
+            skip_token:str, page_file:str=None, done_docs:list=None)->list:
+        dkc=self.downloader
+        entries_to_download, skip_cntr=await self.bookkeeping(dkc.start_page, source_name, page,
+            num_of_docs, skip_token, page_file, done_docs)
+        documents_log_list=[]
+        errors_list=[]
+        downloaded_docs={}
+
+        async def download(idx, entry):
+            self.log.info(f"{idx}/{num_of_docs} Downloading {entry['FilePath']}")
+            try:
+                downloaded=await self.download_doc(source_name, entry)
+            except Exception as err:
+                self.log.exception(err)
+                errors_list.append({"doc":entry, "error":err})
+                file_name=await asyncio.to_thread(dkc.doc_file_name, source_name, entry)
+                await self.bookkeeping(dkc.checkpoint.doc_done, source_name, file_name)
+                return
+            await self.bookkeeping(dkc.doc_downloaded, source_name, entry, downloaded,
+                documents_log_list, downloaded_docs)
+
+        await asyncio.gather(*[download(idx, entry) for idx, entry in entries_to_download])
+        # Texts are extracted while next pages are listed
+        return await self.bookkeeping(dkc.finish_page, source_name, downloaded_docs, documents_log_list,
+            errors_list, skip_cntr)
+
+    async def download_doc(self, source_name:str, entry:dict):
+        """
+        Stream document to '{source}_docs' as DownloadKnessetCorpus.download_doc.
+        Returns (file_name, size, sha256), None if not downloaded,
+        NOT_MODIFIED if document is unchanged since stored.
+        """
+        url=entry["FilePath"]
+        file_name=await asyncio.to_thread(self.downloader.claim_doc_name, source_name, entry)
+
+        async def save_doc(response):
+            if response.status==304:
+                self.log.info(f"{file_name} not modified")
+                get_metrics().inc("docs_not_modified")
+                return NOT_MODIFIED
+            if response.status!=200:
+                self.log.info(f"Failed to download document. Status code: {response.status}")
+                get_metrics().inc("docs_failed")
+                return None
+            sizes=self.downloader.doc_size_limits(file_name, response.headers)
+            if sizes is None:
+                return None
+            writer=await asyncio.to_thread(AtomicStreamWriter,
+                os.path.join(f"{source_name}_docs", file_name), *sizes)
+            try:
+                async for chunk in response.content.iter_chunked(config.download_chunk_size):
+                    await asyncio.to_thread(writer.write, chunk)
+                size, sha256=await asyncio.to_thread(writer.commit)
+            except BaseException:
+                writer.abort()
+                raise
+            await asyncio.to_thread(self.downloader.doc_stored, source_name, file_name, url, size, sha256,
+                response.headers)
+            return file_name, size, sha256
+
+        with span("download_doc"):
+            return await self.http_client.request(url, save_doc,
+                self.downloader.doc_request_headers(source_name, file_name))
+
+
+class AsyncMetadataEngine():
+    """
+    Runs a DownloadMetadataTables on the event loop: '$count' probes
+    and tables are listed concurrently, each table walking its pages.
+    """
+
+    def __init__(self, downloader) -> None:
+        self.log=logging.getLogger('default')
+        self.downloader=downloader
+        self.http_client=None
+
+    def run(self):
+        asyncio.run(self._run())
+
+    async def _run(self):
+        dmt=self.downloader
+        self.http_client=AsyncHttpClient()
+        get_metrics().start_exporter()
+        try:
+            if dmt.all_tables:
+                dmt.key_fields=dmt.resolve_tables()
+                dmt.tables=list(dmt.key_fields)
+            counts=await asyncio.gather(*[
+                self.http_client.get_text(build_count_url(source, dmt.get_query_options(source)))
+                for source in dmt.tables])
+            for source, count in zip(dmt.tables, counts):
+                self.log.info(f"** TOTAL {count} documents on {source} **")
+
+            tables=[]
+            for source in dmt.tables:
+                dmt.mkdir_per_source(source)
+                if not dmt.resume:
+                    dmt.checkpoint.reset(source)
+                    tables.append(self.download_dataset(source, skip_token=None))
+                    continue
+                checkpoint=dmt.checkpoint.get(source)
+                if checkpoint["completed"]:
+                    self.log.info(f"Source {source} already completed")
+                    continue
+                tables.append(self.download_dataset(source, skip_token=checkpoint["page_token"]))
+            await asyncio.gather(*tables)
+            dmt.log_tables_stats()
+        except Exception as err:
+            self.log.exception(err)
+            self.log.info("End run")
+        finally:
+            dmt.checkpoint.close()
+            get_metrics().stop_exporter()
+            await self.http_client.close()
+
+    async def download_dataset(self, source_name:str, skip_token:str):
+        dmt=self.downloader
+        start_time=time.monotonic()
+        dmt.tables_stats[source_name]={"pages":0, "records":0, "seconds":0}
+        try:
+            self.log.info(f"Downloading source {source_name}")
+            await asyncio.to_thread(dmt.start_walk, source_name)
+            while True:
+                url=build_page_url(source_name, skip_token, dmt.walk_options[source_name])
+                self.log.info(f"*** Download main ODATA {url} ***")
+                with span("list_page"):
+                    page=await self.http_client.get_json(url)
+                get_metrics().inc("pages_listed")
+                page=apply_client_paging(source_name, skip_token, page, dmt.walk_options[source_name])
+                # Page is written on a worker thread, other tables go on listing
+                await asyncio.to_thread(dmt.page_done, source_name, page)
+                skip_token=page.get("odata.nextLink")
+                if not skip_token:
+                    break
+        except Exception as err:
+            self.log.exception(err)
+        finally:
+            dmt.tables_stats[source_name]["seconds"]=time.monotonic()-start_time
@@ -0,0 +1,265 @@
+'''
+Script benchmark the downloaders end to end against the local mock
+ODATA server (mock_odata_server.py), which replays pages saved on
+jsons_dir and documents of '{source}_docs' folders, with no network.
+Each run downloads to a new working folder, on a new process, and
+reports docs/sec, pages/sec, bytes/sec, requests latency percentiles
+and peak RSS of the run, per engine and network profile.
+'''
+
+import sys
+import os
+import glob
+import shutil
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import config
+from config import *
+from logger_configurer import configure_logger
+from http_client import get_http_client
+from mock_odata_server import MockOdataServer, PROFILES, FILES_PATH
+
+
+class LatencyRecorder():
+    """
+    Durations of calls per kind ('page', 'doc', 'count'), from all threads.
+    """
+
+    def __init__(self) -> None:
+        self._lock=threading.Lock()
+        self.latencies={}
+
+    def add(self, kind:str, seconds:float):
+        with self._lock:
+            self.latencies.setdefault(kind, []).append(seconds)
+
+    def wrap(self, func, get_kind):
+        """
+        func timed, get_kind(*args, **kwargs) names the call kind, None not to record.
+        """
+        def timed(*args, **kwargs):
+            start=time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                kind=get_kind(*args, **kwargs)
+                if kind is not None:
+                    self.add(kind, time.perf_counter()-start)
+        return timed
+
+    def wrap_async(self, func, get_kind):
+        async def timed(*args, **kwargs):
+            start=time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                kind=get_kind(*args, **kwargs)
+                if kind is not None:
+                    self.add(kind, time.perf_counter()-start)
+        return timed
+
+    def percentiles(self, kind:str):
+        values=self.latencies.get(kind)
+        if not values:
+            return None, None
+        return round(np.percentile(values, 50)*1000, 1), round(np.percentile(values, 99)*1000, 1)
+
+
+def peak_rss_mb(children:bool=False)->float:
+    """
+    Peak RSS of this process, or of its waited for children, in MB.
+    None when not measured on the platform.
+    """
+    try:
+        import resource
+    except ImportError:
+        # Windows, peak of this process by psutil if installed
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return None if children else round(psutil.Process().memory_info().peak_wset/1024**2, 1)
+    usage=resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in bytes on macOS, KB elsewhere
+    return round(usage.ru_maxrss/(1024**2 if sys.platform=="darwin" else 1024), 1)
+
+
+def url_kind(url:str)->str:
+    if FILES_PATH in url:
+        return "doc"
+    if url.endswith("/$count") or "/$count?" in url:
+        return "count"
+    return "page"
+
+
+class CrawlBenchmark():
+    """
+    1 run of a downloader with an engine against a mock server
+    with a network profile.
+    Latencies include retries, and on async engine the wait for
+    a free request slot.
+    """
+
+    def __init__(self, downloader:str="corpus", engine:str="sync", profile_name:str="none",
+            extract:bool=False, seed:int=0, keep_work_dir:bool=False) -> None:
+        self.log=logging.getLogger('default')
+        self.downloader=downloader
+        self.engine=engine
+        self.profile_name=profile_name
+        self.extract=extract
+        self.seed=seed
+        self.keep_work_dir=keep_work_dir
+        self.recorder=LatencyRecorder()
+
+    def run(self)->dict:
+        # Saved pages & documents are read relative to current folder
+        server=MockOdataServer.from_saved_pages(profile=PROFILES[self.profile_name], seed=self.seed)
+        home_dir=os.getcwd()
+        work_dir=tempfile.mkdtemp(prefix="knesset_bench_")
+        saved_config={key:getattr(config, key) for key in ["main_hypelink", "datasets_sources",
+            "meta_data_tables", "extract_texts_on_download"]}
+        try:
+            os.chdir(work_dir)
+            os.makedirs(config.jsons_dir, exist_ok=True)
+            config.main_hypelink=server.odata_url
+            config.datasets_sources=[source for source in config.datasets_sources if source in server.tables]
+            config.meta_data_tables=list(server.tables)
+            config.extract_texts_on_download=self.extract
+            with server:
+                start_time=time.perf_counter()
+                self.run_downloader()
+                elapsed=time.perf_counter()-start_time
+            return self.collect(server, elapsed)
+        finally:
+            os.chdir(home_dir)
+            for key, value in saved_config.items():
+                setattr(config, key, value)
+            if self.keep_work_dir:
+                self.log.info(f"Run files kept on {work_dir}")
+            else:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    def run_downloader(self):
+        if self.engine=="async":
+            from async_odata_engine import AsyncHttpClient
+            original_request=AsyncHttpClient.request
+            AsyncHttpClient.request=self.recorder.wrap_async(original_request,
+                lambda client, url, *args, **kwargs: url_kind(url))
+        else:
+            http_client=get_http_client()
+            original_get=http_client.get
+            # Documents are timed whole by download_doc, not by their headers
+            http_client.get=self.recorder.wrap(original_get,
+                lambda url, stream=False, **kwargs: None if stream else url_kind(url))
+        try:
+            if self.downloader=="corpus":
+                from download_knesset_corpus import DownloadKnessetCorpus
+                instance=DownloadKnessetCorpus()
+                if self.engine=="async":
+                    from async_odata_engine import AsyncCorpusEngine
+                    AsyncCorpusEngine(instance).run()
+                else:
+                    instance.download_doc=self.recorder.wrap(instance.download_doc, lambda *args: "doc")
+                    instance.run()
+            else:
+                from download_knesset_metadata_tables import DownloadMetadataTables
+                instance=DownloadMetadataTables()
+                if self.engine=="async":
+                    from async_odata_engine import AsyncMetadataEngine
+                    AsyncMetadataEngine(instance).run()
+                else:
+                    instance.run()
+        finally:
+            if self.engine=="async":
+                AsyncHttpClient.request=original_request
+            else:
+                http_client.get=original_get
+
+    def collect(self, server:MockOdataServer, elapsed:float)->dict:
+        if self.downloader=="corpus":
+            pages=len(glob.glob(os.path.join(config.jsons_dir, "*.json")))
+        else:
+            pages=len(glob.glob(os.path.join("*_metadata_jsons", "*.json")))
+        doc_files=[path for path in glob.glob("*_docs/*") if not path.endswith(".part")]
+        docs_bytes=sum(os.path.getsize(path) for path in doc_files)
+        page_p50, page_p99=self.recorder.percentiles("page")
+        doc_p50, doc_p99=self.recorder.percentiles("doc")
+        failed_responses=sum(cnt for status, cnt in server.status_counts.items() if status not in (200, 304, 404))
+        # Peaks of the process since it started, see run_isolated
+        return {
+            "downloader":self.downloader,
+            "engine":self.engine,
+            "profile":self.profile_name,
+            "seconds":round(elapsed, 2),
+            "docs":len(doc_files),
+            "pages":pages,
+            "docs/sec":round(len(doc_files)/elapsed, 1),
+            "pages/sec":round(pages/elapsed, 1),
+            "MB/sec":round(docs_bytes/1024**2/elapsed, 2),
+            "page p50 ms":page_p50,
+            "page p99 ms":page_p99,
+            "doc p50 ms":doc_p50,
+            "doc p99 ms":doc_p99,
+            "requests":len(server.requests),
+            "failed responses":failed_responses,
+            "peak RSS MB":peak_rss_mb(),
+            "children peak RSS MB":peak_rss_mb(children=True),
+        }
+
+
+def run_benchmark(benchmark_args:dict, config_values:dict)->dict:
+    """
+    Run a CrawlBenchmark of benchmark_args with config_values set,
+    on the process it's called on.
+    """
+    for key, value in config_values.items():
+        setattr(config, key, value)
+    configure_logger('default')
+    return CrawlBenchmark(**benchmark_args).run()
+
+
+def run_isolated(benchmark_args:dict, config_values:dict)->dict:
+    """
+    Run a CrawlBenchmark on a new process, peak RSS is a cumulative
+    peak of the process, so each run reports its own.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run_benchmark, benchmark_args, config_values).result()
+
+
+if __name__=='__main__':
+    parser=argparse.ArgumentParser(description="Benchmark downloaders against a local mock ODATA server")
+    parser.add_argument("--downloader", choices=["corpus", "metadata"], default="corpus")
+    parser.add_argument("--engine", nargs="+", choices=["sync", "async"], default=["sync"])
+    parser.add_argument("--profile", nargs="+", choices=list(PROFILES), default=["none"])
+    parser.add_argument("--extract", action="store_true", help="Extract texts of downloaded documents")
+    parser.add_argument("--min-interval", type=float, default=0,
+        help="Minimal interval between requests per host, seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of injected failures")
+    parser.add_argument("--output", help="CSV file of results")
+    parser.add_argument("--keep", action="store_true", help="Keep downloaded files of each run")
+    args=parser.parse_args()
+
+    # Downloaders log every document, keep benchmark output readable
+    config_values={"log_level":"WARNING", "min_request_interval_per_host":args.min_interval}
+    for key, value in config_values.items():
+        setattr(config, key, value)
+    log=configure_logger('default')
+
+    results=[]
+    for engine in args.engine:
+        for profile_name in args.profile:
+            results.append(run_isolated({"downloader":args.downloader, "engine":engine,
+                "profile_name":profile_name, "extract":args.extract, "seed":args.seed,
+                "keep_work_dir":args.keep}, config_values))
+            print(f"{engine}/{profile_name} done in {results[-1]['seconds']} seconds")
+    results_df=pd.DataFrame(results)
+    print(results_df.to_markdown(index=False))
+    if args.output:
+        results_df.to_csv(args.output, index=False)
@@ -0,0 +1,110 @@
+'''
+Script benchmark reading MS WORD text boxes per document, on sample
+documents of '{source}_docs' folders: text frame story ranges
+('stories') against the loop over all shapes of the document ('shapes'),
+on the same opened document. Reports per document seconds of each
+way, number of shapes & text boxes, speedup and whether both read the
+same text. Windows only, requires MS WORD and pywin32.
+'''
+
+import os
+import glob
+import time
+import random
+import argparse
+
+import pandas as pd
+
+import config
+from logger_configurer import configure_logger
+from text_extractors import Win32ComTextExtractor, TEXTBOX_EXTRACTIONS
+
+
+class TextboxBenchmark():
+    """
+    Both ways timed on one WORD instance, best of 'repeat' runs,
+    excluding opening the document.
+    """
+
+    def __init__(self, repeat:int=3) -> None:
+        self.repeat=repeat
+        self.extractor=Win32ComTextExtractor()
+        self.extractor.init_word_app()
+
+    def time_extraction(self, doc, textbox_extraction:str):
+        self.extractor.textbox_extraction=textbox_extraction
+        best=None
+        for _ in range(self.repeat):
+            start=time.perf_counter()
+            texts=self.extractor.text_boxes_texts(doc)
+            seconds=time.perf_counter()-start
+            best=seconds if best is None else min(best, seconds)
+        return texts, best
+
+    def run_doc(self, doc_path:str)->dict:
+        doc=self.extractor.open_word_doc(doc_path)
+        try:
+            result={"doc":os.path.basename(doc_path), "shapes_cnt":doc.Shapes.Count}
+            texts={}
+            for textbox_extraction in TEXTBOX_EXTRACTIONS:
+                texts[textbox_extraction], result[f"{textbox_extraction}_seconds"]= \
+                    self.time_extraction(doc, textbox_extraction)
+        finally:
+            doc.Close(False)
+        result["text_boxes_cnt"]=len([text for text in texts["shapes"] if text.strip()])
+        result["speedup"]=round(result["shapes_seconds"]/result["stories_seconds"], 2) \
+            if result["stories_seconds"] else None
+        # Texts compared as extracted, empty text boxes left out
+        result["same_text"]=[text for text in texts["stories"] if text.strip()]== \
+            [text for text in texts["shapes"] if text.strip()]
+        return result
+
+    def close(self):
+        self.extractor.close()
+
+
+def sample_docs(sources:list, sample:int, seed:int)->list:
+    docs=[]
+    for docs_dir in sorted(glob.glob("KNS_*_docs")):
+        if sources and docs_dir[:-len("_docs")] not in sources:
+            continue
+        docs_paths=sorted(path for path in glob.glob(os.path.join(docs_dir, "*"))
+            if path.rsplit(".", 1)[-1].lower() in ["doc", "docx"])
+        if sample and len(docs_paths)>sample:
+            docs_paths=sorted(random.Random(seed).sample(docs_paths, sample))
+        docs.extend(docs_paths)
+    return docs
+
+
+if __name__=='__main__':
+    parser=argparse.ArgumentParser(description="Benchmark MS WORD text boxes extraction per document")
+    parser.add_argument("--sources", nargs="+", choices=config.datasets_sources,
+        help="Sources of sample documents, all 'KNS_*_docs' folders by default")
+    parser.add_argument("--sample", type=int, default=20, help="Documents per source, 0 for all")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per document & way, best is reported")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of documents sample")
+    parser.add_argument("--output", help="CSV file of results")
+    args=parser.parse_args()
+
+    log=configure_logger('default')
+    if os.name!='nt':
+        parser.error("MS WORD text boxes extraction runs on Windows only")
+
+    benchmark=TextboxBenchmark(args.repeat)
+    results=[]
+    try:
+        for doc_path in sample_docs(args.sources, args.sample, args.seed):
+            try:
+                results.append(benchmark.run_doc(doc_path))
+            except Exception as err:
+                log.error(f"Failed benchmark of {doc_path}: {err}")
+    finally:
+        benchmark.close()
+    results_df=pd.DataFrame(results)
+    print(results_df.to_markdown(index=False))
+    if len(results_df)>0:
+        print(f"Total seconds, shapes: {results_df['shapes_seconds'].sum():.2f}, "
+            f"stories: {results_df['stories_seconds'].sum():.2f}, "
+            f"documents with different text: {(~results_df['same_text']).sum()}")
+    if args.output:
+        results_df.to_csv(args.output, index=False)
@@ -0,0 +1,171 @@
+'''
+Content addressed store of downloaded documents, with an index of
+document names to content hash and of blobs to their extracted text.
+Documents of identical content are stored and extracted once,
+'{source}_docs' files are hard links to their blob.
+'''
+import os
+import shutil
+import logging
+import sqlite3
+import datetime
+import threading
+
+import config
+from crawl_metrics import get_metrics
+from text_extractors import read_extracted_text
+
+
+# Extracted text status of a blob
+TEXT_EXTRACTED="extracted"
+TEXT_EMPTY="no_text"
+# Download result of a document unchanged since stored (HTTP 304)
+NOT_MODIFIED="not_modified"
+
+
+class BlobStore():
+    """
+    Blobs are stored as '{store_dir}/{sha256[:2]}/{sha256}'. SQLite index
+    holds per (source, document name) its URL, hash and validators
+    (ETag, Last-Modified) for conditional requests, and per blob the
+    document its text was saved for, so text isn't stored twice.
+    Thread safe.
+    """
+
+    def __init__(self, store_dir:str=None, index_path:str=None) -> None:
+        self.log=logging.getLogger('default')
+        self.store_dir=store_dir if store_dir is not None else config.blob_store_dir
+        index_path=index_path if index_path is not None else config.blob_store_index
+        os.makedirs(self.store_dir, exist_ok=True)
+        self._lock=threading.Lock()
+        self.conn=sqlite3.connect(index_path, check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS names (
+            source TEXT NOT NULL,
+            doc_name TEXT NOT NULL,
+            url TEXT,
+            sha256 TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (source, doc_name))""")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS blobs (
+            sha256 TEXT PRIMARY KEY,
+            size INTEGER,
+            text_status TEXT,
+            text_source TEXT,
+            text_doc_name TEXT,
+            created_at TEXT NOT NULL)""")
+        # Index created before texts were referenced
+        columns=[row[1] for row in self.conn.execute("PRAGMA table_info(blobs)")]
+        for column in ["text_source", "text_doc_name"]:
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE blobs ADD COLUMN {column} TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS names_sha256 ON names (sha256)")
+        self.conn.commit()
+
+    def blob_path(self, sha256:str)->str:
+        return os.path.join(self.store_dir, sha256[:2], sha256)
+
+    def get_hash(self, source_name:str, doc_name:str)->str:
+        with self._lock:
+            row=self.conn.execute("SELECT sha256 FROM names WHERE source=? AND doc_name=?",
+                (source_name, doc_name)).fetchone()
+        return row[0] if row else None
+
+    def get_url(self, source_name:str, doc_name:str)->str:
+        with self._lock:
+            row=self.conn.execute("SELECT url FROM names WHERE source=? AND doc_name=?",
+                (source_name, doc_name)).fetchone()
+        return row[0] if row else None
+
+    def conditional_headers(self, source_name:str, doc_name:str)->dict:
+        """
+        'If-None-Match' & 'If-Modified-Since' headers of document's
+        stored version, empty if document or its file is missing.
+        """
+        with self._lock:
+            row=self.conn.execute("SELECT etag, last_modified FROM names WHERE source=? AND doc_name=?",
+                (source_name, doc_name)).fetchone()
+        if row is None or not os.path.exists(os.path.join(f"{source_name}_docs", doc_name)):
+            return {}
+        headers={}
+        if row[0]:
+            headers["If-None-Match"]=row[0]
+        if row[1]:
+            headers["If-Modified-Since"]=row[1]
+        return headers
+
+    def add_doc(self, source_name:str, doc_name:str, doc_path:str, sha256:str, size:int,
+            url:str=None, etag:str=None, last_modified:str=None)->bool:
+        """
+        Store document downloaded to doc_path by its hash, doc_path is
+        replaced by a link to the blob.
+        Returns True if identical content was already stored.
+        """
+        blob_path=self.blob_path(sha256)
+        now=datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            exists=os.path.exists(blob_path)
+            if not exists:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                self.link(doc_path, blob_path)
+                self.conn.execute("INSERT OR IGNORE INTO blobs (sha256, size, created_at) VALUES (?, ?, ?)",
+                    (sha256, size, now))
+            self.conn.execute("""INSERT INTO names
+                (source, doc_name, url, sha256, etag, last_modified, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (source, doc_name) DO UPDATE SET
+                    url=excluded.url, sha256=excluded.sha256, etag=excluded.etag,
+                    last_modified=excluded.last_modified, updated_at=excluded.updated_at""",
+                (source_name, doc_name, url, sha256, etag, last_modified, now))
+            self.conn.commit()
+        if exists:
+            # Identical content is kept once, document file becomes a link to it
+            tmp_path=f"{doc_path}.link"
+            self.link(blob_path, tmp_path)
+            os.replace(tmp_path, doc_path)
+            get_metrics().inc("docs_deduplicated")
+        return exists
+
+    def link(self, src:str, dst:str):
+        try:
+            os.link(src, dst)
+        except OSError:
+            # File system without hard links
+            shutil.copyfile(src, dst)
+
+    def get_text(self, sha256:str):
+        """
+        (text_status, text) of blob extracted before, read from the text
+        saved for its document, (None, None) if not extracted or the
+        text is gone.
+        """
+        with self._lock:
+            row=self.conn.execute("SELECT text_status, text_source, text_doc_name FROM blobs WHERE sha256=?",
+                (sha256,)).fetchone()
+        if row is None or row[0] is None:
+            return None, None
+        if row[0]==TEXT_EMPTY:
+            return TEXT_EMPTY, ""
+        if row[1] is None:
+            return None, None
+        output_text=read_extracted_text(row[1], row[2])
+        if output_text is None:
+            return None, None
+        return TEXT_EXTRACTED, output_text
+
+    def save_text(self, sha256:str, output_text:str, source_name:str, doc_name:str):
+        """
+        Refer blob to its text, saved for doc_name of source, for
+        documents of identical content.
+        """
+        text_status=TEXT_EXTRACTED if len(output_text.strip())>0 else TEXT_EMPTY
+        with self._lock:
+            self.conn.execute("UPDATE blobs SET text_status=?, text_source=?, text_doc_name=? WHERE sha256=?",
+                (text_status, source_name, doc_name, sha256))
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.commit()
+            self.conn.close()
@@ -6,7 +6,6 @@ import datetime
 import requests
 import pandas as pd
 import time
-from pywintypes import com_error
 import tabulate
 import logging
 import json
@@ -45,7 +44,9 @@ datasets_sources=[bills, plenum_session_ref, committees_sessions]
 
 plenum_session="KNS_PlenumSession"
 knesset_committies="KNS_Committee"
-meta_data_tables=[plenum_session, knesset_committies ]
+committee_session="KNS_CommitteeSession"
+knesset_bills="KNS_Bill"
+meta_data_tables=[plenum_session, knesset_committies, committee_session, knesset_bills]
 
 
 odata_download_format="format=json"
@@ -57,4 +58,184 @@ corrupted_docs_log="corrupted_docs_log.csv"
 
 false_words=['\n', '\r']
 
-jsons_dir="odata_jsons"
\ No newline at end of file
+jsons_dir="odata_jsons"
+
+# Concurrent documents download
+# Number of threads downloading documents of one ODATA page.
+download_workers=8
+# Politeness limits per host (e.g. fs.knesset.gov.il)
+max_connections_per_host=4
+# Minimal seconds between 2 requests to the same host
+min_request_interval_per_host=0.1
+
+# Number of ODATA pages listed ahead of pages being processed
+prefetch_pages=3
+
+# Text extraction
+# Backend: "win32com" (MS WORD, Windows only), "win32com_pool" (pool of
+# MS WORD worker processes, Windows only), "python" (.docx XML &
+# LibreOffice for .doc) or "auto" - win32com on Windows, python elsewhere.
+text_extractor_backend="auto"
+# MS WORD text boxes (OCR'd legacy documents) on win32com backends: "shapes" checks
+# every shape of the document, "stories" reads text frame story ranges, faster but
+# includes callouts text too - opt-in until benchmark_textbox_extraction.py shows
+# same_text on the corpus
+textbox_extraction="shapes"
+# Number of processes extracting texts (python backend)
+extraction_workers=_os.cpu_count()
+# Seconds per document before extraction is failed
+extraction_timeout=120
+# LibreOffice executable, used for legacy .doc on python backend
+libreoffice_path="soffice"
+# Extract texts right after download, otherwise run extract_knesset_texts.py
+extract_texts_on_download=True
+# Documents submitted together to extraction workers by extract_knesset_texts.py
+extraction_batch_size=200
+# MS WORD worker processes of win32com_pool backend, each runs its own WORD
+word_pool_workers=max(1, min(4, _os.cpu_count() or 1))
+# Documents extracted by a MS WORD worker before it's restarted
+word_worker_recycle_after=200
+
+# SQLite index of downloaded, extracted & corrupted documents
+docs_manifest="docs_manifest.sqlite"
+
+# Append only logs (JSONL), export_record_logs.py exports them
+# to the CSV logs: corrupted_docs_log, errors_log and
+# '{source}_docs_download_log.txt'
+corrupted_docs_record_log="corrupted_docs_log.jsonl"
+errors_record_log="errors_list.jsonl"
+errors_log="errors_list.csv"
+# Number of appended records between fsync of a log
+record_log_fsync_every=50
+
+# Incremental sync: latest value of delta_sync_field per source,
+# runs with '--incremental' query records updated since.
+sync_state_file="sync_state.json"
+delta_sync_field="LastUpdatedDate"
+
+# Crawl position per source, used by '--resume'
+corpus_checkpoint_file="corpus_checkpoint.json"
+metadata_checkpoint_file="metadata_checkpoint.json"
+
+# HTTP client, shared by ODATA and documents requests
+# (connect, read) timeouts in seconds
+http_timeout=(10, 120)
+# Retries on connection errors, timeouts, 429 & 5xx responses
+http_max_retries=5
+# Exponential backoff: random delay up to base*2^attempt seconds, capped by max
+http_backoff_base=1
+http_backoff_max=60
+# Keep-alive connections pool
+http_pool_connections=10
+http_pool_maxsize=download_workers*2
+
+# Documents download
+# Bytes read per chunk while streaming a document to disk
+download_chunk_size=1024*1024
+# Maximal document size in bytes, None for no limit,
+# per lower case format, max_doc_size for other formats
+max_doc_size=None
+max_doc_size_per_format={"doc": 200*1024**2, "docx": 200*1024**2}
+
+# ODATA listing
+# Fields requested per source ($select), sources not listed get all fields.
+odata_select_fields={
+    bills: ["DocumentBillID", "BillID", "GroupTypeID", "GroupTypeDesc", "ApplicationDesc", "FilePath",
+        "LastUpdatedDate"],
+    plenum_session_ref: ["DocumentPlenumSessionID", "PlenumSessionID", "GroupTypeID", "GroupTypeDesc",
+        "ApplicationDesc", "FilePath", "LastUpdatedDate"],
+    committees_sessions: ["DocumentCommitteeSessionID", "CommitteeSessionID", "GroupTypeID", "GroupTypeDesc",
+        "ApplicationDesc", "FilePath", "LastUpdatedDate"],
+}
+# List only documents of ms_words_suffix formats ($filter on FilePath),
+# saved pages then hold MS WORD documents only. Off keeps pages (and
+# CountFilesNContent summaries) of all documents.
+odata_filter_ms_words=False
+# Records per page requested by $top, paging by $skip. Server may return
+# less records per page, paging continues from the records returned.
+# None for server paging by '$skiptoken' (100 records per page).
+odata_page_size=None
+# Key per source, orders pages of $skip paging
+odata_key_fields={
+    bills: "DocumentBillID",
+    plenum_session_ref: "DocumentPlenumSessionID",
+    committees_sessions: "DocumentCommitteeSessionID",
+    plenum_session: "PlenumSessionID",
+    knesset_committies: "CommitteeID",
+    committee_session: "CommitteeSessionID",
+    knesset_bills: "BillID",
+}
+
+# ODATA listing pages are saved as 'json' files (jsons_dir and
+# '{source}_metadata_jsons') and/or appended to 'parquet' store,
+# partitioned per source (requires pyarrow). Resume reads back
+# 'json' pages only.
+odata_pages_sink=["json"]
+odata_pages_store_dir="odata_parquet"
+
+# Extracted texts statistics (CountFilesNContent)
+# Words per file cached by file size & modification time
+text_stats_cache_file="text_stats_cache.json"
+text_stats_workers=_os.cpu_count()
+# Bytes read per chunk while counting words of a file
+text_stats_chunk_size=1024*1024
+
+# Downloaders engine: 'sync' (threads) or 'async' (asyncio, requires aiohttp)
+download_engine="sync"
+# Async engine: bound of in-flight requests on all hosts
+async_max_concurrency=32
+
+# Metadata tables
+# Tables downloaded in parallel, 1 worker per table
+metadata_table_workers=8
+# Tables discovered on ODATA '$metadata' ('--all-tables'), cached
+odata_tables_registry_file="odata_tables.json"
+# Discovered tables to download, regular expression on table name
+metadata_tables_pattern=r"^KNS_"
+
+# Crawl metrics: stages timing histograms & counters, exported every
+# metrics_export_interval seconds and at the end of a run
+metrics_json_file="crawl_metrics.json"
+metrics_prometheus_file="crawl_metrics.prom"
+metrics_export_interval=30
+
+# Content addressed store of downloaded documents, index of document
+# names to content hash and of blobs to their extracted text. Identical
+# documents are stored and extracted once, '{source}_docs' files link
+# to their blob, a document named as another one of its source, from
+# another URL, is stored as '{name}_{id}.{suffix}' by its ODATA key.
+use_blob_store=True
+blob_store_dir="blobs"
+blob_store_index="blob_index.sqlite"
+# Downloaded documents are requested again on crawl, conditionally
+# (If-None-Match/If-Modified-Since), unchanged ones are skipped.
+# Requires use_blob_store
+revalidate_downloaded=False
+
+# Extracted texts are saved as 'txt' files ('{source}_extracted_texts')
+# and/or appended to compressed 'shards' (text_shard_store.py)
+extracted_texts_output=["txt"]
+text_shards_dir="extracted_texts_shards"
+# 'gzip', or 'zstd' (requires zstandard)
+text_shards_codec="gzip"
+# Compressed bytes per shard file
+text_shard_max_size=256*1024**2
+# Appended texts per index commit, shards are fsync'ed before it
+text_shards_commit_every=100
+
+# Full text search index of extracted texts (SQLite FTS5), built by
+# text_search_index.py
+text_search_index_file="texts_search.sqlite"
+# Texts are indexed as extracted, with their ODATA records metadata
+text_search_index_on_extract=False
+# Indexed texts per commit
+text_search_commit_every=100
+
+# Local catalog of downloaded records (knesset_catalog.py), documents
+# joined to sessions, committees and Knesset number
+knesset_catalog_file="knesset_catalog.sqlite"
+
+# Selective crawl (crawl_planner.py): field of date range filter, may
+# be a navigation path like 'KNS_PlenumSession/StartDate'
+crawl_date_field="LastUpdatedDate"
+planned_crawl_checkpoint_file="planned_crawl_checkpoint.json"
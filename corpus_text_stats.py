@@ -0,0 +1,162 @@
+'''
+Words & volume statistics of extracted texts, counted on a process
+pool reading files in fixed size chunks, texts stored only on text
+shards are counted as read from the shards. Results per file are cached
+by file size and modification time (text store time for shards),
+reruns count new or changed texts only.
+'''
+import os
+import json
+import codecs
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import config
+from file_utils import atomic_write_json
+from knesset_numbers import DOC_NAME_KNESSET
+from text_shard_store import TextShardStore
+
+
+def count_words_in_file(file_path:str, chunk_size:int)->int:
+    """
+    Number of whitespace separated words of a UTF-8 text file,
+    as str.split() of its whole text, reading chunk_size bytes at a time.
+    """
+    decoder=codecs.getincrementaldecoder("utf-8")(errors="replace")
+    words=0
+    # Whether last chunk ended inside a word
+    in_word=False
+    with open(file_path, "rb") as _fin:
+        while True:
+            chunk=_fin.read(chunk_size)
+            text=decoder.decode(chunk, final=not chunk)
+            if text:
+                words+=len(text.split())
+                # Word split by chunks boundary was counted twice
+                if in_word and not text[0].isspace():
+                    words-=1
+                in_word=not text[-1].isspace()
+            if not chunk:
+                break
+    return words
+
+
+def count_words_in_files(file_paths:list, chunk_size:int)->list:
+    """
+    Process pool task, words per file of a shard.
+    """
+    return [count_words_in_file(file_path, chunk_size) for file_path in file_paths]
+
+
+class CorpusTextStats():
+    """
+    Per file words & bytes of '{source}_extracted_texts' folders and
+    text shards, with the Knesset number and document format of each file.
+    """
+
+    def __init__(self, workers:int=None, chunk_size:int=None, cache_file:str=None) -> None:
+        self.log=logging.getLogger('default')
+        self.workers=workers if workers is not None else config.text_stats_workers
+        self.chunk_size=chunk_size if chunk_size is not None else config.text_stats_chunk_size
+        self.cache_file=cache_file if cache_file is not None else config.text_stats_cache_file
+        # '{source}/{file}' to [size, mtime_ns, words]
+        self.cache={}
+        if os.path.exists(self.cache_file):
+            with open(self.cache_file, "r", encoding="utf-8") as _fin:
+                self.cache=json.load(_fin)
+
+    def files_stats(self, sources:list)->pd.DataFrame:
+        """
+        DF of source, file, knesset_num, file_format, words, size per text file.
+        """
+        rows=[]
+        to_count=[]
+        shard_store=TextShardStore() if os.path.exists(os.path.join(config.text_shards_dir, "index.sqlite")) \
+            else None
+        for source in sources:
+            _dir=f"{source}_extracted_texts"
+            file_names=set()
+            if os.path.exists(_dir):
+                with os.scandir(_dir) as entries:
+                    for entry in entries:
+                        if not entry.is_file():
+                            continue
+                        file_names.add(entry.name)
+                        stat=entry.stat()
+                        key=f"{source}/{entry.name}"
+                        cached=self.cache.get(key)
+                        row={"source":source, "file":entry.name, "size":stat.st_size, "words":None}
+                        if cached is not None and cached[:2]==[stat.st_size, stat.st_mtime_ns]:
+                            row["words"]=cached[2]
+                        else:
+                            to_count.append((row, entry.path, stat.st_mtime_ns))
+                        rows.append(row)
+            elif shard_store is None:
+                self.log.info(f"No extracted texts folder for {source}")
+            if shard_store is not None:
+                rows.extend(self.shard_texts_stats(shard_store, source, file_names))
+        if shard_store is not None:
+            shard_store.close()
+        self.log.info(f"{len(rows)} text files, {len(to_count)} to count")
+        self.count(to_count)
+
+        # Files removed since last run are dropped from cache
+        self.cache={f"{row['source']}/{row['file']}":self.cache[f"{row['source']}/{row['file']}"]
+            for row in rows}
+        atomic_write_json(self.cache_file, self.cache, indent=None)
+
+        stats_df=pd.DataFrame(rows, columns=["source", "file", "size", "words"])
+        doc_names=stats_df["file"].str.replace(r"\.txt$", "", regex=True)
+        knesset_num=pd.to_numeric(doc_names.str.extract(DOC_NAME_KNESSET, expand=False))
+        stats_df["knesset_num"]=knesset_num.where(knesset_num<50).fillna(-1).astype(int)
+        stats_df["file_format"]=doc_names.str.rsplit(".", n=1).str[-1].str.lower()
+        return stats_df
+
+    def shard_texts_stats(self, shard_store:TextShardStore, source:str, file_names:set)->list:
+        """
+        Rows of texts of source stored only on text shards, not in
+        file_names of its folder, new or changed texts are counted as
+        read sequentially from the shards.
+        """
+        rows=[]
+        # Document name to time its text was stored, of texts to count
+        to_count={}
+        for doc_name, updated_at in shard_store.text_mtimes(source).items():
+            file_name=f"{doc_name}.txt"
+            if file_name in file_names:
+                continue
+            cached=self.cache.get(f"{source}/{file_name}")
+            if cached is not None and cached[1]==updated_at:
+                rows.append({"source":source, "file":file_name, "size":cached[0], "words":cached[2]})
+            else:
+                to_count[doc_name]=updated_at
+        if len(to_count)>0:
+            self.log.info(f"{len(to_count)} texts of {source} to count on text shards")
+            for _, doc_name, text in shard_store.iter_texts([source], doc_names=set(to_count)):
+                row={"source":source, "file":f"{doc_name}.txt", "size":len(text.encode("utf-8")),
+                    "words":len(text.split())}
+                self.cache[f"{source}/{row['file']}"]=[row["size"], to_count[doc_name], row["words"]]
+                rows.append(row)
+        return rows
+
+    def count(self, to_count:list):
+        """
+        Count words of (row, file_path, mtime_ns) items, files are
+        sharded between workers by size.
+        """
+        if len(to_count)==0:
+            return
+        # Largest files first, each shard gets the next file to even the load
+        to_count=sorted(to_count, key=lambda item: -item[0]["size"])
+        shards_cnt=min(len(to_count), self.workers*4)
+        shards=[to_count[idx::shards_cnt] for idx in range(shards_cnt)]
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures=[executor.submit(count_words_in_files, [item[1] for item in shard], self.chunk_size)
+                for shard in shards]
+            for shard_idx, (shard, future) in enumerate(zip(shards, futures)):
+                for (row, file_path, mtime_ns), words in zip(shard, future.result()):
+                    row["words"]=words
+                    self.cache[f"{row['source']}/{row['file']}"]=[row["size"], mtime_ns, words]
+                self.log.info(f"{shard_idx+1}/{len(shards)} shards counted")
@@ -7,6 +7,10 @@ import os
 import config
 from config import *
 from logger_configurer import configure_logger
+from odata_page_store import OdataPageStore
+from corpus_text_stats import CorpusTextStats
+from knesset_catalog import KnessetCatalog
+from knesset_numbers import knesset_num_of, FILE_PATH_KNESSET
 
 
 class CountFilesNContent():
@@ -19,12 +23,7 @@ class CountFilesNContent():
         self.count_words_file_by_source()
 
     def count_files_per_knesset(self):
-        jsons_dfs, urls_list=self.json_to_dfs()
-        for idx, json_df in enumerate(jsons_dfs):
-            jsons_dfs[idx]=self.add_metadata_to_json_df(json_df, urls_list[idx])
-            if idx%500==0:
-                self.log.info(f"{idx} metadata added to DFs")
-        full_df=pd.concat(jsons_dfs)
+        full_df=self.add_metadata_to_df(self.pages_to_df())
         self.log.info(f"{len(full_df)} records on all sources")
         full_df.drop_duplicates(keep='first', inplace=True)
         self.log.info(f"{len(full_df)} records after drop duplicates")
@@ -41,6 +40,22 @@ class CountFilesNContent():
             source_df.to_csv(_file)
 
         return
+
+    def pages_to_df(self)->pd.DataFrame:
+        """
+        Records of all listed pages in 1 DF, with their source.
+        """
+        if "parquet" in config.odata_pages_sink:
+            store_df=OdataPageStore().read(sources=config.datasets_sources, columns=["FilePath"])
+            self.log.info(f"{len(store_df)} records in ODATA pages store")
+            return store_df
+        jsons_dfs, urls_list=self.json_to_dfs()
+        for idx, json_df in enumerate(jsons_dfs):
+            # Projected pages metadata is like "...$metadata#KNS_DocumentBill&$select=..."
+            jsons_dfs[idx]=json_df.assign(source=urls_list[idx].split("$metadata#")[1].split("&")[0])
+        if len(jsons_dfs)==0:
+            return pd.DataFrame(columns=["FilePath", "source"])
+        return pd.concat(jsons_dfs, ignore_index=True)
     
     def json_to_dfs(self):
         files=os.listdir(config.jsons_dir)
@@ -54,7 +69,7 @@ class CountFilesNContent():
                 json_dict=json.load(read_file)
             _url=json_dict["odata.metadata"]
             _value=json_dict["value"]
-            _next_link=json_dict["odata.nextLink"]
+            _next_link=json_dict.get("odata.nextLink")
             _df=pd.DataFrame(_value)
             jsons_dfs.append(_df)
             urls_list.append(_url)
@@ -62,44 +77,28 @@ class CountFilesNContent():
                 self.log.info(f"{idx} json files processed")
         return jsons_dfs, urls_list
 
-    def add_metadata_to_json_df(self, _df:pd.DataFrame, url:str):        
-        try:
-            # Not all records contains Knesset number, some records are like:
-            # https://fs.knesset.gov.il///FILER/E_SHARE/WMA_POOL/14/2013_04_29/2013_04_29_15_59_50_18_56_51_19.wmv
-            knesseet_num=-1
-            for row_index, row in _df.iterrows():
-                if "https://fs.knesset.gov.il//" in row["FilePath"]:
-                    candidate= row["FilePath"].split(
-                        "https://fs.knesset.gov.il//")[1].split("/")[0] 
-                    try:
-                        candidate=int(candidate)
-                        if candidate<50:
-                            knesseet_num=candidate
-                            break
-                    except Exception as err:
-                        continue
-
-            _df["source"]=url.split("$metadata#")[1]
-            _df["knesset_num"]=knesseet_num
-            
-            # _df.apply(lambda x:
-            #     x["FilePath"].split("https://fs.knesset.gov.il//")[1].split("/")[0] \
-            #         if "https://fs.knesset.gov.il//" in x["FilePath"] else default_knesset, axis=1)
-            _df["file_format"]=_df.apply(lambda x: self.get_file_format(x),axis=1)
-            
-            return _df
-
-        except Exception as err:
-            self.log.exception(err)
-            return _df
-
-    def get_file_format(self, row:pd.Series):
-        file_extension=row["FilePath"].split(".")[-1].lower()
-        if "aspx" in file_extension:
-            file_extension="aspx"
-        return file_extension
-
-
+    def add_metadata_to_df(self, _df:pd.DataFrame):
+        """
+        Knesset number and file format of each record, from its FilePath.
+        Knesset number of records joined to their session on the local
+        catalog (knesset_catalog.py) is taken from the catalog.
+        """
+        file_paths=_df["FilePath"].fillna("").astype(str)
+        # Not all records contains Knesset number, some records are like:
+        # https://fs.knesset.gov.il///FILER/E_SHARE/WMA_POOL/14/2013_04_29/2013_04_29_15_59_50_18_56_51_19.wmv
+        knesset_num=pd.to_numeric(file_paths.map(lambda file_path: knesset_num_of(FILE_PATH_KNESSET, file_path)))
+        if os.path.exists(config.knesset_catalog_file):
+            catalog=KnessetCatalog()
+            catalog_df=catalog.query("SELECT source, file_path AS FilePath, knesset_num FROM documents "
+                "WHERE knesset_num IS NOT NULL").drop_duplicates(["source", "FilePath"])
+            catalog.close()
+            catalog_num=_df[["source", "FilePath"]].merge(catalog_df, how="left", on=["source", "FilePath"])
+            knesset_num=pd.Series(catalog_num["knesset_num"].values, index=_df.index).fillna(knesset_num)
+        _df["knesset_num"]=knesset_num.fillna(-1).astype(int)
+
+        file_format=file_paths.str.rsplit(".", n=1).str[-1].str.lower()
+        _df["file_format"]=file_format.where(~file_format.str.contains("aspx", regex=False), "aspx")
+        return _df
 
     def count_source_per_knesset(self, jsons_df:pd.DataFrame, source:str):
         source_records=jsons_df.loc[jsons_df["source"]==source]
@@ -115,39 +114,26 @@ class CountFilesNContent():
     def count_words_file_by_source(self):
         """
         Count number of files, words and disk volume 
-        downloaded from Knesset ODATA
+        downloaded from Knesset ODATA, in total and per Knesset
+        and document format of each source.
         """
-        _rslts=[]
-        for idx, source in enumerate(config.datasets_sources):
-            source_text=[]
-            source_total_size=0
-            number_of_words=0
-            _dir=f"{source}_extracted_texts"
-            files=os.listdir(_dir)
-            log.info(f"Number of files in {source}: {len(files)}")
-            for idx2, _file in enumerate(files):
-                file_path=os.path.join(f"{source}_extracted_texts", _file)
-                with open(file_path, "r", encoding="utf-8") as file_open:
-                    file_text=file_open.read()
-                    number_of_words=number_of_words+len(file_text.split())
-                source_total_size+=os.path.getsize(file_path)/1024**2
-                if idx2%5000==0:
-                    log.info("End counting {} files, {} MB, {} words".
-                            format(idx2, round(source_total_size,0 ), number_of_words))
-                continue
-
-            _dict={
-                "source":source,
-                "number of files": len(files),
-                "volume (MB)": round(source_total_size, 0),
-                "number of words": number_of_words
-            }
-    
-            _rslts.append(_dict)
-    
-            continue
-        rslts_df=pd.DataFrame(_rslts)
+        stats_df=CorpusTextStats().files_stats(config.datasets_sources)
+        stats_df["volume (MB)"]=stats_df["size"]/1024**2
+
+        rslts_df=self.summarize_text_stats(stats_df, ["source"])
         log.info(f"\n{rslts_df.to_markdown()}")
+        for breakdown in ["knesset_num", "file_format"]:
+            breakdown_df=self.summarize_text_stats(stats_df, ["source", breakdown])
+            log.info(f"\n{breakdown_df.to_markdown()}")
+            breakdown_df.to_csv(f"texts_summary_per_{breakdown}.csv", index=False)
+
+    def summarize_text_stats(self, stats_df:pd.DataFrame, group_by:list)->pd.DataFrame:
+        summary_df=stats_df.groupby(group_by).agg(**{
+            "number of files": ("file", "size"),
+            "volume (MB)": ("volume (MB)", "sum"),
+            "number of words": ("words", "sum")}).reset_index()
+        summary_df["volume (MB)"]=summary_df["volume (MB)"].round(0)
+        return summary_df
 
 
 
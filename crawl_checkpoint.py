@@ -0,0 +1,134 @@
+'''
+Durable position of a crawl per source, for resuming a stopped crawl.
+'''
+import os
+import json
+import logging
+import threading
+
+from file_utils import atomic_write_json
+
+
+class CrawlCheckpoint():
+    """
+    Per source: query options of the walk over source's pages, token
+    ('odata.nextLink') of the page in progress, the page JSON saved to
+    disk and documents of the page already handled.
+    State is rewritten on page boundaries, documents handled within a
+    page are appended to a JSONL log aside ('{checkpoint_file}.docs.jsonl'),
+    so a restarted crawl continues from the saved page and document
+    without listing the page again.
+    Sources may be crawled by different threads.
+    """
+
+    def __init__(self, checkpoint_file:str) -> None:
+        self.log=logging.getLogger('default')
+        self.checkpoint_file=checkpoint_file
+        self.docs_log_file=f"{checkpoint_file}.docs.jsonl"
+        self.state={}
+        self._lock=threading.RLock()
+        if os.path.exists(checkpoint_file):
+            with open(checkpoint_file, "r", encoding="utf-8") as _fin:
+                self.state=json.load(_fin)
+        self.load_docs_log()
+        # Opened on first document logged
+        self._docs_log=None
+
+    def load_docs_log(self):
+        """
+        Add documents logged since state was saved to their pages.
+        """
+        if not os.path.exists(self.docs_log_file):
+            return
+        with open(self.docs_log_file, "r", encoding="utf-8") as _fin:
+            for line in _fin:
+                try:
+                    record=json.loads(line)
+                except ValueError:
+                    # Last line of a stopped run may be partial
+                    continue
+                checkpoint=self.state.get(record["source"])
+                # Records of pages done before state was saved are dropped
+                if checkpoint is not None and checkpoint["page_file"]==record["page_file"] \
+                        and checkpoint["page_file"] is not None:
+                    checkpoint["done_docs"].append(record["doc"])
+
+    def get(self, source_name:str)->dict:
+        """
+        Source's checkpoint, keys:
+        * page_token: token of page in progress, None for first page.
+        * page_file: page JSON on disk, None if page wasn't fetched yet.
+        * done_docs: documents of page already handled.
+        * completed: all pages of source were handled.
+        * query_options: options all pages of the walk are listed with,
+            None before walk started.
+        * high_water_mark: latest update time of records walked so far.
+        """
+        return self.state.get(source_name, {"page_token":None, "page_file":None,
+            "done_docs":[], "completed":False, "query_options":None, "high_water_mark":None})
+
+    def _walk(self, source_name:str)->dict:
+        checkpoint=self.get(source_name)
+        return {"query_options":checkpoint.get("query_options"),
+            "high_water_mark":checkpoint.get("high_water_mark")}
+
+    def start_walk(self, source_name:str, query_options:dict):
+        """
+        Keep query options of source's walk, '$skip' offsets of
+        its page tokens are relative to them.
+        """
+        with self._lock:
+            self.state[source_name]={**self.get(source_name), "query_options":query_options,
+                "high_water_mark":None}
+            self.save()
+
+    def reset(self, source_name:str):
+        with self._lock:
+            self.state.pop(source_name, None)
+            self.save()
+
+    def start_page(self, source_name:str, page_token:str, page_file:str):
+        with self._lock:
+            self.state[source_name]={"page_token":page_token, "page_file":page_file,
+                "done_docs":[], "completed":False, **self._walk(source_name)}
+            self.save()
+
+    def doc_done(self, source_name:str, doc_name:str):
+        """
+        Log document of current page as handled, flushed to the OS,
+        not fsync'ed: a document lost on power failure is handled again.
+        """
+        with self._lock:
+            checkpoint=self.state[source_name]
+            checkpoint["done_docs"].append(doc_name)
+            docs_log=self._get_docs_log()
+            docs_log.write(json.dumps({"source":source_name,
+                "page_file":checkpoint["page_file"], "doc":doc_name}, ensure_ascii=False)+"\n")
+            docs_log.flush()
+
+    def page_done(self, source_name:str, next_link:str, high_water_mark:str=None):
+        with self._lock:
+            self.state[source_name]={"page_token":next_link, "page_file":None,
+                "done_docs":[], "completed":next_link is None,
+                **self._walk(source_name), "high_water_mark":high_water_mark}
+            self.save()
+
+    def save(self):
+        """
+        Rewrite state with documents logged so far, then empty the documents log.
+        """
+        with self._lock:
+            atomic_write_json(self.checkpoint_file, self.state)
+            if self._docs_log is not None or os.path.exists(self.docs_log_file):
+                self._get_docs_log().truncate(0)
+
+    def _get_docs_log(self):
+        if self._docs_log is None:
+            self._docs_log=open(self.docs_log_file, "a", encoding="utf-8")
+        return self._docs_log
+
+    def close(self):
+        with self._lock:
+            if self._docs_log is not None:
+                self._docs_log.close()
+                self._docs_log=None
@@ -0,0 +1,188 @@
+'''
+In-process metrics of crawl runs: timing spans of hot stages aggregated
+to histograms, and counters. Exported periodically, and at the end of
+a run, as a JSON summary and a Prometheus text file (for node exporter
+textfile collector, or any scraper reading the file).
+'''
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+
+import config
+
+
+# Upper bounds of histogram buckets, seconds
+LATENCY_BUCKETS=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Prometheus metrics names prefix
+METRICS_PREFIX="knesset_crawl"
+
+
+class Histogram():
+    """
+    Counts of observations per bucket, with sum, min and max.
+    """
+
+    def __init__(self, buckets:tuple=LATENCY_BUCKETS) -> None:
+        self.buckets=buckets
+        # Last bucket counts observations above all bounds
+        self.counts=[0]*(len(buckets)+1)
+        self.count=0
+        self.sum=0.0
+        self.min=None
+        self.max=None
+
+    def observe(self, value:float):
+        self.counts[bisect.bisect_left(self.buckets, value)]+=1
+        self.count+=1
+        self.sum+=value
+        self.min=value if self.min is None else min(self.min, value)
+        self.max=value if self.max is None else max(self.max, value)
+
+    def quantile(self, q:float)->float:
+        """
+        Upper bound of the bucket holding quantile q, max for the last bucket.
+        """
+        if self.count==0:
+            return None
+        rank=q*self.count
+        cumulative=0
+        for idx, cnt in enumerate(self.counts):
+            cumulative+=cnt
+            if cumulative>=rank and cnt>0:
+                return min(self.buckets[idx], self.max) if idx<len(self.buckets) else self.max
+        return self.max
+
+    def summary(self)->dict:
+        return {"count":self.count, "sum":round(self.sum, 6),
+            "mean":round(self.sum/self.count, 6) if self.count else None,
+            "min":self.min, "max":self.max,
+            "p50":self.quantile(0.5), "p90":self.quantile(0.9), "p99":self.quantile(0.99)}
+
+
+class CrawlMetrics():
+    """
+    Thread safe registry of stage histograms and counters.
+    """
+
+    def __init__(self, json_file:str=None, prometheus_file:str=None, interval:float=None) -> None:
+        self.log=logging.getLogger('default')
+        self.json_file=json_file if json_file is not None else config.metrics_json_file
+        self.prometheus_file=prometheus_file if prometheus_file is not None else config.metrics_prometheus_file
+        self.interval=interval if interval is not None else config.metrics_export_interval
+        self.started_at=time.time()
+        self._lock=threading.Lock()
+        self.histograms={}
+        self.counters={}
+        self._exporter=None
+        self._stop_event=threading.Event()
+
+    @contextmanager
+    def span(self, stage:str):
+        """
+        Time the wrapped block as 1 observation of stage,
+        failed blocks are counted on '{stage}_errors' as well.
+        """
+        start=time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc(f"{stage}_errors")
+            raise
+        finally:
+            self.observe(stage, time.perf_counter()-start)
+
+    def observe(self, stage:str, seconds:float):
+        with self._lock:
+            if stage not in self.histograms:
+                self.histograms[stage]=Histogram()
+            self.histograms[stage].observe(seconds)
+
+    def inc(self, name:str, value:float=1):
+        with self._lock:
+            self.counters[name]=self.counters.get(name, 0)+value
+
+    def summary(self)->dict:
+        with self._lock:
+            return {
+                "started_at":self.started_at,
+                "updated_at":time.time(),
+                "stages":{stage:histogram.summary() for stage, histogram in sorted(self.histograms.items())},
+                "counters":dict(sorted(self.counters.items())),
+            }
+
+    def to_prometheus(self)->str:
+        lines=[f"# TYPE {METRICS_PREFIX}_stage_seconds histogram"]
+        with self._lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative=0
+                for bound, cnt in zip(histogram.buckets, histogram.counts):
+                    cumulative+=cnt
+                    lines.append(f'{METRICS_PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{METRICS_PREFIX}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{METRICS_PREFIX}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{METRICS_PREFIX}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {METRICS_PREFIX}_{name}_total counter")
+                lines.append(f"{METRICS_PREFIX}_{name}_total {value}")
+        return "\n".join(lines)+"\n"
+
+    def export(self):
+        # Written aside and renamed, readers never see a partial file
+        # (file_utils writes are instrumented, hence not used here)
+        for path, content in [(self.json_file, json.dumps(self.summary(), indent=2)),
+                (self.prometheus_file, self.to_prometheus())]:
+            tmp_path=f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as _fout:
+                _fout.write(content)
+            os.replace(tmp_path, path)
+
+    def start_exporter(self):
+        """
+        Export every 'interval' seconds on a background thread, till stop_exporter().
+        """
+        if self._exporter is not None:
+            return
+        self._stop_event.clear()
+        self._exporter=threading.Thread(target=self._export_loop, name="metrics-exporter", daemon=True)
+        self._exporter.start()
+
+    def _export_loop(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.export()
+            except OSError as err:
+                self.log.info(f"Failed to export metrics: {err}")
+
+    def stop_exporter(self):
+        """
+        Stop periodic export and export final values.
+        """
+        if self._exporter is not None:
+            self._stop_event.set()
+            self._exporter.join()
+            self._exporter=None
+        self.export()
+        self.log.info(f"Metrics exported to {self.json_file} and {self.prometheus_file}")
+
+
+_metrics=None
+_metrics_lock=threading.Lock()
+
+
+def get_metrics()->CrawlMetrics:
+    """
+    Metrics shared by all stages and threads of the process.
+    """
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics=CrawlMetrics()
+        return _metrics
+
+
+def span(stage:str):
+    return get_metrics().span(stage)
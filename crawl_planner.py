@@ -0,0 +1,96 @@
+'''
+Plan of a selective crawl: documents of given Knesset numbers, date
+range, sources and formats, filtered by ODATA '$filter' on the server
+rather than after listing, and crawled in priority order, so one
+Knesset is refreshed without a full pass.
+'''
+import datetime
+import logging
+
+import config
+
+
+PRIORITIES=["newest", "given"]
+
+
+class CrawlPlanner():
+    """
+    Work items of a selective crawl, 1 per source & Knesset number,
+    each listed with its own '$filter':
+    * Knesset: "substringof('//{knesset}/',FilePath)", documents
+        FilePath are like 'https://fs.knesset.gov.il//16/Plenum/...'.
+    * Dates: config.crawl_date_field between date_from and date_to.
+    * Formats: FilePath suffixes, replacing MS WORD suffixes filter.
+    """
+
+    def __init__(self, sources:list=None, knesset_nums:list=None, date_from:str=None, date_to:str=None,
+            formats:list=None, priority:str="newest") -> None:
+        """
+        Parameters:
+        * sources: documents sources, config.datasets_sources by default.
+        * knesset_nums: Knesset numbers, all Knessets by default.
+        * date_from, date_to: ISO dates ('2023-01-01'), inclusive.
+        * formats: file formats ('doc', 'docx'), MS WORD formats by default.
+        * priority: 'newest' Knesset first, or 'given' order of knesset_nums
+            (most requested first).
+        """
+        self.log=logging.getLogger('default')
+        self.sources=list(sources or config.datasets_sources)
+        unknown_sources=[source for source in self.sources if source not in config.datasets_sources]
+        if unknown_sources:
+            raise ValueError(f"Unknown sources {unknown_sources}, expected some of {config.datasets_sources}")
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority}, expected one of {PRIORITIES}")
+        self.knesset_nums=list(knesset_nums or [])
+        if priority=="newest":
+            self.knesset_nums=sorted(set(self.knesset_nums), reverse=True)
+        self.date_from=self.parse_date(date_from)
+        self.date_to=self.parse_date(date_to)
+        self.formats=self.expand_formats(formats) if formats else None
+
+    def parse_date(self, value:str)->datetime.date:
+        return datetime.date.fromisoformat(value) if value else None
+
+    def expand_formats(self, formats:list)->list:
+        """
+        Formats in lower & upper case, as FilePath suffixes vary,
+        only formats handled by the downloader.
+        """
+        handled={suffix.lower() for suffix in config.ms_words_suffix}
+        unhandled=[_format for _format in formats if _format.lower() not in handled]
+        if unhandled:
+            raise ValueError(f"Formats {unhandled} are not downloaded, expected some of {sorted(handled)}")
+        return list(dict.fromkeys(case for _format in formats for case in [_format.lower(), _format.upper()]))
+
+    def date_filter(self)->str:
+        field=config.crawl_date_field
+        conditions=[]
+        if self.date_from:
+            conditions.append(f"{field} ge datetime'{self.date_from.isoformat()}T00:00:00'")
+        if self.date_to:
+            # Inclusive of date_to's day
+            conditions.append(f"{field} lt datetime'{(self.date_to+datetime.timedelta(days=1)).isoformat()}T00:00:00'")
+        return " and ".join(conditions)
+
+    def work_items(self)->list:
+        """
+        Work items in crawl order, dicts of:
+        * source, knesset_num (None for all Knessets).
+        * filter: '$filter' expression, None if not filtered.
+        * formats: FilePath suffixes, None for MS WORD formats.
+        """
+        items=[]
+        for knesset_num in self.knesset_nums or [None]:
+            for source in self.sources:
+                expressions=[]
+                if knesset_num is not None:
+                    expressions.append(f"substringof('//{knesset_num}/',FilePath)")
+                if self.date_filter():
+                    expressions.append(self.date_filter())
+                items.append({"source":source, "knesset_num":knesset_num,
+                    "filter":" and ".join(expressions) or None, "formats":self.formats})
+        return items
+
+    def describe(self, item:dict)->str:
+        knesset=f"Knesset {item['knesset_num']}" if item["knesset_num"] is not None else "all Knessets"
+        return f"{item['source']}, {knesset}, $filter: {item['filter']}"
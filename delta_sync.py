@@ -0,0 +1,86 @@
+'''
+High-water marks per source for incremental sync against Knesset ODATA.
+'''
+import os
+import json
+import logging
+import threading
+
+import config
+from file_utils import atomic_write_json
+
+
+class DeltaSyncState():
+    """
+    Keep the latest 'LastUpdatedDate' (config.delta_sync_field) seen per source,
+    next incremental run queries only records updated since.
+    High-water mark of a walk over source's pages is kept aside while
+    walking, and stored only once the walk is done.
+    """
+
+    def __init__(self, state_file:str=None) -> None:
+        self.log=logging.getLogger('default')
+        self.state_file=state_file if state_file is not None else config.sync_state_file
+        self.field=config.delta_sync_field
+        self.state={}
+        # High-water mark of records seen by walk in progress, per source
+        self.walks={}
+        # Sources may be synced by different threads
+        self._lock=threading.Lock()
+        if os.path.exists(self.state_file):
+            with open(self.state_file, "r", encoding="utf-8") as _fin:
+                self.state=json.load(_fin)
+
+    def get_high_water_mark(self, source_name:str)->str:
+        return self.state.get(source_name, {}).get(self.field)
+
+    def query_options(self, source_name:str)->dict:
+        """
+        ODATA options of records updated since last sync, oldest first.
+        Records of last sync time are included- already downloaded
+        documents are skipped anyway. Walks ordered by update time are
+        paged by keyset (odata_query.keyset_fields), a record updated
+        mid-walk is listed again at the end of the walk.
+        """
+        high_water_mark=self.get_high_water_mark(source_name)
+        options={"$orderby": self.field}
+        if high_water_mark:
+            options["$filter"]=f"{self.field} ge datetime'{high_water_mark}'"
+        return options
+
+    def start_walk(self, source_name:str, high_water_mark:str=None):
+        """
+        Start a walk over source's pages, high_water_mark of records seen
+        before on a resumed walk.
+        """
+        with self._lock:
+            self.walks[source_name]=high_water_mark
+
+    def update(self, source_name:str, entries:list)->str:
+        """
+        Advance high-water mark of source's walk by page entries.
+        ISO timestamps compare as strings.
+        Returns the walk's high-water mark.
+        """
+        values=[entry[self.field] for entry in entries if entry.get(self.field)]
+        with self._lock:
+            high_water_mark=self.walks.get(source_name)
+            if len(values)>0 and (high_water_mark is None or max(values)>high_water_mark):
+                self.walks[source_name]=max(values)
+            return self.walks.get(source_name)
+
+    def walk_done(self, source_name:str):
+        """
+        All pages of source's walk were handled, store its high-water mark.
+        """
+        with self._lock:
+            walk_max=self.walks.pop(source_name, None)
+            high_water_mark=self.get_high_water_mark(source_name)
+            if walk_max is None or (high_water_mark is not None and walk_max<=high_water_mark):
+                return
+            self.state.setdefault(source_name, {})[self.field]=walk_max
+        self.save()
+
+    def save(self):
+        with self._lock:
+            atomic_write_json(self.state_file, self.state)
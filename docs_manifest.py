@@ -0,0 +1,131 @@
+'''
+Persistent index of documents handled by the downloader,
+used for skip decisions instead of scanning folders.
+'''
+import os
+import logging
+import sqlite3
+import datetime
+
+import pandas as pd
+
+import config
+from record_log import read_records
+
+
+# Documents' status on manifest
+DOWNLOADED="downloaded"
+EXTRACTED="extracted"
+NO_TEXT="no_text"
+CORRUPTED="corrupted"
+# Statuses of documents not to download again
+DONE_STATUSES=(DOWNLOADED, EXTRACTED, NO_TEXT)
+
+
+class DocsManifest():
+    """
+    SQLite manifest keyed by source and document name, holding status,
+    size, hash and timestamps per document.
+    Loaded once to memory, so lookups don't touch disk,
+    and updated incrementally.
+    Not thread safe- use from 1 thread at a time.
+    """
+
+    def __init__(self, db_path:str=None) -> None:
+        self.log=logging.getLogger('default')
+        self.db_path=db_path if db_path is not None else config.docs_manifest
+        # Async engine uses the manifest from its bookkeeping thread
+        self.conn=sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS docs (
+            source TEXT NOT NULL,
+            doc_name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            size INTEGER,
+            sha256 TEXT,
+            downloaded_at TEXT,
+            extracted_at TEXT,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (source, doc_name))""")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS seeded_sources (source TEXT PRIMARY KEY)")
+        self.conn.commit()
+        # (source, doc_name) to status
+        self._statuses={}
+        # Corrupted documents names, on any source
+        self._corrupted=set()
+        for source, doc_name, status in self.conn.execute("SELECT source, doc_name, status FROM docs"):
+            self._set_status(source, doc_name, status)
+
+    def seed_source(self, source_name:str):
+        """
+        First use of manifest for a source: index texts already extracted
+        to '{source}_extracted_texts' and documents on corrupted docs logs.
+        """
+        if self.conn.execute("SELECT 1 FROM seeded_sources WHERE source=?", (source_name,)).fetchone():
+            return
+        texts_dir=f"{source_name}_extracted_texts"
+        cnt=0
+        if os.path.exists(texts_dir):
+            with os.scandir(texts_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".txt"):
+                        self.mark(source_name, entry.name[:-len(".txt")], EXTRACTED)
+                        cnt+=1
+        corrupted_docs=[(record.get("source", ""), record["doc_name"])
+            for record in read_records(config.corrupted_docs_record_log)]
+        if os.path.exists(config.corrupted_docs_log):
+            # Legacy log has no source
+            corrupted_docs.extend(("", doc_name) for doc_name in
+                pd.read_csv(config.corrupted_docs_log)["doc_name"])
+        for source, doc_name in corrupted_docs:
+            if doc_name not in self._corrupted:
+                self.mark(source, doc_name, CORRUPTED)
+        self.conn.execute("INSERT INTO seeded_sources VALUES (?)", (source_name,))
+        self.commit()
+        self.log.info(f"Manifest seeded with {cnt} documents of {source_name}")
+
+    def is_downloaded(self, source_name:str, doc_name:str)->bool:
+        return self._statuses.get((source_name, doc_name)) in DONE_STATUSES
+
+    def is_corrupted(self, doc_name:str)->bool:
+        return doc_name in self._corrupted
+
+    def get_status(self, source_name:str, doc_name:str)->str:
+        return self._statuses.get((source_name, doc_name))
+
+    def mark(self, source_name:str, doc_name:str, status:str, size:int=None, sha256:str=None):
+        """
+        Set document status, size & hash are kept unless given.
+        """
+        now=datetime.datetime.now().isoformat(timespec="seconds")
+        downloaded_at=now if status==DOWNLOADED else None
+        extracted_at=now if status in (EXTRACTED, NO_TEXT) else None
+        self.conn.execute("""INSERT INTO docs
+            (source, doc_name, status, size, sha256, downloaded_at, extracted_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (source, doc_name) DO UPDATE SET
+                status=excluded.status,
+                size=COALESCE(excluded.size, size),
+                sha256=COALESCE(excluded.sha256, sha256),
+                downloaded_at=COALESCE(excluded.downloaded_at, downloaded_at),
+                extracted_at=COALESCE(excluded.extracted_at, extracted_at),
+                updated_at=excluded.updated_at""",
+            (source_name, doc_name, status, size, sha256, downloaded_at, extracted_at, now))
+        if status!=CORRUPTED and doc_name in self._corrupted:
+            # Document recovered, e.g. extracted by another backend
+            self._corrupted.discard(doc_name)
+            self.conn.execute("DELETE FROM docs WHERE doc_name=? AND status=?", (doc_name, CORRUPTED))
+            self._statuses={key:value for key, value in self._statuses.items()
+                if not (key[1]==doc_name and value==CORRUPTED)}
+        self._set_status(source_name, doc_name, status)
+
+    def _set_status(self, source_name:str, doc_name:str, status:str):
+        self._statuses[(source_name, doc_name)]=status
+        if status==CORRUPTED:
+            self._corrupted.add(doc_name)
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -9,16 +9,30 @@ Author: Amit Shkolnik, amit.shkolnik@gmail.com, 2024
 
 import sys
 import os
+import argparse
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import config
 from config import *
 from logger_configurer import configure_logger
-
-if os.name !='nt':
-    raise Exception("App needs win32com.client package, hence need to run on Windows")
-# Install with 'pip install pywin32'
-import win32com.client
-word_application=None 
+from http_client import get_http_client
+from odata_page_prefetcher import OdataPagePrefetcher
+from odata_query import build_page_url, build_count_url, page_file_name, \
+    listing_query_options, apply_client_paging, walk_id, add_filter
+from delta_sync import DeltaSyncState
+from crawl_checkpoint import CrawlCheckpoint
+from file_utils import atomic_write_json, atomic_write_stream
+from text_extractors import ExtractionEngine, save_extracted_text
+from docs_manifest import DocsManifest, DOWNLOADED, EXTRACTED, NO_TEXT, CORRUPTED
+from record_log import JsonlRecordLog
+from crawl_metrics import get_metrics, span
+from odata_page_store import OdataPageStore
+from blob_store import BlobStore, NOT_MODIFIED
+from text_shard_store import close_text_shard_store
+from text_search_index import get_text_search_index, close_text_search_index
+from crawl_planner import CrawlPlanner
 
 class DownloadKnessetCorpus():
     """
@@ -26,8 +40,46 @@ class DownloadKnessetCorpus():
     Plenum's sessions, committees sessions and legislations documents.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, incremental:bool=False, resume:bool=False, plan:CrawlPlanner=None) -> None:
+        """
+        Parameters:
+        * incremental: download only records updated since last run.
+        * resume: continue each source from its checkpoint.
+        * plan: selective crawl of plan's work items instead of all
+            documents of config.datasets_sources, not resumed and not
+            advancing incremental sync state.
+        """
         self.log=logging.getLogger('default')
+        self.incremental=incremental
+        self.resume=resume
+        self.plan=plan
+        # Work item of plan being crawled
+        self.work_item=None
+        # Checkpoints of selective crawls are kept apart from full crawl's
+        self.checkpoint=CrawlCheckpoint(config.corpus_checkpoint_file if plan is None
+            else config.planned_crawl_checkpoint_file)
+        self.sync_state=DeltaSyncState()
+        self.http_client=get_http_client()
+        self.extraction_engine=ExtractionEngine()
+        self.manifest=DocsManifest()
+        self.errors_log=JsonlRecordLog(config.errors_record_log, legacy_csv=config.errors_log)
+        self.corrupted_docs_log=JsonlRecordLog(config.corrupted_docs_record_log,
+            legacy_csv=config.corrupted_docs_log)
+        # Download log per source
+        self.documents_logs={}
+        self.refresh_since=None
+        # Query options of the walk over each source's pages
+        self.walk_options={}
+        # Id of filtered walk per source, names its pages
+        self.walk_ids={}
+        self.page_store=OdataPageStore() if "parquet" in config.odata_pages_sink else None
+        self.blob_store=BlobStore() if config.use_blob_store else None
+        # Downloaded documents are requested again, skipped if unchanged
+        self.revalidate=config.revalidate_downloaded and self.blob_store is not None
+        # URL of each document name of this run per source, names
+        # are claimed before their documents are stored
+        self.doc_name_urls={}
+        self._doc_names_lock=threading.Lock()
 
 
     def run(self):
@@ -35,23 +87,34 @@ class DownloadKnessetCorpus():
             ######################################################################
             # Main call                                                          #
             ######################################################################    
-            # Skip tokens per source-not to re-iterate all pages, like:
-            # skip_tokens=[ "?$skiptoken=321264L", "?$skiptoken=4099505L",  "?$skiptoken=497312L"]
-            skip_tokens=[None, None, None]
-
+            get_metrics().start_exporter()
+            if self.plan is not None:
+                self.run_plan()
+                self.close()
+                return
             # Check number of files on each source:
             for idx, source in enumerate(config.datasets_sources):
-                _query=f"https://knesset.gov.il/Odata/ParliamentInfo.svc/{source}/$count"
-                _response=requests.get(_query)
+                _query=build_count_url(source, self.get_query_options(source))
+                _response=self.http_client.get(_query)
                 self.log.info(f"** TOTAL {_response.text} documents on {source} **")
 
             # Loop between Knesset sources (Plenum, committees, etc)
             for idx, source in enumerate(config.datasets_sources):
                 self.mkdir_per_source(source)
-                self.download_dataset(source, skip_token=skip_tokens[idx])
+                if not self.resume:
+                    self.checkpoint.reset(source)
+                    self.download_dataset(source, skip_token=None)
+                    continue
+                # Continue source from the page & document it stopped at
+                checkpoint=self.checkpoint.get(source)
+                if checkpoint["completed"]:
+                    self.log.info(f"Source {source} already completed")
+                    continue
+                self.download_dataset(source, skip_token=checkpoint["page_token"],
+                    page_file=checkpoint["page_file"], done_docs=checkpoint["done_docs"])
                 continue
 
-            word_application.Quit()
+            self.close()
             return
 
         except Exception as err:
@@ -59,7 +122,31 @@ class DownloadKnessetCorpus():
             self.log.info("End run")
         return
 
-    def download_dataset(self, source_name, skip_token:str):
+    def run_plan(self):
+        """
+        Crawl work items of plan in order, items with no documents are skipped.
+        """
+        items=self.plan.work_items()
+        counts=[]
+        for item in items:
+            _response=self.http_client.get(build_count_url(item["source"],
+                self.get_query_options(item["source"], item)))
+            counts.append(_response.text)
+            self.log.info(f"** {_response.text} documents on {self.plan.describe(item)} **")
+        for idx, (item, count) in enumerate(zip(items, counts)):
+            self.start_work_item(idx, len(items), item, count)
+            if count.strip()=="0":
+                continue
+            self.download_dataset(item["source"], skip_token=None)
+        self.work_item=None
+
+    def start_work_item(self, idx:int, items_cnt:int, item:dict, count:str):
+        self.log.info(f"Work item {idx+1}/{items_cnt}: {self.plan.describe(item)}, {count} documents")
+        self.work_item=item
+        self.mkdir_per_source(item["source"])
+        self.checkpoint.reset(item["source"])
+
+    def download_dataset(self, source_name, skip_token:str, page_file:str=None, done_docs:list=None):
         """
         Download documents from 1 source (Plenum, committees, etc),
         Paging API (100 documents per page).
@@ -67,77 +154,204 @@ class DownloadKnessetCorpus():
         * source: Knesset source to download from.
         * skip_token: string, if not None, script skip all 
             pages to the skip_token page.
+        * page_file: skip_token's page previously saved, read instead of
+            listing the page again.
+        * done_docs: documents of page_file already handled.
         """
         try:
-            corrupted_docs_list=[]
             # Skip token used for paging between Knesset ODATA API pages.    
-            self.log.info(f"Downloading source {source_name}")
-            corrupted_docs_list=list(pd.read_csv(config.corrupted_docs_log)["doc_name"])
+            self.start_dataset(source_name)
             rounds=1
-            
-            while True:
+            for skip_token, page, num_of_docs, saved_page_file in self.iter_pages(
+                    source_name, skip_token, page_file):
                 self.log.info(f"*** ROUND {rounds} ***")        
                 rounds+=1
-                skip_token, errors_list=self.download_one_page_docs(
-                    source_name, skip_token, corrupted_docs_list)    
-                if len(errors_list)>0:
-                    self.log_erros(errors_list)            
-                if not skip_token:
-                    break
+                errors_list=self.download_one_page_docs(
+                    source_name, page, num_of_docs, skip_token, saved_page_file,
+                    done_docs if saved_page_file else None)    
+                self.page_done(source_name, page, errors_list)
         except Exception as err:
-            log.exception(err)
+            self.log.exception(err)
+
+    def start_dataset(self, source_name:str):
+        self.log.info(f"Downloading source {source_name}")
+        self.manifest.seed_source(source_name)
+        # Documents updated after last sync are downloaded again
+        self.refresh_since=None
+        if self.incremental:
+            self.refresh_since=self.sync_state.get_high_water_mark(source_name)
+        self.start_walk(source_name)
 
-    def download_one_page_docs(self, source_name:str, skip_token:str, corrupted_docs_list)->str:    
+    def start_walk(self, source_name:str):
+        """
+        Fix query options of the walk over source's pages, a resumed walk
+        keeps the options it started with, its '$skip' offsets are relative
+        to them.
+        """
+        checkpoint=self.checkpoint.get(source_name)
+        if checkpoint.get("query_options") is None:
+            self.checkpoint.start_walk(source_name, self.get_query_options(source_name))
+            checkpoint=self.checkpoint.get(source_name)
+        self.walk_options[source_name]=checkpoint["query_options"]
+        # Pages of incremental walks and of plan's work items don't overwrite
+        # pages of full walks or of other work items
+        self.walk_ids[source_name]=walk_id(checkpoint["query_options"]) \
+            if self.incremental or self.work_item is not None else None
+        if self.walk_ids[source_name] is not None:
+            self.log.info(f"Pages of {source_name} walk are saved as {source_name}_{self.walk_ids[source_name]}_*")
+        self.sync_state.start_walk(source_name, checkpoint.get("high_water_mark"))
+
+    def page_done(self, source_name:str, page:dict, errors_list:list):
+        """
+        Page documents handled: log errors, advance sync state and checkpoint.
+        High-water mark of the walk is stored once its last page is done.
+        """
+        if len(errors_list)>0:
+            self.log_erros(errors_list)            
+        high_water_mark=None
+        # Selective crawls see part of the records, high-water mark stays
+        if self.plan is None:
+            high_water_mark=self.sync_state.update(source_name, page["value"])
+        if config.text_search_index_on_extract:
+            get_text_search_index().add_records(source_name, page["value"])
+        if not page.get("odata.nextLink") and self.plan is None:
+            self.sync_state.walk_done(source_name)
+        self.checkpoint.page_done(source_name, page.get("odata.nextLink"), high_water_mark)
+
+    def iter_pages(self, source_name:str, skip_token:str, page_file:str=None):
+        """
+        Yield (skip_token, page, num_of_docs, page_file) per source page,
+        page_file is set for a page read from disk on resume.
+        Next pages are listed on background while current page
+        documents are downloaded and extracted.
+        """
+        if page_file is not None and os.path.exists(page_file):
+            self.log.info(f"*** Resuming page {page_file} ***")
+            with open(page_file, "r", encoding="utf-8") as _fin:
+                page=json.load(_fin)
+            yield skip_token, page, len(page["value"]), page_file
+            skip_token=page.get("odata.nextLink")
+            if not skip_token:
+                return
+        prefetcher=OdataPagePrefetcher(self.get_docs_list, source_name, skip_token)
+        for skip_token, page, num_of_docs, url in prefetcher.pages():
+            yield skip_token, page, num_of_docs, None
+
+    def download_one_page_docs(self, source_name:str, page:dict, num_of_docs:int,
+            skip_token:str, page_file:str=None, done_docs:list=None)->list:    
         """
         Main method to download and extract texts from
         Knesset ODATA API,
-        Each API page contains -by default- 100 documents' links 
+        Each API page contains -by default- 100 documents' links.
+        Parameters:
+        * page: ODATA page JSON.
+        * skip_token: token page was listed with, for checkpoint.
+        * page_file: page already saved on previous run, None for new page.
+        * done_docs: documents of resumed page already handled.
+        Returns list of errors occurred on page documents.
         """
-        already_downloaded=self.get_already_downloaded(source_name)
-        # Call ODATA API
-        response, num_of_docs, url=self.get_docs_list(source_name,skip_token)    
-        self.save_response_json(response, source_name, url)
+        entries_to_download, skip_cntr=self.start_page(source_name, page, num_of_docs,
+            skip_token, page_file, done_docs)
         documents_log_list=[]
         errors_list=[]
+        # Downloaded file name to its ODATA entry
+        downloaded_docs={}
+        with ThreadPoolExecutor(max_workers=config.download_workers) as executor:
+            futures={}
+            for idx, entry in entries_to_download:
+                self.log.info(f"{idx}/{num_of_docs} Downloading {entry['FilePath']}")
+                futures[executor.submit(self.download_doc, source_name, entry)]=entry
+            for future in as_completed(futures):
+                entry=futures[future]
+                try:
+                    downloaded=future.result()
+                except Exception as err:
+                    self.log.exception(err)
+                    errors_list.append({"doc":entry, "error":err})
+                    self.checkpoint.doc_done(source_name, self.doc_file_name(source_name, entry))
+                    continue
+                self.doc_downloaded(source_name, entry, downloaded, documents_log_list, downloaded_docs)
+        return self.finish_page(source_name, downloaded_docs, documents_log_list, errors_list, skip_cntr)
+
+    def start_page(self, source_name:str, page:dict, num_of_docs:int,
+            skip_token:str, page_file:str=None, done_docs:list=None):
+        """
+        Save a new page and start its checkpoint, then apply skip rules
+        on page documents.
+        Returns ([(idx, entry)] of documents to download, skip counters).
+        """
+        if page_file is None:
+            page_file=self.save_response_json(page, source_name)
+            self.checkpoint.start_page(source_name, skip_token, page_file)
+        done_docs=set(done_docs or [])
         #already_downloaded_cnt, not_msword_cnt, corrupted_cnt
         skip_cntr=[0,0,0]
-        # Per document:
-        for idx, entry in  enumerate(response.json()["value"]):
-            try:
-                if not self.handle_or_skip_docs(entry,already_downloaded, 
-                    num_of_docs, idx, corrupted_docs_list, skip_cntr):
-                    continue
-                self.log.info(f"{idx}/{num_of_docs} Downloading {entry['FilePath']}")
-                file_name=self.download_doc(source_name, entry)
-                if file_name is not None:
-                    self.extract_text_from_doc(source_name, file_name)
-                documents_log_list.append(entry)
-            except Exception as err:
-                log.exception(err)
-                errors_list.append({"doc":entry, "error":err})
-                # Case err.strerror is 'Call was rejected by callee' sleep() might recover it.
-                time.sleep(10)
+        # Skip rules are applied on main thread, only documents to
+        # download are sent to the download workers.
+        entries_to_download=[]
+        for idx, entry in  enumerate(page["value"]):
+            if self.doc_file_name(source_name, entry) in done_docs:
+                skip_cntr[0]=skip_cntr[0]+1
+                continue
+            if not self.handle_or_skip_docs(entry, source_name,
+                num_of_docs, idx, skip_cntr):
                 continue
-            continue
+            entries_to_download.append((idx, entry))
+        return entries_to_download, skip_cntr
+
+    def doc_downloaded(self, source_name:str, entry:dict, downloaded,
+            documents_log_list:list, downloaded_docs:dict):
+        """
+        Record result of download_doc for entry.
+        """
+        if downloaded==NOT_MODIFIED:
+            self.checkpoint.doc_done(source_name, self.doc_file_name(source_name, entry))
+            return
+        if downloaded is None:
+            documents_log_list.append(entry)
+            self.checkpoint.doc_done(source_name, self.doc_file_name(source_name, entry))
+            return
+        file_name, size, sha256=downloaded
+        self.manifest.mark(source_name, file_name, DOWNLOADED, size, sha256)
+        downloaded_docs[file_name]=entry
+
+    def finish_page(self, source_name:str, downloaded_docs:dict, documents_log_list:list,
+            errors_list:list, skip_cntr:list)->list:
+        """
+        Extract texts of page downloaded documents and log them.
+        Returns list of errors occurred on page documents.
+        """
+        if not config.extract_texts_on_download:
+            documents_log_list.extend(downloaded_docs.values())
+            for file_name in downloaded_docs:
+                self.checkpoint.doc_done(source_name, file_name)
+            downloaded_docs={}
+        # Texts of page documents are extracted in parallel by extraction backend
+        for file_name, err in self.extract_text_from_docs(source_name, list(downloaded_docs)):
+            if err is None:
+                documents_log_list.append(downloaded_docs[file_name])
+            else:
+                errors_list.append({"doc":downloaded_docs[file_name], "error":err})
+            self.checkpoint.doc_done(source_name, file_name)
         self.log.info("{} downloaded {} already downloaded, {} not WORD format, {} corrupted ".format(
             len(documents_log_list), skip_cntr[0], skip_cntr[1], skip_cntr[2]))
         if len(documents_log_list)>0:
             self.log_documents(source_name, documents_log_list)
-        # something like "KNS_DocumentPlenumSession?$skiptoken=128985L" to move
-        # to next page on ODATA
-        if "odata.nextLink" in response.json():
-            return response.json()["odata.nextLink"], errors_list
-        return None, errors_list
+        self.manifest.commit()
+        return errors_list
 
 
-    def handle_or_skip_docs(self, entry, already_downloaded, num_of_docs, idx, corrupted_docs_list,
-            skip_cntr:list):
+    def handle_or_skip_docs(self, entry, source_name:str, num_of_docs, idx, skip_cntr:list):
         """
         Decide to skip file if previously donwloaded, format is not handled
-        or document is corrupted
+        or document is corrupted, by documents manifest.
         """
         file_path=entry['FilePath']
-        if file_path.split("/")[-1] in already_downloaded:
+        file_name=self.doc_file_name(source_name, entry)
+        updated=self.refresh_since is not None and \
+            entry.get(config.delta_sync_field, "")>self.refresh_since
+        if not updated and not self.revalidate and \
+                self.manifest.is_downloaded(source_name, file_name):
             self.log.debug(f"{idx}/{num_of_docs} {entry['FilePath']} already downloaded")
             skip_cntr[0]=skip_cntr[0]+1
             return False
@@ -145,182 +359,247 @@ class DownloadKnessetCorpus():
             self.log.debug(f"Skipping non MS Word doc {entry['FilePath']}")
             skip_cntr[1]=skip_cntr[1]+1
             return False
-        if file_path.split("/")[-1] in corrupted_docs_list:
+        if self.manifest.is_corrupted(file_name):
             self.log.debug("Skipping corrupted documnet")
             skip_cntr[2]=skip_cntr[2]+1
             return False
         return True
 
+    def get_query_options(self, source_name:str, work_item:dict=None)->dict:
+        """
+        ODATA query options of source pages, filtered by work_item
+        (current work item of plan by default).
+        """
+        work_item=work_item if work_item is not None else self.work_item
+        options={}
+        if self.incremental:
+            options=self.sync_state.query_options(source_name)
+        formats=None
+        if work_item is not None:
+            if work_item["filter"]:
+                options=add_filter(options, work_item["filter"])
+            formats=work_item["formats"]
+        return listing_query_options(source_name, options, formats)
+
     def get_docs_list(self, source_name:str, skip_token:str):
         """
         HTTP request to get 1 page from Knesset ODATA.
         """
-        url=f"{config.main_hypelink}{source_name}?${config.odata_download_format}"
-        # Paging through the ODATA
-        if skip_token:
-            token=skip_token.split("?$")[1]
-            url=f"{url}&${token}"
+        url=build_page_url(source_name, skip_token, self.walk_options[source_name])
         self.log.info(f"*** Download main ODATA {url} ***")
-        # Call ODATA API
-        while True:
-            response=requests.get(url=url)    
-            if 'value' not in response.json():
-                self.log.info(f"No 'valeue' key on response.json")
-                self.log.info(response.json())
-                time.sleep(10)
-                continue
-            break
+        # Call ODATA API, retried with backoff while page has no 'value'
+        with span("list_page"):
+            response, page=self.http_client.get_json(url)
+        page=apply_client_paging(source_name, skip_token, page, self.walk_options[source_name])
+        get_metrics().inc("pages_listed")
 
-        num_of_docs=len(response.json()['value'])
+        num_of_docs=len(page['value'])
         self.log.info(f"*** {num_of_docs} documents to download ***")
-        return response, num_of_docs, url
-
-    def get_already_downloaded(self, source):
-        """
-        Avoiding re-download documents by watching a list of 
-        previously dowloaded docs.
-        """
-        already_downloaded= os.listdir(f"{source}_extracted_texts")
-        for idx, doc in enumerate(already_downloaded):
-            already_downloaded[idx]=doc.replace(".txt", "")
-        return already_downloaded
-
+        return page, num_of_docs, url
 
     def log_documents(self, source_name:str, documents_log_list:list):
         """
         Save a log of all downloaded documents 
         """
-        new_docs_df=pd.DataFrame(documents_log_list)
-
-        _file=f"{source_name}_docs_download_log.txt"
-        if os.path.exists(_file):
-            old_docs_df=pd.read_csv(_file)
-            concated_df=pd.concat([new_docs_df, old_docs_df])
-            concated_df.to_csv(_file, index=False)
-        else:
-            new_docs_df.to_csv(_file, index=False)
-
+        if source_name not in self.documents_logs:
+            self.documents_logs[source_name]=JsonlRecordLog(
+                f"{source_name}_docs_download_log.jsonl",
+                legacy_csv=f"{source_name}_docs_download_log.txt")
+        self.documents_logs[source_name].append(documents_log_list)
         return
 
     def download_doc(self, source:str, entry:dict):
         """
         Download document in original format,
-        save it to local folder
+        save it to local folder.
+        Body is streamed to a temporary file and renamed once complete,
+        so memory stays flat and no partial document is left.
+        Returns (file_name, size, sha256), None if not downloaded,
+        NOT_MODIFIED if document is unchanged since stored.
         """
         url=entry["FilePath"]
-        response=requests.get(url)    
-        if response.status_code == 200:
+        file_name=self.claim_doc_name(source, entry)
+        headers=self.doc_request_headers(source, file_name)
+        with span("download_doc"), self.http_client.stream(url, headers) as response:
+            if response.status_code==304:
+                self.log.info(f"{file_name} not modified")
+                get_metrics().inc("docs_not_modified")
+                return NOT_MODIFIED
+            if response.status_code != 200:
+                self.log.info(f"Failed to download document. Status code: {response.status_code}")
+                get_metrics().inc("docs_failed")
+                return None
+            sizes=self.doc_size_limits(file_name, response.headers)
+            if sizes is None:
+                return None
             # Save the document to a local file
-            file_name=url.split("/")[len(url.split("/"))-1]
-            with open(os.path.join(f"{source}_docs", file_name), "wb") as file:
-                file.write(response.content)
-            self.log.info("Document downloaded successfully.")
+            size, sha256=atomic_write_stream(os.path.join(f"{source}_docs", file_name),
+                response.iter_content(chunk_size=config.download_chunk_size), *sizes)
+        self.doc_stored(source, file_name, url, size, sha256, response.headers)
+        return file_name, size, sha256
+
+    def doc_file_name(self, source_name:str, entry:dict)->str:
+        """
+        Name of entry's document under '{source}_docs': basename of its URL,
+        or '{stem}_{id}.{suffix}' by its ODATA key when another URL of
+        source is stored (or claimed on this run) under the basename,
+        so neither document overwrites the other.
+        """
+        url=entry["FilePath"]
+        file_name=url.split("/")[-1]
+        named_url=self.doc_name_urls.get(source_name, {}).get(file_name)
+        if named_url is None and self.blob_store is not None:
+            named_url=self.blob_store.get_url(source_name, file_name)
+        if named_url is None or named_url==url:
             return file_name
-        else:
-            self.log.info(f"Failed to download document. Status code: {response.status_code}")
+        doc_id=entry.get(config.odata_key_fields.get(source_name))
+        if doc_id is None:
+            doc_id=hashlib.sha1(url.encode("utf-8")).hexdigest()[:10]
+        stem, dot, suffix=file_name.rpartition(".")
+        return f"{stem}_{doc_id}{dot}{suffix}" if dot else f"{file_name}_{doc_id}"
+
+    def claim_doc_name(self, source_name:str, entry:dict)->str:
+        """
+        Name entry's document is stored under (doc_file_name), claimed for
+        its URL, documents of the same basename downloaded on the same
+        page are named apart.
+        """
+        url=entry["FilePath"]
+        with self._doc_names_lock:
+            file_name=self.doc_file_name(source_name, entry)
+            self.doc_name_urls.setdefault(source_name, {}).setdefault(file_name, url)
+        if file_name!=url.split("/")[-1]:
+            get_metrics().inc("doc_name_collisions")
+            self.log.warning(f"{url.split('/')[-1]} of {source_name} is stored from another URL, "
+                f"{url} is stored as {file_name}")
+        return file_name
+
+    def doc_request_headers(self, source_name:str, file_name:str)->dict:
+        """
+        Conditional request headers of a document stored before,
+        None for unconditional request.
+        """
+        if not self.revalidate:
             return None
-        
+        return self.blob_store.conditional_headers(source_name, file_name) or None
+
+    def doc_stored(self, source_name:str, file_name:str, url:str, size:int, sha256:str, headers):
+        """
+        Document written to '{source}_docs', add it to blob store
+        with its validators for later conditional requests.
+        """
+        get_metrics().inc("docs_downloaded")
+        get_metrics().inc("bytes_downloaded", size)
+        if self.blob_store is not None:
+            self.blob_store.add_doc(source_name, file_name, os.path.join(f"{source_name}_docs", file_name),
+                sha256, size, url, headers.get("ETag"), headers.get("Last-Modified"))
+        self.log.info("Document downloaded successfully.")
+
+    def doc_size_limits(self, file_name:str, headers):
+        """
+        (expected_size, max_size) of a document by its response headers,
+        None if document exceeds its format's maximal size.
+        """
+        max_size=config.max_doc_size_per_format.get(
+            file_name.split(".").pop().lower(), config.max_doc_size)
+        expected_size=None
+        # Content-Length of compressed body doesn't match decoded content
+        if "Content-Length" in headers and "Content-Encoding" not in headers:
+            expected_size=int(headers["Content-Length"])
+        if max_size is not None and expected_size is not None and expected_size>max_size:
+            self.log.info(f"Skipping {file_name}, {expected_size} bytes exceeds {max_size} bytes")
+            return None
+        return expected_size, max_size
+
     def extract_text_from_doc(self, source_name:str, file_name:str):
         """
         Extract text from downloaded document management method.
         Handle per document format: .doc, .docx, .pdf, etc.
         """    
-        if file_name.lower().split(".")[len(file_name.split("."))-1] in config.ms_words_suffix:
-            self.extract_text_from_ms_word(source_name, file_name)
-            self.log.info("Document's text successfuly extracted")
-
-        else:
-            self.log.info("This file type is not handled")
+        for _, err in self.extract_text_from_docs(source_name, [file_name]):
+            if err is not None:
+                raise err
         return
 
-    def  extract_text_from_ms_word(self, source_name:str, file_name:str):
-        # Old .doc format, non OXML files.
-        if file_name.lower().split(".").pop() in config.ms_words_suffix:
-            return self.read_msword_with_win32com(source_name, file_name)    
-    
-
-    def read_msword_with_win32com(self, source_name:str, file_path):
+    def extract_text_from_docs(self, source_name:str, file_names:list):
         """
-        Text extraction from MS WORD
+        Extract texts of downloaded documents with the extraction backend,
+        documents failed to extract are added to corrupted docs list.
+        With blob store, text of a content extracted before is reused
+        and documents of identical content are extracted once.
+        Yields (file_name, error) per document, error is None on success.
         """
-        output_text=""
-        if word_application==None:
-            self.init_word_app()    
-        
-        doc=self.open_word_doc(source_name, file_path)
-        if doc==None:
-            self.log.info("Failed to open doc")
-            return
-        
-        output_text=doc.Range().Text
-        ''' Old, slower extraction method '''
-        # for paragraph in doc.Paragraphs:
-        #     full_text.append(paragraph.Range.Text.strip())    
-        # output_text="\n".join([ t for t in full_text if len(t.strip())>0])
-
-        # Extract text from Text Box, which appears on
-        # old Knesset documents, originaly extracted from TIFF / PDF images
-        # using OCR.
-        text_boxes_texts = []
-        for shape in doc.Shapes:
-            # Check if there is textboxs
-            if shape.Type == 17:  # 17 represents a textbox shape
-                # Extract text from the textbox
-                text = shape.TextFrame.TextRange.Text
-                text_boxes_texts.append(text)
-        filtered_text=[w for w in text_boxes_texts if w.strip()]
-        if len(filtered_text)>0:
-            output_text=output_text+ " " +'\n'.join([ t for t in text_boxes_texts if len(t.strip())>0])        
-        doc.Close(False)    
-        self.log.info(f"\t{len(output_text.split())} words on doc")
-        #word_application.Quit()    
-        if len(output_text.strip())==0:
-            self.log.info("No text found in documet")
-            return
-        output_path=os.path.join(os.getcwd(), f"{source_name}_extracted_texts", f"{file_path}.txt")
-        with open(output_path, "w", encoding="utf-8") as _fout:
-            _fout.write(output_text)
-        
-        return
-
-    def open_word_doc(self, source_name, file_path):
-        try:
-            #file_path=f"19_cs_bg_325715.doc"
-            document_path = os.path.join(os.getcwd(), f"{source_name}_docs", file_path)
-            doc = word_application.Documents.Open(document_path, ReadOnly=True)
-            
-            return doc
-        except Exception as err:
-            log.exception(err)
-            self.add_doc_to_corrupted_docs_list(file_path)
-            self.init_word_app()
-        return None
-        
+        # File to extract, to other files of identical content
+        handled_files={}
+        # Content hash of file to extract
+        hashes={}
+        for file_name in file_names:
+            if not self.extraction_engine.can_extract(file_name):
+                self.log.info("This file type is not handled")
+                yield file_name, None
+                continue
+            sha256=self.blob_store.get_hash(source_name, file_name) if self.blob_store else None
+            if sha256 is None:
+                handled_files[file_name]=[]
+                continue
+            text_status, output_text=self.blob_store.get_text(sha256)
+            if text_status is not None:
+                self.log.info(f"Text of {file_name} extracted before from identical document")
+                get_metrics().inc("extractions_deduplicated")
+                self.text_extracted(source_name, file_name, output_text)
+                yield file_name, None
+            elif sha256 in hashes:
+                handled_files[hashes[sha256]].append(file_name)
+            else:
+                hashes[sha256]=file_name
+                handled_files[file_name]=[]
+        file_hashes={file_name:sha256 for sha256, file_name in hashes.items()}
+        doc_paths=[os.path.join(f"{source_name}_docs", file_name) for file_name in handled_files]
+        for doc_path, output_text, err in self.extraction_engine.extract_texts(doc_paths):
+            file_name=os.path.basename(doc_path)
+            if err is not None:
+                self.log.info(f"Failed to extract {file_name}: {err}")
+                for _file_name in [file_name, *handled_files[file_name]]:
+                    self.add_doc_to_corrupted_docs_list(_file_name, source_name)
+                    yield _file_name, err
+                continue
+            for _file_name in [file_name, *handled_files[file_name]]:
+                self.text_extracted(source_name, _file_name, output_text)
+                yield _file_name, None
+            # Text saved for the document is reused by identical ones
+            if file_name in file_hashes:
+                self.blob_store.save_text(file_hashes[file_name], output_text, source_name, file_name)
+
+    def text_extracted(self, source_name:str, file_name:str, output_text:str):
+        if save_extracted_text(source_name, file_name, output_text):
+            self.manifest.mark(source_name, file_name, EXTRACTED)
+        else:
+            self.manifest.mark(source_name, file_name, NO_TEXT)
+        self.log.info("Document's text successfuly extracted")
 
-    def init_word_app(self):
-        # Main object to open MS WORD docs with
-        global word_application
-        word_application = win32com.client.gencache.EnsureDispatch('Word.Application')   
-        # Avoid actualy open the docs- all work should be done in the background
-        word_application.Visible=False
-
-        # This cal init word with late binding, the code above int early binding
-        # word_application = win32com.client.Dispatch('Word.Application')
-
-    def add_doc_to_corrupted_docs_list(self, file_path):
-        _df=pd.read_csv(config.corrupted_docs_log)
-        new_df=pd.DataFrame([{"doc_name":file_path}])
-        _df2=pd.concat([_df, new_df])
-        _df2.to_csv(config.corrupted_docs_log, index=False)
+    def add_doc_to_corrupted_docs_list(self, file_path, source_name:str=""):
+        self.manifest.mark(source_name, file_path, CORRUPTED)
+        self.corrupted_docs_log.append([{"doc_name":file_path, "source":source_name}])
         return
 
     def log_erros(self, errors_list):
-        _file="errors_list.csv"
-        new_df=pd.DataFrame(errors_list)
-        old_df=pd.read_csv(_file)
-        merged_df=pd.concat([new_df, old_df])
-        merged_df.to_csv(_file, index=False)
+        self.errors_log.append(errors_list)
         return
+
+    def close(self):
+        self.extraction_engine.close()
+        self.manifest.close()
+        self.checkpoint.close()
+        if self.blob_store is not None:
+            self.blob_store.close()
+        close_text_shard_store()
+        close_text_search_index()
+        self.close_logs()
+        get_metrics().stop_exporter()
+
+    def close_logs(self):
+        for record_log in [self.errors_log, self.corrupted_docs_log, *self.documents_logs.values()]:
+            record_log.close()
         
 
     def mkdir_per_source(self, source:str):
@@ -331,21 +610,52 @@ class DownloadKnessetCorpus():
             os.makedirs(f"{source}_extracted_texts")
 
     
-    def save_response_json(self, response:requests.Response, source_name:str, url:str):
-
-        json_obj=json.dumps( response.json())
-        _name=response.json()["odata.nextLink"].replace("?$skiptoken=", "_")
+    def save_response_json(self, page:dict, source_name:str):
+        """
+        Save page to configured sinks, returns JSON file path,
+        None if pages are not saved as JSON.
+        """
+        _name=page_file_name(source_name, page.get("odata.nextLink"), self.walk_ids.get(source_name))
+        if "parquet" in config.odata_pages_sink:
+            self.page_store.append_page(source_name, page, _name)
+        if "json" not in config.odata_pages_sink:
+            return None
+        # Page is read back on resume, hence written atomically
         _file=os.path.join(config.jsons_dir, f"{_name}.json")
-        with open(_file, "w") as output_file:
-            output_file.write(json_obj)
-        return
+        with span("page_write"):
+            atomic_write_json(_file, page, indent=None)
+        return _file
 
 if __name__=='__main__':
+    parser=argparse.ArgumentParser(description="Download Knesset documents corpus")
+    parser.add_argument("--incremental", action="store_true",
+        help="Download only records updated since last run")
+    parser.add_argument("--resume", action="store_true",
+        help="Continue each source from where previous run stopped")
+    parser.add_argument("--engine", choices=["sync", "async"], default=config.download_engine,
+        help="Requests engine, 'async' requires aiohttp")
+    selective=parser.add_argument_group("Selective crawl", "Download only documents matching all given filters")
+    selective.add_argument("--knesset", nargs="+", type=int, help="Knesset numbers")
+    selective.add_argument("--date-from", help=f"ISO date, of {config.crawl_date_field}")
+    selective.add_argument("--date-to", help="ISO date, inclusive")
+    selective.add_argument("--sources", nargs="+", choices=config.datasets_sources)
+    selective.add_argument("--formats", nargs="+", help="File formats, like doc docx")
+    selective.add_argument("--priority", choices=["newest", "given"], default="newest",
+        help="Crawl newest Knesset first, or Knessets in given order")
+    args=parser.parse_args()
+
     log=configure_logger('default')
     log.info("Program start")
 
-    dkc=DownloadKnessetCorpus()
-    dkc.run()
+    plan=None
+    if args.knesset or args.date_from or args.date_to or args.sources or args.formats:
+        plan=CrawlPlanner(args.sources, args.knesset, args.date_from, args.date_to, args.formats, args.priority)
+    dkc=DownloadKnessetCorpus(incremental=args.incremental, resume=args.resume, plan=plan)
+    if args.engine=="async":
+        from async_odata_engine import AsyncCorpusEngine
+        AsyncCorpusEngine(dkc).run()
+    else:
+        dkc.run()
 
     log.info("Program ends")
 
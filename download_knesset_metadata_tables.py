@@ -9,16 +9,23 @@ Author: Amit Shkolnik, amit.shkolnik@gmail.com, 2024
 
 import sys
 import os
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import config
 from config import *
 from logger_configurer import configure_logger
-
-if os.name !='nt':
-    raise Exception("App needs win32com.client package, hence need to run on Windows")
-# Install with 'pip install pywin32'
-import win32com.client
-word_application=None 
+from odata_page_prefetcher import OdataPagePrefetcher
+from odata_query import build_page_url, build_count_url, page_file_name, \
+    listing_query_options, apply_client_paging, walk_id
+from delta_sync import DeltaSyncState
+from crawl_checkpoint import CrawlCheckpoint
+from http_client import get_http_client
+from odata_page_store import OdataPageStore
+from odata_table_registry import OdataTableRegistry
+from crawl_metrics import get_metrics, span
+from file_utils import atomic_write_json
 
 class DownloadMetadataTables():
     """
@@ -26,8 +33,32 @@ class DownloadMetadataTables():
     committees sessions, etc.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, incremental:bool=False, resume:bool=False, all_tables:bool=False) -> None:
+        """
+        Parameters:
+        * incremental: download only records updated since last run.
+        * resume: continue each table from its checkpoint.
+        * all_tables: download all tables discovered on ODATA '$metadata',
+            instead of config.meta_data_tables.
+        """
         self.log=logging.getLogger('default')
+        self.incremental=incremental
+        self.resume=resume
+        self.all_tables=all_tables
+        self.checkpoint=CrawlCheckpoint(config.metadata_checkpoint_file)
+        self.http_client=get_http_client()
+        self.sync_state=DeltaSyncState()
+        self.page_store=OdataPageStore() if "parquet" in config.odata_pages_sink else None
+        self.registry=OdataTableRegistry(self.http_client)
+        self.tables=list(config.meta_data_tables)
+        # Fields ordering '$skip' paging per table, discovered tables only
+        self.key_fields={}
+        # Query options of the walk over each table's pages
+        self.walk_options={}
+        # Id of filtered walk per source, names its pages
+        self.walk_ids={}
+        # Pages, records and seconds per table
+        self.tables_stats={}
 
 
     def run(self):
@@ -35,29 +66,53 @@ class DownloadMetadataTables():
             ######################################################################
             # Main call                                                          #
             ######################################################################    
-            # Skip tokens per source-not to re-iterate all pages, like:
-            # skip_tokens=[ "?$skiptoken=321264L", "?$skiptoken=4099505L",  "?$skiptoken=497312L"]
-            skip_tokens=[None, None, None]
-
-            # Check number of files on each source:
-            for idx, source in enumerate(config.meta_data_tables):
-                _query=f"https://knesset.gov.il/Odata/ParliamentInfo.svc/{source}/$count"
-                _response=requests.get(_query)
-                self.log.info(f"** TOTAL {_response.text} documents on {source} **")
-
-            # Loop between Knesset sources (Plenum, committees, etc)
-            for idx, source in enumerate(config.meta_data_tables):
-                self.mkdir_per_source(source)
-                self.download_dataset(source, skip_token=skip_tokens[idx])
-                continue
-
+            get_metrics().start_exporter()
+            if self.all_tables:
+                self.key_fields=self.resolve_tables()
+                self.tables=list(self.key_fields)
+            # Tables are downloaded in parallel, 1 worker per table,
+            # requests of all workers share the per-host limits.
+            with ThreadPoolExecutor(max_workers=config.metadata_table_workers) as executor:
+                # Check number of files on each source:
+                for source, _response in zip(self.tables, executor.map(self.http_client.get,
+                        [build_count_url(source, self.get_query_options(source)) for source in self.tables])):
+                    self.log.info(f"** TOTAL {_response.text} documents on {source} **")
+                list(executor.map(self.download_table, self.tables))
+            self.log_tables_stats()
             return
 
         except Exception as err:
             self.log.exception(err)
             self.log.info("End run")
+        finally:
+            self.checkpoint.close()
+            get_metrics().stop_exporter()
         return
 
+    def resolve_tables(self)->dict:
+        """
+        Tables discovered on ODATA '$metadata', to fields ordering
+        their '$skip' paging: config.odata_key_fields of the table,
+        or all its key properties.
+        """
+        tables=self.registry.tables()
+        self.log.info(f"{len(tables)} tables to download")
+        return {table:[config.odata_key_fields[table]] if table in config.odata_key_fields
+            else self.registry.key_fields(table) for table in tables}
+
+    def download_table(self, source:str):
+        self.mkdir_per_source(source)
+        if not self.resume:
+            self.checkpoint.reset(source)
+            self.download_dataset(source, skip_token=None)
+            return
+        # Continue table from the page it stopped at
+        checkpoint=self.checkpoint.get(source)
+        if checkpoint["completed"]:
+            self.log.info(f"Source {source} already completed")
+            return
+        self.download_dataset(source, skip_token=checkpoint["page_token"])
+
     def download_dataset(self, source_name, skip_token:str):
         """
         Download documents from 1 source (Plenum, committees, etc),
@@ -67,62 +122,92 @@ class DownloadMetadataTables():
         * skip_token: string, if not None, script skip all 
             pages to the skip_token page.
         """
+        start_time=time.monotonic()
+        self.tables_stats[source_name]={"pages":0, "records":0, "seconds":0}
         try:
             
             # Skip token used for paging between Knesset ODATA API pages.    
             self.log.info(f"Downloading source {source_name}")
+            self.start_walk(source_name)
             rounds=1
-            
-            while True:
+            # Next pages are requested on background while current
+            # page is saved.
+            prefetcher=OdataPagePrefetcher(self.get_metadata_json, source_name, skip_token)
+            for skip_token, page, num_of_docs, url in prefetcher.pages():
                 self.log.info(f"*** ROUND {rounds} ***")        
                 rounds+=1
-                
-                skip_token=self.download_one_json(
-                    source_name, skip_token)                    
-                if not skip_token:
-                    break
+                self.page_done(source_name, page)
         except Exception as err:
-            log.exception(err)
+            self.log.exception(err)
+        finally:
+            self.tables_stats[source_name]["seconds"]=time.monotonic()-start_time
 
-    def download_one_json(self, source_name:str, skip_token:str)->str:    
+    def log_tables_stats(self):
         """
-        Main method to download and extract texts from
-        Knesset ODATA API,
-        Each API page contains -by default- 100 documents' links 
+        Log pages, records and throughput per table.
         """
-        # Call ODATA API
-        response, num_of_docs, url=self.get_metadata_json(source_name,skip_token)    
-        self.save_response_json(response, source_name, url)
-        # something like "KNS_DocumentPlenumSession?$skiptoken=128985L" to move
-        # to next page on ODATA
-        if "odata.nextLink" in response.json():
-            return response.json()["odata.nextLink"]
-        return None
+        stats_df=pd.DataFrame.from_dict(self.tables_stats, orient="index")
+        if len(stats_df)==0:
+            return
+        stats_df["records/sec"]=(stats_df["records"]/stats_df["seconds"].clip(lower=1e-3)).round(1)
+        stats_df["seconds"]=stats_df["seconds"].round(1)
+        self.log.info(f"Tables download summary:\n{stats_df.to_markdown()}")
 
+    def page_done(self, source_name:str, page:dict):
+        """
+        Save page, advance sync state and checkpoint.
+        High-water mark of the walk is stored once its last page is done.
+        """
+        self.save_response_json(page, source_name)
+        if source_name in self.tables_stats:
+            self.tables_stats[source_name]["pages"]+=1
+            self.tables_stats[source_name]["records"]+=len(page["value"])
+        high_water_mark=self.sync_state.update(source_name, page["value"])
+        if not page.get("odata.nextLink"):
+            self.sync_state.walk_done(source_name)
+        self.checkpoint.page_done(source_name, page.get("odata.nextLink"), high_water_mark)
+
+    def start_walk(self, source_name:str):
+        """
+        Fix query options of the walk over table's pages, a resumed walk
+        keeps the options it started with, its '$skip' offsets are relative
+        to them.
+        """
+        checkpoint=self.checkpoint.get(source_name)
+        if checkpoint.get("query_options") is None:
+            self.checkpoint.start_walk(source_name, self.get_query_options(source_name))
+            checkpoint=self.checkpoint.get(source_name)
+        self.walk_options[source_name]=checkpoint["query_options"]
+        # Pages of incremental walks don't overwrite pages of full walks
+        self.walk_ids[source_name]=walk_id(checkpoint["query_options"]) if self.incremental else None
+        self.sync_state.start_walk(source_name, checkpoint.get("high_water_mark"))
+
+    def get_query_options(self, source_name:str)->dict:
+        """
+        ODATA query options of source pages.
+        """
+        options={}
+        # Discovered tables without update time are downloaded whole
+        if self.incremental and (not self.all_tables or
+                self.registry.has_field(source_name, config.delta_sync_field)):
+            options=self.sync_state.query_options(source_name)
+        return listing_query_options(source_name, options, key_fields=self.key_fields.get(source_name))
 
     def get_metadata_json(self, source_name:str, skip_token:str):
         """
         HTTP request to get 1 page from Knesset ODATA.
         """
-        url=f"{config.main_hypelink}{source_name}?${config.odata_download_format}"
-        # Paging through the ODATA
-        if skip_token:
-            token=skip_token.split("?$")[1]
-            url=f"{url}&${token}"
+        url=build_page_url(source_name, skip_token, self.walk_options[source_name])
         self.log.info(f"*** Download main ODATA {url} ***")
-        # Call ODATA API
-        while True:
-            response=requests.get(url=url)    
-            if 'value' not in response.json():
-                self.log.info(f"No 'valeue' key on response.json")
-                self.log.info(response.json())
-                time.sleep(10)
-                continue
-            break
-
-        num_of_obj=len(response.json()['value'])
+        # Call ODATA API, retried with backoff while page has no 'value'
+        with span("list_page"):
+            response, page=self.http_client.get_json(url)
+        page=apply_client_paging(source_name, skip_token, page, self.walk_options[source_name])
+        get_metrics().inc("pages_listed")
+
+        num_of_obj=len(page['value'])
         self.log.info(f"*** {num_of_obj} documents to download ***")
-        return response, num_of_obj, url
+        return page, num_of_obj, url
 
     def mkdir_per_source(self, source:str):
         # Folder to store original docs downloaded from Knesset ODATA
@@ -130,24 +215,41 @@ class DownloadMetadataTables():
             os.makedirs(f"{source}_metadata_jsons")
 
     
-    def save_response_json(self, response:requests.Response, source_name:str, url:str):
+    def save_response_json(self, page:dict, source_name:str):
 
-        json_obj=json.dumps( response.json())
-        if "odata.nextLink" in response.json():
-            _name=response.json()["odata.nextLink"].replace("?$skiptoken=", "_")
-        else:
-            _name="last_json"
+        _name=page_file_name(source_name, page.get("odata.nextLink"), self.walk_ids.get(source_name))
+        if "parquet" in config.odata_pages_sink:
+            self.page_store.append_page(source_name, page, _name)
+        if "json" not in config.odata_pages_sink:
+            return
+        # Page is read back on resume, hence written atomically
         _file=os.path.join(f"{source_name}_metadata_jsons", f"{_name}.json")
-        with open(_file, "w") as output_file:
-            output_file.write(json_obj)
+        with span("page_write"):
+            atomic_write_json(_file, page, indent=None)
         return
 
 if __name__=='__main__':
+    parser=argparse.ArgumentParser(description="Download Knesset metadata tables")
+    parser.add_argument("--incremental", action="store_true",
+        help="Download only records updated since last run")
+    parser.add_argument("--resume", action="store_true",
+        help="Continue each table from where previous run stopped")
+    parser.add_argument("--all-tables", action="store_true",
+        help="Download all tables discovered on ODATA $metadata")
+    parser.add_argument("--engine", choices=["sync", "async"], default=config.download_engine,
+        help="Requests engine, 'async' requires aiohttp")
+    args=parser.parse_args()
+
     log=configure_logger('default')
     log.info("Program start")
 
-    dmt=DownloadMetadataTables()
-    dmt.run()
+    dmt=DownloadMetadataTables(incremental=args.incremental, resume=args.resume,
+        all_tables=args.all_tables)
+    if args.engine=="async":
+        from async_odata_engine import AsyncMetadataEngine
+        AsyncMetadataEngine(dmt).run()
+    else:
+        dmt.run()
 
     log.info("Program ends")
 
@@ -0,0 +1,52 @@
+'''
+Script export the append only JSONL logs to the CSV logs formats:
+* '{source}_docs_download_log.txt' per source
+* errors list
+* corrupted documents list
+On the records order CSV logs were written.
+'''
+
+import sys
+import os
+
+import config
+from config import *
+from logger_configurer import configure_logger
+from record_log import records_to_df
+
+
+class ExportRecordLogs():
+
+    def __init__(self) -> None:
+        self.log=logging.getLogger('default')
+
+    def run(self):
+        for source in config.datasets_sources:
+            self.export(f"{source}_docs_download_log.jsonl", f"{source}_docs_download_log.txt")
+        self.export(config.errors_record_log, config.errors_log)
+        # Corrupted documents were appended to end of CSV
+        self.export(config.corrupted_docs_record_log, config.corrupted_docs_log, columns=["doc_name"],
+            latest_first=False)
+
+    def export(self, jsonl_path:str, csv_path:str, columns:list=None, latest_first:bool=True):
+        if not os.path.exists(jsonl_path):
+            self.log.info(f"No {jsonl_path} to export")
+            return
+        _df=records_to_df(jsonl_path, latest_first)
+        if columns is not None and len(_df)>0:
+            _df=_df[columns]
+        # Written aside and renamed, CSV is complete even if export is interrupted
+        tmp_path=f"{csv_path}.tmp"
+        _df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, csv_path)
+        self.log.info(f"{len(_df)} records exported from {jsonl_path} to {csv_path}")
+
+
+if __name__=='__main__':
+    log=configure_logger('default')
+    log.info("Program start")
+
+    erl=ExportRecordLogs()
+    erl.run()
+
+    log.info("Program ends")
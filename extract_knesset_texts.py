@@ -0,0 +1,138 @@
+'''
+Script extract texts of Knesset documents previously downloaded
+to '{source}_docs' folders, no network needed.
+Only documents without extracted text, or with text older than
+the document, are extracted.
+'''
+
+import sys
+import os
+import argparse
+
+import config
+from config import *
+from logger_configurer import configure_logger
+from text_extractors import ExtractionEngine, save_extracted_text
+from text_shard_store import get_text_shard_store, close_text_shard_store
+from text_search_index import close_text_search_index
+from docs_manifest import DocsManifest, EXTRACTED, NO_TEXT, CORRUPTED
+from record_log import JsonlRecordLog
+from crawl_metrics import get_metrics
+
+
+class ExtractKnessetTexts():
+    """
+    Resumable extraction job over downloaded documents folders.
+    """
+
+    def __init__(self, retry_corrupted:bool=False, force:bool=False) -> None:
+        """
+        Parameters:
+        * retry_corrupted: extract documents on corrupted docs list as well.
+        * force: re-extract all documents, even if text is up to date.
+        """
+        self.log=logging.getLogger('default')
+        self.retry_corrupted=retry_corrupted
+        self.force=force
+        self.extraction_engine=ExtractionEngine()
+        self.manifest=DocsManifest()
+        self.corrupted_docs_log=JsonlRecordLog(config.corrupted_docs_record_log,
+            legacy_csv=config.corrupted_docs_log)
+
+    def run(self):
+        get_metrics().start_exporter()
+        try:
+            for source in config.datasets_sources:
+                if not os.path.exists(f"{source}_docs"):
+                    self.log.info(f"No documents folder for {source}")
+                    continue
+                if not os.path.exists(f"{source}_extracted_texts"):
+                    os.makedirs(f"{source}_extracted_texts")
+                self.extract_source(source)
+        except Exception as err:
+            self.log.exception(err)
+        finally:
+            self.extraction_engine.close()
+            self.manifest.close()
+            self.corrupted_docs_log.close()
+            close_text_shard_store()
+            close_text_search_index()
+            get_metrics().stop_exporter()
+        return
+
+    def extract_source(self, source_name:str):
+        file_names=self.get_docs_to_extract(source_name)
+        self.log.info(f"*** {len(file_names)} documents to extract on {source_name} ***")
+        extracted_cnt, failed_cnt=0, 0
+        for batch_start in range(0, len(file_names), config.extraction_batch_size):
+            batch=file_names[batch_start:batch_start+config.extraction_batch_size]
+            doc_paths=[os.path.join(f"{source_name}_docs", file_name) for file_name in batch]
+            for doc_path, output_text, err in self.extraction_engine.extract_texts(doc_paths):
+                file_name=os.path.basename(doc_path)
+                if err is not None:
+                    self.log.info(f"Failed to extract {file_name}: {err}")
+                    self.add_doc_to_corrupted_docs_list(file_name, source_name)
+                    failed_cnt+=1
+                    continue
+                if save_extracted_text(source_name, file_name, output_text):
+                    self.manifest.mark(source_name, file_name, EXTRACTED)
+                else:
+                    self.manifest.mark(source_name, file_name, NO_TEXT)
+                extracted_cnt+=1
+            self.manifest.commit()
+            self.log.info(f"{batch_start+len(batch)}/{len(file_names)} documents processed on {source_name}")
+        self.log.info(f"{source_name}: {extracted_cnt} extracted, {failed_cnt} failed")
+
+    def get_docs_to_extract(self, source_name:str)->list:
+        """
+        Documents missing extracted text, or with text older than
+        the document (document re-downloaded).
+        """
+        self.manifest.seed_source(source_name)
+        texts_mtimes={}
+        with os.scandir(f"{source_name}_extracted_texts") as entries:
+            for entry in entries:
+                if entry.name.endswith(".txt"):
+                    texts_mtimes[entry.name[:-len(".txt")]]=entry.stat().st_mtime
+        if "shards" in config.extracted_texts_output:
+            for doc_name, mtime in get_text_shard_store().text_mtimes(source_name).items():
+                texts_mtimes[doc_name]=max(mtime, texts_mtimes.get(doc_name, mtime))
+
+        file_names=[]
+        with os.scandir(f"{source_name}_docs") as entries:
+            for entry in entries:
+                if not entry.is_file() or not self.extraction_engine.can_extract(entry.name):
+                    continue
+                if not self.retry_corrupted and self.manifest.is_corrupted(entry.name):
+                    continue
+                # Documents found with no text are up to date while not re-downloaded
+                if not self.force and entry.name not in texts_mtimes and \
+                        self.manifest.get_status(source_name, entry.name)==NO_TEXT:
+                    continue
+                if not self.force and entry.name in texts_mtimes and \
+                        texts_mtimes[entry.name]>=entry.stat().st_mtime:
+                    continue
+                file_names.append(entry.name)
+        return sorted(file_names)
+
+    def add_doc_to_corrupted_docs_list(self, file_path, source_name:str=""):
+        self.manifest.mark(source_name, file_path, CORRUPTED)
+        self.corrupted_docs_log.append([{"doc_name":file_path, "source":source_name}])
+        return
+
+
+if __name__=='__main__':
+    parser=argparse.ArgumentParser(description="Extract texts of downloaded Knesset documents")
+    parser.add_argument("--retry-corrupted", action="store_true",
+        help="Extract documents listed as corrupted as well")
+    parser.add_argument("--force", action="store_true",
+        help="Re-extract all documents")
+    args=parser.parse_args()
+
+    log=configure_logger('default')
+    log.info("Program start")
+
+    ekt=ExtractKnessetTexts(retry_corrupted=args.retry_corrupted, force=args.force)
+    ekt.run()
+
+    log.info("Program ends")
@@ -0,0 +1,105 @@
+'''
+Crash safe file writes.
+'''
+import os
+import json
+import time
+import hashlib
+import tempfile
+
+from crawl_metrics import get_metrics, span
+
+
+def atomic_write_json(path:str, obj, indent:int=2):
+    """
+    Write JSON aside, fsync and rename over path,
+    path holds either old or new content, never a partial one.
+    """
+    with span("json_write"):
+        with temp_file_aside(path, ".tmp", "w", encoding="utf-8") as _fout:
+            json.dump(obj, _fout, ensure_ascii=False, indent=indent)
+            _fout.flush()
+            os.fsync(_fout.fileno())
+        os.replace(_fout.name, path)
+
+
+def temp_file_aside(path:str, suffix:str, mode:str="wb", encoding:str=None):
+    """
+    New temporary file on path's folder, named uniquely so concurrent
+    writes of the same path don't share it.
+    """
+    return tempfile.NamedTemporaryFile(mode, encoding=encoding, dir=os.path.dirname(path) or ".",
+        prefix=f"{os.path.basename(path)}.", suffix=suffix, delete=False)
+
+
+class AtomicStreamWriter():
+    """
+    Chunks written to a unique '.part' file aside, fsync'ed and renamed
+    over path on commit. An interrupted write leaves no file on path,
+    concurrent writes of path don't mix their chunks.
+    """
+
+    def __init__(self, path:str, expected_size:int=None, max_size:int=None) -> None:
+        """
+        Parameters:
+        * expected_size: bytes expected, commit fails on a different size.
+        * max_size: write fails once more bytes are written.
+        """
+        self.path=path
+        self.expected_size=expected_size
+        self.max_size=max_size
+        self.size=0
+        self.digest=hashlib.sha256()
+        # Time spent on disk, observed as 1 'doc_write' span on commit
+        self.write_seconds=0.0
+        self._file=temp_file_aside(path, ".part")
+        self.tmp_path=self._file.name
+
+    def write(self, chunk:bytes):
+        if not chunk:
+            return
+        self.size+=len(chunk)
+        if self.max_size is not None and self.size>self.max_size:
+            raise ValueError(f"{self.path} exceeds {self.max_size} bytes")
+        self.digest.update(chunk)
+        start=time.perf_counter()
+        self._file.write(chunk)
+        self.write_seconds+=time.perf_counter()-start
+
+    def commit(self):
+        """
+        Returns (size, sha256) of written content.
+        """
+        start=time.perf_counter()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        get_metrics().observe("doc_write", self.write_seconds+time.perf_counter()-start)
+        if self.expected_size is not None and self.size!=self.expected_size:
+            raise ValueError(f"{self.path} truncated, {self.size} of {self.expected_size} bytes written")
+        os.replace(self.tmp_path, self.path)
+        return self.size, self.digest.hexdigest()
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def atomic_write_stream(path:str, chunks, expected_size:int=None, max_size:int=None):
+    """
+    Write chunks to a unique '.part' file aside, fsync and rename over path.
+    An interrupted write leaves no file on path.
+    Parameters:
+    * expected_size: bytes expected, write fails on a different size.
+    * max_size: write fails once more bytes are written.
+    Returns (size, sha256) of written content.
+    """
+    writer=AtomicStreamWriter(path, expected_size, max_size)
+    try:
+        for chunk in chunks:
+            writer.write(chunk)
+        return writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
@@ -0,0 +1,67 @@
+'''
+Per-host politeness limits for concurrent downloads from Knesset servers.
+'''
+import threading
+import time
+from urllib.parse import urlparse
+from contextlib import contextmanager
+
+import config
+
+
+class HostRateLimiter():
+    """
+    Bound the number of in-flight requests per host and keep a minimal
+    interval between consecutive requests to the same host.
+    Shared between all download workers.
+    """
+
+    def __init__(self, max_connections_per_host:int=None, min_interval:float=None) -> None:
+        if max_connections_per_host is None:
+            max_connections_per_host=config.max_connections_per_host
+        if min_interval is None:
+            min_interval=config.min_request_interval_per_host
+        self.max_connections_per_host=max_connections_per_host
+        self.min_interval=min_interval
+        self._lock=threading.Lock()
+        self._semaphores={}
+        self._next_slot={}
+
+    @contextmanager
+    def limit(self, url:str):
+        """
+        Context manager wrapping one request to url's host.
+        """
+        self.acquire(url)
+        try:
+            yield
+        finally:
+            self.release(url)
+
+    def acquire(self, url:str):
+        """
+        Take a request slot of url's host, held until release(url).
+        """
+        host=urlparse(url).netloc
+        self._get_semaphore(host).acquire()
+        self._wait_for_slot(host)
+
+    def release(self, url:str):
+        self._get_semaphore(urlparse(url).netloc).release()
+
+    def _get_semaphore(self, host:str):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host]=threading.BoundedSemaphore(
+                    self.max_connections_per_host)
+            return self._semaphores[host]
+
+    def _wait_for_slot(self, host:str):
+        # Reserve the next free time slot of the host, then sleep until it.
+        with self._lock:
+            now=time.monotonic()
+            slot=max(now, self._next_slot.get(host, now))
+            self._next_slot[host]=slot+self.min_interval
+        delay=slot-now
+        if delay>0:
+            time.sleep(delay)
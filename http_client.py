@@ -0,0 +1,156 @@
+'''
+Pooled HTTP client shared by ODATA listing and document downloads.
+'''
+import time
+import random
+import logging
+import threading
+import datetime
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+from host_rate_limiter import HostRateLimiter
+from crawl_metrics import get_metrics
+
+
+# Statuses worth another try
+RETRY_STATUSES=(429, 500, 502, 503, 504)
+
+
+def backoff_delay(attempt:int)->float:
+    # Full jitter: uniform on [0, base*2^attempt], capped
+    return random.uniform(0, min(config.http_backoff_max, config.http_backoff_base*2**attempt))
+
+
+def retry_after_delay(headers)->float:
+    """
+    Delay asked by 'Retry-After' header (seconds or HTTP date), capped,
+    None if missing or malformed.
+    """
+    retry_after=headers.get("Retry-After")
+    if not retry_after:
+        return None
+    try:
+        delay=float(retry_after)
+    except ValueError:
+        try:
+            retry_at=parsedate_to_datetime(retry_after)
+            delay=(retry_at-datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(delay, 0), config.http_backoff_max)
+
+
+class HttpClient():
+    """
+    requests.Session with keep-alive connection pool, per-host limits,
+    timeouts and bounded exponential backoff retries with jitter,
+    honoring 'Retry-After' of the server.
+    """
+
+    def __init__(self, rate_limiter:HostRateLimiter=None, max_retries:int=None, timeout:tuple=None) -> None:
+        self.log=logging.getLogger('default')
+        self.rate_limiter=rate_limiter if rate_limiter is not None else HostRateLimiter()
+        self.max_retries=max_retries if max_retries is not None else config.http_max_retries
+        self.timeout=timeout if timeout is not None else config.http_timeout
+        self.session=requests.Session()
+        adapter=HTTPAdapter(pool_connections=config.http_pool_connections,
+            pool_maxsize=config.http_pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url:str, stream:bool=False, headers:dict=None, hold_slot:bool=False)->requests.Response:
+        """
+        GET with retries on connection errors, timeouts and retryable statuses.
+        Returns the last response once retries are exhausted,
+        raises the last connection error.
+        With hold_slot, host's slot of the returned response is released
+        by the caller, use stream() to read a streamed body.
+        """
+        for attempt in range(self.max_retries+1):
+            self.rate_limiter.acquire(url)
+            held=False
+            try:
+                response=self.session.get(url, stream=stream, headers=headers, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUSES or attempt==self.max_retries:
+                    held=hold_slot
+                    return response
+                get_metrics().inc("http_retries")
+                delay=self.retry_after_delay(response)
+                if delay is None:
+                    delay=self.backoff_delay(attempt)
+                self.log.info(f"Status {response.status_code} on {url}, retry in {delay:.1f} seconds")
+                response.close()
+            except (requests.ConnectionError, requests.Timeout) as err:
+                if attempt==self.max_retries:
+                    raise
+                get_metrics().inc("http_retries")
+                delay=self.backoff_delay(attempt)
+                self.log.info(f"{type(err).__name__} on {url}, retry in {delay:.1f} seconds")
+            finally:
+                if not held:
+                    self.rate_limiter.release(url)
+            time.sleep(delay)
+
+    @contextmanager
+    def stream(self, url:str, headers:dict=None):
+        """
+        Context manager of a streamed GET response, the host's slot is
+        held until the body is read and the response closed, so per-host
+        limits bound concurrent downloads, not only their headers.
+        """
+        response=self.get(url, stream=True, headers=headers, hold_slot=True)
+        try:
+            yield response
+        finally:
+            response.close()
+            self.rate_limiter.release(url)
+
+    def get_json(self, url:str, required_key:str="value"):
+        """
+        GET ODATA JSON, retried while the response lacks required_key.
+        Returns (response, parsed JSON).
+        """
+        for attempt in range(self.max_retries+1):
+            response=self.get(url)
+            try:
+                json_obj=response.json()
+            except ValueError:
+                json_obj={}
+            if required_key in json_obj:
+                return response, json_obj
+            if attempt==self.max_retries:
+                break
+            delay=self.backoff_delay(attempt)
+            self.log.info(f"No '{required_key}' key on response.json, retry in {delay:.1f} seconds")
+            self.log.info(response.text[:1000])
+            time.sleep(delay)
+        raise ValueError(f"No '{required_key}' key on response of {url}, status {response.status_code}")
+
+    def backoff_delay(self, attempt:int)->float:
+        return backoff_delay(attempt)
+
+    def retry_after_delay(self, response:requests.Response)->float:
+        return retry_after_delay(response.headers)
+
+    def close(self):
+        self.session.close()
+
+
+_http_client=None
+_http_client_lock=threading.Lock()
+
+
+def get_http_client()->HttpClient:
+    """
+    Client shared by all downloaders and threads of the process.
+    """
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client=HttpClient()
+        return _http_client
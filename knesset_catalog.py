@@ -0,0 +1,273 @@
+'''
+Local catalog of downloaded ODATA records: a SQLite table per entity
+(documents sources and metadata tables), keyed and indexed on their
+foreign keys, and a 'documents' view joining each document to its
+session, committee or bill and its Knesset number:
+* KNS_DocumentPlenumSession -> KNS_PlenumSession
+* KNS_DocumentCommitteeSession -> KNS_CommitteeSession -> KNS_Committee
+* KNS_DocumentBill -> KNS_Bill
+Pages are loaded once, only pages saved since last load are read again.
+Script loads saved pages into the catalog.
+'''
+import os
+import json
+import logging
+import sqlite3
+import argparse
+
+import pandas as pd
+
+import config
+from logger_configurer import configure_logger
+from odata_page_store import OdataPageStore, PAGE_COLUMN
+from knesset_numbers import knesset_num_of, FILE_PATH_KNESSET
+
+
+# Columns added to documents records, name of document's file and
+# Knesset number of its FilePath
+DOC_NAME_COLUMN="_doc_name"
+PATH_KNESSET_COLUMN="_path_knesset_num"
+# Columns the 'documents' view reads, per entity
+VIEW_COLUMNS={
+    config.plenum_session_ref: ["DocumentPlenumSessionID", "PlenumSessionID", "GroupTypeDesc", "FilePath",
+        DOC_NAME_COLUMN, PATH_KNESSET_COLUMN],
+    config.committees_sessions: ["DocumentCommitteeSessionID", "CommitteeSessionID", "GroupTypeDesc", "FilePath",
+        DOC_NAME_COLUMN, PATH_KNESSET_COLUMN],
+    config.bills: ["DocumentBillID", "BillID", "GroupTypeDesc", "FilePath", DOC_NAME_COLUMN, PATH_KNESSET_COLUMN],
+    config.plenum_session: ["PlenumSessionID", "KnessetNum", "Name", "StartDate"],
+    config.committee_session: ["CommitteeSessionID", "CommitteeID", "KnessetNum", "StartDate"],
+    config.knesset_committies: ["CommitteeID", "Name", "KnessetNum"],
+    config.knesset_bills: ["BillID", "KnessetNum", "Name", "PublicationDate"],
+}
+DOCUMENTS_VIEW=f"""CREATE VIEW documents AS
+    SELECT '{config.plenum_session_ref}' AS source, d.DocumentPlenumSessionID AS document_id,
+        d.{DOC_NAME_COLUMN} AS doc_name, d.FilePath AS file_path, d.GroupTypeDesc AS group_type,
+        'plenum' AS session_type, d.PlenumSessionID AS session_id, s.Name AS session_name,
+        s.StartDate AS session_date, NULL AS committee_id, NULL AS committee_name, NULL AS bill_id,
+        COALESCE(s.KnessetNum, d.{PATH_KNESSET_COLUMN}) AS knesset_num
+    FROM "{config.plenum_session_ref}" d
+    LEFT JOIN "{config.plenum_session}" s ON s.PlenumSessionID=d.PlenumSessionID
+    UNION ALL
+    SELECT '{config.committees_sessions}', d.DocumentCommitteeSessionID,
+        d.{DOC_NAME_COLUMN}, d.FilePath, d.GroupTypeDesc,
+        'committee', d.CommitteeSessionID, NULL,
+        cs.StartDate, cs.CommitteeID, c.Name, NULL,
+        COALESCE(cs.KnessetNum, c.KnessetNum, d.{PATH_KNESSET_COLUMN})
+    FROM "{config.committees_sessions}" d
+    LEFT JOIN "{config.committee_session}" cs ON cs.CommitteeSessionID=d.CommitteeSessionID
+    LEFT JOIN "{config.knesset_committies}" c ON c.CommitteeID=cs.CommitteeID
+    UNION ALL
+    SELECT '{config.bills}', d.DocumentBillID,
+        d.{DOC_NAME_COLUMN}, d.FilePath, d.GroupTypeDesc,
+        'bill', NULL, b.Name,
+        b.PublicationDate, NULL, NULL, d.BillID,
+        COALESCE(b.KnessetNum, d.{PATH_KNESSET_COLUMN})
+    FROM "{config.bills}" d
+    LEFT JOIN "{config.knesset_bills}" b ON b.BillID=d.BillID"""
+
+
+def column_type(column:str)->str:
+    # Keys are integers, stored as text by the Parquet pages store or by ODATA itself
+    # ('DocumentPlenumSessionID'), INTEGER affinity makes joins match
+    if column.endswith("ID") or column in ("KnessetNum", "Number", PATH_KNESSET_COLUMN):
+        return "INTEGER"
+    return ""
+
+
+class KnessetCatalog():
+    """
+    Records are upserted by their ODATA key (config.odata_key_fields,
+    else first '...ID' field), columns are added as new fields appear.
+    """
+
+    def __init__(self, catalog_file:str=None) -> None:
+        self.log=logging.getLogger('default')
+        self.catalog_file=catalog_file if catalog_file is not None else config.knesset_catalog_file
+        self.conn=sqlite3.connect(self.catalog_file)
+        self.conn.row_factory=sqlite3.Row
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS loaded_pages (
+            page TEXT PRIMARY KEY,
+            mtime REAL NOT NULL)""")
+        self.conn.commit()
+        # Entity to its columns
+        self.columns={}
+        for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'KNS_%'"):
+            self.columns[row[0]]=[info[1] for info in self.conn.execute(f'PRAGMA table_info("{row[0]}")')]
+        self.ensure_documents_view()
+
+    def ensure_table(self, entity:str, columns:list):
+        """
+        Create entity's table, or add its missing columns, with indexes
+        on key fields.
+        """
+        if entity not in self.columns:
+            key_field=config.odata_key_fields.get(entity) or next(
+                (column for column in columns if column.endswith("ID")), None)
+            definitions=[f'"{column}" {column_type(column)}'.strip()+(" PRIMARY KEY" if column==key_field else "")
+                for column in columns]
+            self.conn.execute(f'CREATE TABLE "{entity}" ({", ".join(definitions)})')
+            self.columns[entity]=list(columns)
+            new_columns=columns
+        else:
+            new_columns=[column for column in columns if column not in self.columns[entity]]
+            for column in new_columns:
+                self.conn.execute(f'ALTER TABLE "{entity}" ADD COLUMN "{column}" {column_type(column)}')
+                self.columns[entity].append(column)
+        for column in new_columns:
+            if column_type(column)=="INTEGER" or column==DOC_NAME_COLUMN:
+                self.conn.execute(f'CREATE INDEX IF NOT EXISTS "{entity}_{column}" ON "{entity}" ("{column}")')
+
+    def ensure_documents_view(self):
+        # Tables not loaded yet are created empty, view joins all of them
+        for entity, columns in VIEW_COLUMNS.items():
+            self.ensure_table(entity, columns)
+        self.conn.execute("DROP VIEW IF EXISTS documents")
+        self.conn.execute(DOCUMENTS_VIEW)
+        self.conn.commit()
+
+    def add_records(self, entity:str, records:list):
+        """
+        Upsert ODATA records of entity.
+        """
+        if len(records)==0:
+            return
+        if entity in config.datasets_sources:
+            for record in records:
+                file_path=record.get("FilePath") or ""
+                record[DOC_NAME_COLUMN]=file_path.split("/")[-1]
+                record[PATH_KNESSET_COLUMN]=knesset_num_of(FILE_PATH_KNESSET, file_path)
+        columns=list(dict.fromkeys(key for record in records for key in record if key!=PAGE_COLUMN))
+        self.ensure_table(entity, columns)
+        quoted=", ".join(f'"{column}"' for column in columns)
+        self.conn.executemany(f'INSERT OR REPLACE INTO "{entity}" ({quoted}) VALUES ({", ".join("?"*len(columns))})',
+            [[self.to_value(record.get(column)) for column in columns] for record in records])
+
+    def to_value(self, value):
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, ensure_ascii=False)
+        return value
+
+    def load(self, refresh:bool=False)->int:
+        """
+        Load pages saved by the downloaders, pages loaded before and
+        not saved since are skipped unless refresh.
+        Returns number of pages loaded.
+        """
+        loaded={row["page"]:row["mtime"] for row in self.conn.execute("SELECT page, mtime FROM loaded_pages")}
+        cnt=0
+        for page_file, read_page in self.iter_pages():
+            mtime=os.path.getmtime(page_file)
+            if not refresh and loaded.get(page_file)==mtime:
+                continue
+            entity, records=read_page()
+            if entity is None:
+                continue
+            self.add_records(entity, records)
+            self.conn.execute("INSERT OR REPLACE INTO loaded_pages VALUES (?, ?)", (page_file, mtime))
+            cnt+=1
+            if cnt%500==0:
+                self.conn.commit()
+                self.log.info(f"{cnt} pages loaded to catalog")
+        self.conn.commit()
+        self.log.info(f"{cnt} pages loaded to {self.catalog_file}")
+        return cnt
+
+    def iter_pages(self):
+        """
+        Yield (page_file, read_page) of saved pages, read_page() returns
+        (entity, records), entity is None for a file not an ODATA page.
+        Pages are read only when loaded.
+        """
+        if "parquet" in config.odata_pages_sink:
+            store=OdataPageStore()
+            for source_name in store.sources():
+                for page_file in store.page_files(source_name):
+                    yield page_file, lambda source_name=source_name, page_file=page_file: (source_name,
+                        store.pa.parquet.read_table(page_file).drop_columns([PAGE_COLUMN]).to_pylist())
+            return
+        json_dirs=[config.jsons_dir]+[_dir for _dir in sorted(os.listdir(".")) if _dir.endswith("_metadata_jsons")]
+        for json_dir in json_dirs:
+            if not os.path.isdir(json_dir):
+                continue
+            for _file in sorted(os.listdir(json_dir)):
+                if not _file.endswith(".json"):
+                    continue
+                page_file=os.path.join(json_dir, _file)
+                yield page_file, lambda page_file=page_file: self.read_json_page(page_file)
+
+    def read_json_page(self, page_file:str):
+        with open(page_file, "r", encoding="utf-8") as _fin:
+            page=json.load(_fin)
+        if "value" not in page or "odata.metadata" not in page:
+            return None, []
+        return page["odata.metadata"].split("$metadata#")[1].split("&")[0], page["value"]
+
+    def document(self, doc_name:str, source_name:str=None)->dict:
+        """
+        Document joined to its session, committee or bill,
+        by its file name, None if not on catalog.
+        """
+        sql="SELECT * FROM documents WHERE doc_name=?"
+        params=[doc_name]
+        if source_name is not None:
+            sql+=" AND source=?"
+            params.append(source_name)
+        row=self.conn.execute(sql, params).fetchone()
+        return dict(row) if row is not None else None
+
+    def documents(self, sources:list=None, knesset_nums:list=None, committee_ids:list=None,
+            date_from:str=None, date_to:str=None)->pd.DataFrame:
+        """
+        Documents joined to their session, committee or bill, filtered.
+        Parameters:
+        * date_from, date_to: ISO dates, inclusive, of session start
+            (publication for bills).
+        """
+        conditions=[]
+        params=[]
+        for column, values in [("source", sources), ("knesset_num", knesset_nums),
+                ("committee_id", committee_ids)]:
+            if values:
+                conditions.append(f"{column} IN ({','.join('?'*len(values))})")
+                params.extend(values)
+        if date_from:
+            conditions.append("substr(session_date, 1, 10)>=?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("substr(session_date, 1, 10)<=?")
+            params.append(date_to)
+        sql="SELECT * FROM documents"+(" WHERE "+" AND ".join(conditions) if conditions else "")
+        return self.query(sql, params)
+
+    def knesset_nums(self, source_name:str)->dict:
+        """
+        Document file name to its Knesset number, of source.
+        """
+        return {row[0]:row[1] for row in self.conn.execute(
+            "SELECT doc_name, knesset_num FROM documents WHERE source=? AND knesset_num IS NOT NULL",
+            (source_name,))}
+
+    def query(self, sql:str, params:list=None)->pd.DataFrame:
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+if __name__=='__main__':
+    parser=argparse.ArgumentParser(description="Load saved ODATA pages into the local catalog")
+    parser.add_argument("--refresh", action="store_true", help="Load all pages again")
+    args=parser.parse_args()
+
+    log=configure_logger('default')
+    log.info("Program start")
+
+    catalog=KnessetCatalog()
+    catalog.load(args.refresh)
+    counts=catalog.query("SELECT source, COUNT(*) AS documents, COUNT(session_date) AS joined, "
+        "COUNT(DISTINCT knesset_num) AS knessets FROM documents GROUP BY source")
+    log.info(f"Catalog documents:\n{counts.to_string(index=False)}")
+    catalog.close()
+
+    log.info("Program ends")
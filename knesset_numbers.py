@@ -0,0 +1,21 @@
+'''
+Knesset number of documents, from their ODATA FilePath or file name.
+'''
+import re
+
+
+# Documents FilePath like 'https://fs.knesset.gov.il//16/Plenum/16_ptm_128870.doc'
+FILE_PATH_KNESSET=re.compile(r"//(\d+)/")
+# Documents names are like '16_ptm_128870.doc', Knesset number first
+DOC_NAME_KNESSET=re.compile(r"^(\d+)_")
+
+
+def knesset_num_of(pattern:re.Pattern, value:str):
+    """
+    Knesset number matched by pattern in value, None if not matched
+    or not a Knesset number (like a year).
+    """
+    match=pattern.search(value or "")
+    if match is None or int(match.group(1))>=50:
+        return None
+    return int(match.group(1))
@@ -0,0 +1,413 @@
+'''
+Local stand-in of Knesset ODATA and files servers, to run the
+downloaders without network:
+* ODATA pages of given records, '$skiptoken' server paging or '$top'/'$skip'.
+* '$count' of records.
+* '$metadata' EDMX of the tables, key is the first '...ID' field.
+* Documents content, with 'ETag' honoring 'If-None-Match'.
+* '$filter' comparisons (eq, ne, gt, ge, lt, le) of fields to datetime,
+    number, string and null literals, with and, or, not, parentheses,
+    endswith, startswith and substringof.
+* '$orderby' of fields, ascending, nulls first.
+Other query options ($select, other '$filter' functions) are ignored.
+Network conditions are injected by a profile: latency, failures,
+throttling, dropped connections and bandwidth.
+Script serves pages saved on jsons_dir and documents of '{source}_docs'
+folders, with the profile named by its argument, and logs the URL to
+set as main_hypelink on config.py.
+'''
+import os
+import sys
+import json
+import time
+import random
+import re
+import hashlib
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qsl
+
+import config
+from logger_configurer import configure_logger
+
+
+ODATA_PATH="/Odata/ParliamentInfo.svc/"
+FILES_PATH="/fs/"
+# Documents server of Knesset, FilePath of records is under it
+KNESSET_FILES_URL="https://fs.knesset.gov.il/"
+
+# Injected network conditions by name:
+# * latency, jitter: seconds before responding, latency +- uniform jitter.
+# * failure_rate: fraction of requests answered 503.
+# * throttle_rate: fraction of requests answered 429 with 'Retry-After'.
+# * disconnect_rate: fraction of connections dropped with no response.
+# * bytes_per_sec: documents bandwidth.
+PROFILES={
+    "none": {},
+    "lan": {"latency":0.002},
+    "wan": {"latency":0.08, "jitter":0.04, "bytes_per_sec":5*1024**2},
+    "flaky": {"latency":0.05, "jitter":0.02, "failure_rate":0.1, "disconnect_rate":0.02},
+    "throttled": {"latency":0.05, "throttle_rate":0.2},
+}
+# Bytes written at once on bandwidth limited responses
+WRITE_CHUNK_SIZE=64*1024
+# Tokens of '$filter' expressions: literals, names, parentheses and commas
+FILTER_TOKEN=re.compile(r"\s*(datetime'[^']*'|'(?:[^']|'')*'|-?\d+(?:\.\d+)?L?|\(|\)|,|[\w/.]+)")
+NUMBER_LITERAL=re.compile(r"-?\d+(?:\.\d+)?L?")
+# Ordering comparisons of null are false, ISO timestamps compare as strings
+COMPARISON_OPERATORS={
+    "eq": lambda value, literal: value==literal,
+    "ne": lambda value, literal: value!=literal,
+    "ge": lambda value, literal: value is not None and literal is not None and value>=literal,
+    "gt": lambda value, literal: value is not None and literal is not None and value>literal,
+    "le": lambda value, literal: value is not None and literal is not None and value<=literal,
+    "lt": lambda value, literal: value is not None and literal is not None and value<literal,
+}
+FILTER_FUNCTIONS={
+    "endswith": lambda value, suffix: str(value or "").endswith(suffix),
+    "startswith": lambda value, prefix: str(value or "").startswith(prefix),
+    "substringof": lambda substring, value: substring in str(value or ""),
+}
+
+
+class FilterExpression():
+    """
+    '$filter' expression parsed to a predicate of records, unknown
+    functions match all records.
+    """
+
+    def __init__(self, expression:str) -> None:
+        self.tokens=FILTER_TOKEN.findall(expression)
+        self.pos=0
+        self.predicate=self.parse_or() if self.tokens else (lambda record: True)
+        if self.peek() is not None:
+            raise ValueError(f"Unexpected '{self.peek()}' in $filter {expression}")
+
+    def __call__(self, record:dict)->bool:
+        try:
+            return bool(self.predicate(record))
+        except TypeError:
+            # Values of different types don't compare
+            return False
+
+    def peek(self)->str:
+        return self.tokens[self.pos] if self.pos<len(self.tokens) else None
+
+    def take(self, expected:str=None)->str:
+        token=self.peek()
+        if token is None or (expected is not None and token!=expected):
+            raise ValueError(f"Expected '{expected or 'token'}' in $filter, got '{token}'")
+        self.pos+=1
+        return token
+
+    def parse_or(self):
+        operands=[self.parse_and()]
+        while self.peek()=="or":
+            self.take()
+            operands.append(self.parse_and())
+        return lambda record: any(operand(record) for operand in operands)
+
+    def parse_and(self):
+        operands=[self.parse_unary()]
+        while self.peek()=="and":
+            self.take()
+            operands.append(self.parse_unary())
+        return lambda record: all(operand(record) for operand in operands)
+
+    def parse_unary(self):
+        if self.peek()=="not":
+            self.take()
+            operand=self.parse_unary()
+            return lambda record: not operand(record)
+        if self.peek()=="(":
+            self.take()
+            predicate=self.parse_or()
+            self.take(")")
+            return predicate
+        left=self.parse_value()
+        if self.peek() in COMPARISON_OPERATORS:
+            operator=COMPARISON_OPERATORS[self.take()]
+            right=self.parse_value()
+            return lambda record: operator(left(record), right(record))
+        return left
+
+    def parse_value(self):
+        token=self.take()
+        if token.startswith("datetime'"):
+            literal=token[len("datetime'"):-1]
+            return lambda record: literal
+        if token.startswith("'"):
+            literal=token[1:-1].replace("''", "'")
+            return lambda record: literal
+        if NUMBER_LITERAL.fullmatch(token):
+            number=token.rstrip("L")
+            literal=float(number) if "." in number else int(number)
+            return lambda record: literal
+        if token in ("null", "true", "false"):
+            literal={"null":None, "true":True, "false":False}[token]
+            return lambda record: literal
+        if self.peek()=="(":
+            self.take()
+            args=[self.parse_value()]
+            while self.peek()==",":
+                self.take()
+                args.append(self.parse_value())
+            self.take(")")
+            function=FILTER_FUNCTIONS.get(token.lower(), lambda *values: True)
+            return lambda record: function(*[arg(record) for arg in args])
+        return lambda record: record.get(token)
+
+
+class MockOdataServer():
+    """
+    Serves on a background thread, use as context manager or with
+    start() and stop(). Server is bound on creation, so its URLs are
+    known before start.
+    """
+
+    def __init__(self, tables:dict, files:dict=None, page_size:int=100,
+            host:str="127.0.0.1", port:int=0, profile:dict=None, seed:int=None) -> None:
+        """
+        Parameters:
+        * tables: entity set name to list of records.
+        * files: path under FILES_PATH to document bytes or absolute file path.
+        * page_size: records per page of server paging.
+        * port: 0 for any free port.
+        * profile: injected network conditions, like PROFILES values.
+        * seed: random seed of injected failures, for repeatable runs.
+        """
+        self.log=logging.getLogger('default')
+        self.tables=tables
+        self.files=files or {}
+        self.page_size=page_size
+        self.profile=profile or {}
+        self.random=random.Random(seed)
+        # Paths requested, in order
+        self.requests=[]
+        # Responses per status, 0 for dropped connections
+        self.status_counts={}
+        self.bytes_sent=0
+        self._lock=threading.Lock()
+        self.httpd=ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads=True
+        self._thread=None
+
+    @property
+    def base_url(self)->str:
+        host, port=self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def odata_url(self)->str:
+        """
+        URL to set as config.main_hypelink.
+        """
+        return f"{self.base_url}{ODATA_PATH}"
+
+    @property
+    def files_url(self)->str:
+        return f"{self.base_url}{FILES_PATH}"
+
+    @classmethod
+    def from_saved_pages(cls, jsons_dir:str=None, **kwargs):
+        """
+        Server of records on pages saved on jsons_dir, documents found on
+        '{source}_docs' folders are served on their FilePath, rewritten to
+        the server's files URL.
+        """
+        jsons_dir=jsons_dir if jsons_dir is not None else config.jsons_dir
+        tables={}
+        for _file in sorted(os.listdir(jsons_dir)):
+            if not _file.endswith(".json"):
+                continue
+            with open(os.path.join(jsons_dir, _file), "r", encoding="utf-8") as _fin:
+                page=json.load(_fin)
+            source_name=page["odata.metadata"].split("$metadata#")[1].split("&")[0]
+            tables.setdefault(source_name, []).extend(page["value"])
+        server=cls(tables, **kwargs)
+        for source_name, records in tables.items():
+            docs_dir=os.path.abspath(f"{source_name}_docs")
+            for record in records:
+                file_path=record.get("FilePath") or ""
+                if not file_path.startswith(KNESSET_FILES_URL):
+                    continue
+                # Documents missing locally are not found on server as well
+                path=file_path[len(KNESSET_FILES_URL):]
+                doc_path=os.path.join(docs_dir, file_path.split("/")[-1])
+                if os.path.exists(doc_path):
+                    server.files[path]=doc_path
+                record["FilePath"]=f"{server.files_url}{path}"
+        return server
+
+    def start(self):
+        self._thread=threading.Thread(target=self.httpd.serve_forever, name="mock-odata", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _handler_class(self):
+        server=self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.handle_request(self)
+
+            def log_message(self, format, *args):
+                server.log.debug(format%args)
+
+        return Handler
+
+    def handle_request(self, handler:BaseHTTPRequestHandler):
+        with self._lock:
+            self.requests.append(handler.path)
+            draw=self.random.random()
+            delay=self.profile.get("latency", 0)+self.random.uniform(
+                -self.profile.get("jitter", 0), self.profile.get("jitter", 0))
+        if delay>0:
+            time.sleep(delay)
+        # Injected faults, by ranges of 1 random draw
+        for fault in ["failure_rate", "throttle_rate", "disconnect_rate"]:
+            rate=self.profile.get(fault, 0)
+            if draw<rate:
+                return self.inject_fault(handler, fault)
+            draw-=rate
+        parsed=urlparse(handler.path)
+        if parsed.path.startswith(FILES_PATH):
+            return self.send_file(handler, parsed.path[len(FILES_PATH):])
+        if not parsed.path.startswith(ODATA_PATH):
+            return self.send(handler, 404, b"Not found")
+        resource=parsed.path[len(ODATA_PATH):]
+        if resource=="$metadata":
+            return self.send(handler, 200, self.get_metadata(), "application/xml")
+        options=dict(parse_qsl(parsed.query))
+        if resource.endswith("/$count"):
+            if resource[:-len("/$count")] not in self.tables:
+                return self.send(handler, 404, b"Not found")
+            records=self.query_records(resource[:-len("/$count")], options)
+            return self.send(handler, 200, str(len(records)).encode(), "text/plain")
+        if resource not in self.tables:
+            return self.send(handler, 404, b"Not found")
+        return self.send_json(handler, self.get_page(resource, options))
+
+    def query_records(self, source_name:str, options:dict)->list:
+        """
+        Records of source matching '$filter', ordered by '$orderby'.
+        """
+        records=self.tables[source_name]
+        if options.get("$filter"):
+            matches=FilterExpression(options["$filter"])
+            records=[record for record in records if matches(record)]
+        if "$orderby" in options:
+            fields=[field.strip() for field in options["$orderby"].split(",")]
+            # Nulls first, as SQL Server orders them
+            records=sorted(records, key=lambda record: [(1, record[field]) if record.get(field) is not None
+                else (0, "") for field in fields])
+        return records
+
+    def get_page(self, source_name:str, options:dict)->dict:
+        records=self.query_records(source_name, options)
+        page={"odata.metadata":f"{self.odata_url}$metadata#{source_name}"}
+        if "$top" in options or "$skip" in options:
+            # Client paging, server still bounds records per page
+            skip=int(options.get("$skip", 0))
+            top=int(options.get("$top", len(records)))
+            page["value"]=records[skip:skip+min(top, self.page_size)]
+            # Server capped page links to the rest of requested records
+            if top>self.page_size and skip+self.page_size<len(records):
+                page["odata.nextLink"]=f"{source_name}?$top={top-self.page_size}&$skip={skip+self.page_size}"
+            return page
+        start=int(options.get("$skiptoken", "0").rstrip("L"))
+        page["value"]=records[start:start+self.page_size]
+        if start+self.page_size<len(records):
+            page["odata.nextLink"]=f"{source_name}?$skiptoken={start+self.page_size}L"
+        return page
+
+    def inject_fault(self, handler:BaseHTTPRequestHandler, fault:str):
+        if fault=="failure_rate":
+            return self.send(handler, 503, b"Service unavailable")
+        if fault=="throttle_rate":
+            return self.send(handler, 429, b"Too many requests", headers={"Retry-After":"1"})
+        with self._lock:
+            self.status_counts[0]=self.status_counts.get(0, 0)+1
+        handler.close_connection=True
+
+    def get_metadata(self)->bytes:
+        entity_types=[]
+        entity_sets=[]
+        for source_name, records in self.tables.items():
+            fields=list(dict.fromkeys(key for record in records[:100] for key in record))
+            keys=[field for field in fields if field.endswith("ID")][:1]
+            entity_types.append(f'<EntityType Name="{source_name}">'
+                +"".join(f'<Key><PropertyRef Name="{key}"/></Key>' for key in keys)
+                +"".join(f'<Property Name="{field}" Type="Edm.String"/>' for field in fields)
+                +"</EntityType>")
+            entity_sets.append(f'<EntitySet Name="{source_name}" EntityType="ParliamentInfo.{source_name}"/>')
+        return ('<?xml version="1.0" encoding="utf-8"?>'
+            '<edmx:Edmx Version="1.0" xmlns:edmx="http://schemas.microsoft.com/ado/2007/06/edmx">'
+            '<edmx:DataServices><Schema Namespace="ParliamentInfo" '
+            'xmlns="http://schemas.microsoft.com/ado/2009/11/edm">'
+            +"".join(entity_types)
+            +'<EntityContainer Name="ParliamentInfoDb">'+"".join(entity_sets)+'</EntityContainer>'
+            '</Schema></edmx:DataServices></edmx:Edmx>').encode("utf-8")
+
+    def send_file(self, handler:BaseHTTPRequestHandler, path:str):
+        content=self.files.get(path)
+        if content is None:
+            return self.send(handler, 404, b"Not found")
+        if isinstance(content, str):
+            with open(content, "rb") as _fin:
+                content=_fin.read()
+        etag=f'"{hashlib.md5(content).hexdigest()}"'
+        if handler.headers.get("If-None-Match")==etag:
+            return self.send(handler, 304, b"", headers={"ETag":etag})
+        return self.send(handler, 200, content, "application/octet-stream", headers={"ETag":etag})
+
+    def send_json(self, handler:BaseHTTPRequestHandler, obj:dict):
+        return self.send(handler, 200, json.dumps(obj, ensure_ascii=False).encode("utf-8"),
+            "application/json;odata=minimalmetadata;charset=utf-8")
+
+    def send(self, handler:BaseHTTPRequestHandler, status:int, body:bytes, content_type:str="text/plain",
+            headers:dict=None):
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        bytes_per_sec=self.profile.get("bytes_per_sec")
+        if bytes_per_sec and content_type=="application/octet-stream":
+            for offset in range(0, len(body), WRITE_CHUNK_SIZE):
+                handler.wfile.write(body[offset:offset+WRITE_CHUNK_SIZE])
+                time.sleep(min(WRITE_CHUNK_SIZE, len(body)-offset)/bytes_per_sec)
+        else:
+            handler.wfile.write(body)
+        with self._lock:
+            self.status_counts[status]=self.status_counts.get(status, 0)+1
+            self.bytes_sent+=len(body)
+
+
+if __name__=='__main__':
+    log=configure_logger('default')
+    log.info("Program start")
+
+    profile_name=sys.argv[1] if len(sys.argv)>1 else "none"
+    mock_server=MockOdataServer.from_saved_pages(port=8080, profile=PROFILES[profile_name])
+    log.info(f"Serving {', '.join(mock_server.tables)} on {mock_server.odata_url}")
+    try:
+        mock_server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock_server.httpd.server_close()
+
+    log.info("Program ends")
@@ -0,0 +1,83 @@
+'''
+Producer stage walking ODATA pages ahead of their processing.
+'''
+import logging
+import queue
+import threading
+
+import config
+
+
+class OdataPagePrefetcher(threading.Thread):
+    """
+    Walk the 'odata.nextLink' chain of one source on a background thread
+    and put the fetched pages on a bounded queue.
+    Consumers iterate the pages with 'pages()', while the next pages
+    are already being downloaded.
+    """
+    # End of pages marker
+    _done=object()
+
+    def __init__(self, fetch_page, source_name:str, skip_token:str, max_pages:int=None) -> None:
+        """
+        Parameters:
+        * fetch_page: callable(source_name, skip_token) returning
+            (page, num_of_docs, url) of 1 ODATA page, page is the parsed JSON.
+        * source_name: Knesset source to walk.
+        * skip_token: first page to fetch, None for the first page of source.
+        * max_pages: bound of pages fetched ahead of the consumer.
+        """
+        super().__init__(name=f"prefetch-{source_name}", daemon=True)
+        self.log=logging.getLogger('default')
+        self.fetch_page=fetch_page
+        self.source_name=source_name
+        self.skip_token=skip_token
+        if max_pages is None:
+            max_pages=config.prefetch_pages
+        self._queue=queue.Queue(maxsize=max_pages)
+        self._stop_event=threading.Event()
+
+    def run(self):
+        skip_token=self.skip_token
+        try:
+            while not self._stop_event.is_set():
+                page, num_of_docs, url=self.fetch_page(self.source_name, skip_token)
+                next_link=page.get("odata.nextLink")
+                self._put((skip_token, page, num_of_docs, url))
+                if not next_link:
+                    break
+                skip_token=next_link
+        except Exception as err:
+            # Raised again on consumer side
+            self._put(err)
+        self._put(self._done)
+
+    def _put(self, item):
+        # Don't block forever once consumer stopped reading
+        while not self._stop_event.is_set():
+            try:
+                self._queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def pages(self):
+        """
+        Yield (skip_token, page, num_of_docs, url) per page,
+        skip_token is the token the page was fetched with.
+        """
+        if self.ident is None:
+            self.start()
+        try:
+            while True:
+                item=self._queue.get()
+                if item is self._done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,160 @@
+'''
+Columnar store of ODATA listing pages: each page is appended as a
+Parquet file of a dataset partitioned by source
+('{store_dir}/source={source}/{page}.parquet'), read back with only
+the columns needed.
+Requires pyarrow.
+Script imports pages previously dumped as JSON files.
+'''
+import os
+import sys
+import json
+import logging
+
+import pandas as pd
+
+import config
+from logger_configurer import configure_logger
+
+
+# Partition column, holding the ODATA entity set of the records
+SOURCE_COLUMN="source"
+# Column holding name of the page records were listed on
+PAGE_COLUMN="_page"
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.dataset
+    except ImportError as err:
+        raise ImportError("pyarrow is required for ODATA pages Parquet store, "
+            "'pip install pyarrow'") from err
+    return pyarrow
+
+
+class OdataPageStore():
+    """
+    Pages of a source are written 1 file per page, written again when
+    the same page is listed again, so a crawl repeated or resumed
+    leaves no duplicated records.
+    Values are stored as strings, ODATA fields null on a whole page
+    would otherwise conflict with types of other pages.
+    """
+
+    def __init__(self, store_dir:str=None) -> None:
+        self.log=logging.getLogger('default')
+        self.store_dir=store_dir if store_dir is not None else config.odata_pages_store_dir
+        self.pa=import_pyarrow()
+
+    def source_dir(self, source_name:str)->str:
+        return os.path.join(self.store_dir, f"{SOURCE_COLUMN}={source_name}")
+
+    def append_page(self, source_name:str, page:dict, page_name:str)->str:
+        """
+        Write page records as Parquet file 'page_name' of source.
+        Returns the file path, None for a page with no records.
+        """
+        records=page["value"]
+        if len(records)==0:
+            return None
+        fields=list(dict.fromkeys(key for record in records for key in record))
+        columns={field:[self.to_string(record.get(field)) for record in records] for field in fields}
+        columns[PAGE_COLUMN]=[page_name]*len(records)
+        table=self.pa.table({name:self.pa.array(values, type=self.pa.string())
+            for name, values in columns.items()})
+
+        os.makedirs(self.source_dir(source_name), exist_ok=True)
+        _file=os.path.join(self.source_dir(source_name), f"{page_name}.parquet")
+        # Readers scan '*.parquet' only, page appears once complete
+        tmp_file=f"{_file}.tmp"
+        self.pa.parquet.write_table(table, tmp_file)
+        os.replace(tmp_file, _file)
+        return _file
+
+    def to_string(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, ensure_ascii=False)
+        return str(value)
+
+    def sources(self)->list:
+        if not os.path.exists(self.store_dir):
+            return []
+        prefix=f"{SOURCE_COLUMN}="
+        return sorted(_dir[len(prefix):] for _dir in os.listdir(self.store_dir)
+            if _dir.startswith(prefix))
+
+    def page_files(self, source_name:str)->list:
+        _dir=self.source_dir(source_name)
+        if not os.path.exists(_dir):
+            return []
+        return sorted(os.path.join(_dir, _file) for _file in os.listdir(_dir)
+            if _file.endswith(".parquet"))
+
+    def read(self, sources:list=None, columns:list=None)->pd.DataFrame:
+        """
+        Records of sources pages, all stored sources by default.
+        Only given columns are read from disk, 'source' column is
+        always returned. Columns not on a source are null for its records.
+        """
+        pa=self.pa
+        sources=self.sources() if sources is None else sources
+        files=[]
+        # Pages of a source share fields, 1 footer read per source
+        schemas=[pa.schema([(SOURCE_COLUMN, pa.string())])]
+        for source in sources:
+            source_files=self.page_files(source)
+            if len(source_files)==0:
+                continue
+            files.extend(source_files)
+            schemas.append(pa.parquet.read_schema(source_files[0]))
+        if len(files)==0:
+            return pd.DataFrame(columns=[SOURCE_COLUMN]+list(columns or []))
+
+        schema=pa.unify_schemas(schemas)
+        if columns is not None:
+            names=[SOURCE_COLUMN]+[column for column in columns if column!=SOURCE_COLUMN]
+            schema=pa.schema([schema.field(name) if name in schema.names else (name, pa.string())
+                for name in names])
+        dataset=pa.dataset.dataset(files, schema=schema, format="parquet",
+            partitioning=pa.dataset.partitioning(pa.schema([(SOURCE_COLUMN, pa.string())]), flavor="hive"),
+            partition_base_dir=self.store_dir)
+        return dataset.to_table().to_pandas()
+
+    def import_json_dir(self, json_dir:str)->int:
+        """
+        Append pages dumped as JSON files, source is taken from
+        page's 'odata.metadata'. Returns number of pages imported.
+        """
+        cnt=0
+        for _file in sorted(os.listdir(json_dir)):
+            if not _file.endswith(".json"):
+                continue
+            with open(os.path.join(json_dir, _file), "r", encoding="utf-8") as _fin:
+                page=json.load(_fin)
+            if "value" not in page or "odata.metadata" not in page:
+                continue
+            source_name=page["odata.metadata"].split("$metadata#")[1].split("&")[0]
+            self.append_page(source_name, page, _file[:-len(".json")])
+            cnt+=1
+            if cnt%500==0:
+                self.log.info(f"{cnt} pages of {json_dir} imported")
+        self.log.info(f"{cnt} pages of {json_dir} imported to {self.store_dir}")
+        return cnt
+
+
+if __name__=='__main__':
+    log=configure_logger('default')
+    log.info("Program start")
+
+    store=OdataPageStore()
+    json_dirs=sys.argv[1:] if len(sys.argv)>1 else [config.jsons_dir]+\
+        [f"{source}_metadata_jsons" for source in config.meta_data_tables]
+    for json_dir in json_dirs:
+        if os.path.exists(json_dir):
+            store.import_json_dir(json_dir)
+
+    log.info("Program ends")
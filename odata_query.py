@@ -0,0 +1,202 @@
+'''
+URLs of Knesset ODATA pages, with query options ($filter, $orderby, etc).
+'''
+import re
+import hashlib
+from urllib.parse import quote, unquote
+
+import config
+
+
+# Characters of ODATA expressions kept unescaped
+QUERY_SAFE_CHARS="'(),/:$"
+
+
+def encode_query_options(query_options:dict)->str:
+    return "&".join(f"{key}={quote(str(value), safe=QUERY_SAFE_CHARS)}"
+        for key, value in query_options.items())
+
+
+def build_page_url(source_name:str, skip_token:str=None, query_options:dict=None)->str:
+    """
+    URL of 1 ODATA page of source.
+    Parameters:
+    * skip_token: 'odata.nextLink' of previous page, like
+        "KNS_DocumentPlenumSession?$skiptoken=128985L", None for first page.
+    * query_options: like {"$filter": "...", "$orderby": "..."}, options
+        already on skip_token (server keeps them on next links) are not repeated.
+    """
+    url=f"{config.main_hypelink}{source_name}?${config.odata_download_format}"
+    token_query=""
+    # Paging through the ODATA
+    if skip_token:
+        token_query=skip_token.split("?", 1)[1]
+    options={key:value for key, value in (query_options or {}).items()
+        if f"{key}=" not in token_query}
+    if len(options)>0:
+        url=f"{url}&{encode_query_options(options)}"
+    if token_query:
+        url=f"{url}&{token_query}"
+    return url
+
+
+def build_count_url(source_name:str, query_options:dict=None)->str:
+    """
+    URL of number of records on source, filtered by '$filter' option if given.
+    """
+    url=f"{config.main_hypelink}{source_name}/$count"
+    if query_options and "$filter" in query_options:
+        url=f"{url}?{encode_query_options({'$filter':query_options['$filter']})}"
+    return url
+
+
+def get_link_option(link:str, key:str)->str:
+    """
+    Value of query option key on a link, None if missing.
+    """
+    if not link or "?" not in link:
+        return None
+    for option in link.split("?", 1)[1].split("&"):
+        if option.startswith(f"{key}="):
+            return unquote(option[len(key)+1:])
+    return None
+
+
+def walk_id(query_options:dict)->str:
+    """
+    Short id of a walk by its query options, names pages of filtered
+    walks apart from pages of other walks.
+    """
+    return hashlib.sha1(encode_query_options(query_options).encode("utf-8")).hexdigest()[:10]
+
+
+def page_file_name(source_name:str, next_link:str, walk:str=None)->str:
+    """
+    File name of a page saved as JSON, by the page's next link, like
+    "KNS_DocumentPlenumSession_128985L" for "KNS_DocumentPlenumSession?$skiptoken=128985L".
+    Parameters:
+    * walk: id of a filtered walk (incremental, selective), its pages
+        are named "{source}_{walk}_...", so they never overwrite pages
+        of a full walk or of walks with other filters.
+    """
+    prefix=f"{source_name}_{walk}" if walk else source_name
+    if not next_link:
+        return f"{prefix}_last_json"
+    token=next_link
+    if get_link_option(next_link, "$skiptoken") is not None:
+        token=get_link_option(next_link, "$skiptoken")
+    elif get_link_option(next_link, "$skip") is not None:
+        token=f"skip{get_link_option(next_link, '$skip')}"
+    elif get_link_option(next_link, "$filter") is not None:
+        # Keyset link, by records after last record of the page
+        token=f"after{hashlib.sha1(get_link_option(next_link, '$filter').encode('utf-8')).hexdigest()[:10]}"
+    token=re.sub(r"[^\w.-]", "_", token)
+    return f"{prefix}_{token}"
+
+
+def add_filter(options:dict, expression:str)->dict:
+    """
+    Options with expression and-ed to their '$filter'.
+    """
+    options=dict(options)
+    options["$filter"]=f"({options['$filter']}) and ({expression})" \
+        if "$filter" in options else expression
+    return options
+
+
+def listing_query_options(source_name:str, options:dict=None, formats:list=None,
+        key_fields:list=None)->dict:
+    """
+    Add configured listing options to source's options:
+    * '$select' projection of config.odata_select_fields.
+    * '$filter' of MS WORD files only (or of formats, if given),
+        for documents sources.
+    * '$top' of client paging by config.odata_page_size.
+    * key_fields (config.odata_key_fields of source by default) added to
+        '$orderby' of client paging and of walks paged by keyset.
+    """
+    options=dict(options or {})
+    if config.odata_select_fields.get(source_name):
+        options["$select"]=",".join(config.odata_select_fields[source_name])
+    if (config.odata_filter_ms_words or formats) and source_name in config.datasets_sources:
+        suffixes_filter=" or ".join(f"endswith(FilePath,'.{suffix}')"
+            for suffix in (formats or config.ms_words_suffix))
+        options=add_filter(options, suffixes_filter)
+    if config.odata_page_size:
+        options["$top"]=config.odata_page_size
+    # $skip and keyset paging need a stable order
+    if config.odata_page_size or keyset_fields(options):
+        if key_fields is None:
+            key_fields=[config.odata_key_fields[source_name]] if source_name in config.odata_key_fields else []
+        if key_fields:
+            options["$orderby"]=",".join([options["$orderby"], *key_fields] if "$orderby" in options
+                else key_fields)
+    return options
+
+
+def keyset_fields(query_options:dict)->list:
+    """
+    '$orderby' fields of a walk paged by keyset: walks ordered by the
+    mutable config.delta_sync_field (incremental walks). A record updated
+    mid-walk moves past the records walked, '$skip' offsets would skip
+    the record next to it. Empty for other walks.
+    """
+    fields=[field.strip() for field in (query_options or {}).get("$orderby", "").split(",") if field.strip()]
+    return fields if fields and fields[0]==config.delta_sync_field else []
+
+
+def odata_literal(field:str, value)->str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, (int, float)):
+        return str(value)
+    if field==config.delta_sync_field:
+        return f"datetime'{value}'"
+    escaped=str(value).replace("'", "''")
+    return f"'{escaped}'"
+
+
+def keyset_filter(fields:list, record:dict)->str:
+    """
+    '$filter' of records after record by fields order, nulls first as
+    ordered by the server.
+    """
+    conditions=[]
+    for idx, field in enumerate(fields):
+        expressions=[f"{previous} eq {odata_literal(previous, record.get(previous))}" for previous in fields[:idx]]
+        value=record.get(field)
+        expressions.append(f"{field} ne null" if value is None else f"{field} gt {odata_literal(field, value)}")
+        conditions.append(" and ".join(expressions))
+    return " or ".join(f"({condition})" for condition in conditions)
+
+
+def apply_client_paging(source_name:str, skip_token:str, page:dict, query_options:dict=None)->dict:
+    """
+    On client paging ('$top' of query_options, else config.odata_page_size),
+    set page's 'odata.nextLink' to the next '$skip' offset, server's next
+    links are replaced since they are relative to the requested '$top'.
+    On walks paged by keyset (keyset_fields), with client or server paging,
+    next link lists the records after page's last record, with the walk's
+    '$filter'.
+    """
+    query_options=query_options or {}
+    page_size=int(query_options.get("$top") or config.odata_page_size or 0)
+    fields=keyset_fields(query_options)
+    if not page_size and not fields:
+        return page
+    num_of_records=len(page["value"])
+    server_capped="odata.nextLink" in page
+    page.pop("odata.nextLink", None)
+    # Short page without server's next link is the last one
+    if num_of_records==0 or not ((page_size and num_of_records>=page_size) or server_capped):
+        return page
+    if fields:
+        options=add_filter({"$filter":query_options["$filter"]} if "$filter" in query_options else {},
+            keyset_filter(fields, page["value"][-1]))
+        page["odata.nextLink"]=f"{source_name}?{encode_query_options(options)}"
+    else:
+        offset=int(get_link_option(skip_token, "$skip") or 0)
+        page["odata.nextLink"]=f"{source_name}?$skip={offset+num_of_records}"
+    return page
@@ -0,0 +1,88 @@
+'''
+Registry of Knesset ODATA tables (entity sets), discovered from
+the service '$metadata' document, with their key and fields.
+'''
+import os
+import re
+import json
+import logging
+import xml.etree.ElementTree as ET
+
+import config
+from file_utils import atomic_write_json
+
+
+def local_name(tag:str)->str:
+    # EDMX elements are namespaced by EDM version, like '{http://...}EntitySet'
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_metadata(metadata_xml:bytes)->dict:
+    """
+    Entity sets of an EDMX '$metadata' document,
+    name to {"entity_type", "keys", "fields"}.
+    """
+    root=ET.fromstring(metadata_xml)
+    entity_types={}
+    for element in root.iter():
+        if local_name(element.tag)!="EntityType":
+            continue
+        keys=[ref.get("Name") for ref in element.iter() if local_name(ref.tag)=="PropertyRef"]
+        fields=[prop.get("Name") for prop in element if local_name(prop.tag)=="Property"]
+        entity_types[element.get("Name")]={"keys":keys, "fields":fields}
+    tables={}
+    for element in root.iter():
+        if local_name(element.tag)!="EntitySet":
+            continue
+        # Fully qualified type, like 'ParliamentInfo.KNS_Bill'
+        type_name=element.get("EntityType", "").rsplit(".", 1)[-1]
+        entity_type=entity_types.get(type_name, {"keys":[], "fields":[]})
+        tables[element.get("Name")]={"entity_type":type_name, **entity_type}
+    return tables
+
+
+class OdataTableRegistry():
+    """
+    Tables of the ODATA service, fetched once and cached
+    on config.odata_tables_registry_file.
+    """
+
+    def __init__(self, http_client=None, cache_file:str=None) -> None:
+        self.log=logging.getLogger('default')
+        self.http_client=http_client
+        self.cache_file=cache_file if cache_file is not None else config.odata_tables_registry_file
+        self._tables=None
+
+    def load(self, refresh:bool=False)->dict:
+        if self._tables is not None and not refresh:
+            return self._tables
+        if not refresh and os.path.exists(self.cache_file):
+            with open(self.cache_file, "r", encoding="utf-8") as _fin:
+                self._tables=json.load(_fin)
+            return self._tables
+        url=f"{config.main_hypelink}$metadata"
+        self.log.info(f"Discovering ODATA tables from {url}")
+        response=self.http_client.get(url)
+        response.raise_for_status()
+        self._tables=parse_metadata(response.content)
+        self.log.info(f"{len(self._tables)} tables on ODATA service")
+        atomic_write_json(self.cache_file, self._tables)
+        return self._tables
+
+    def tables(self, pattern:str=None)->list:
+        """
+        Names of tables matching pattern (regular expression),
+        config.metadata_tables_pattern by default.
+        """
+        pattern=pattern if pattern is not None else config.metadata_tables_pattern
+        return sorted(name for name in self.load() if re.search(pattern, name))
+
+    def key_fields(self, table_name:str)->list:
+        """
+        Key properties of table, several for a composite key,
+        empty if table is unknown.
+        """
+        return list(self.load().get(table_name, {}).get("keys", []))
+
+    def has_field(self, table_name:str, field:str)->bool:
+        return field in self.load().get(table_name, {}).get("fields", [])
@@ -0,0 +1,129 @@
+'''
+Append only JSONL logs of downloaded documents, errors and
+corrupted documents.
+'''
+import os
+import json
+import logging
+import threading
+import time
+
+import pandas as pd
+
+import config
+
+
+# Record key holding id of the batch record was appended with
+BATCH_KEY="_batch"
+
+
+class JsonlRecordLog():
+    """
+    Append only log, 1 JSON record per line.
+    Records are flushed on every append and fsync'ed every
+    'fsync_every' records, a crash loses at most the last
+    partial line, which is ignored on read.
+    """
+
+    def __init__(self, path:str, legacy_csv:str=None, fsync_every:int=None) -> None:
+        """
+        Parameters:
+        * path: JSONL file.
+        * legacy_csv: CSV log this log replaces, imported on first use.
+        * fsync_every: number of records between fsync calls.
+        """
+        self.log=logging.getLogger('default')
+        self.path=path
+        self.fsync_every=fsync_every if fsync_every is not None else config.record_log_fsync_every
+        self._lock=threading.Lock()
+        self._pending=0
+        if legacy_csv is not None and not os.path.exists(path) and os.path.exists(legacy_csv):
+            self.import_csv(legacy_csv)
+        self.drop_partial_line()
+        self._file=open(path, "a", encoding="utf-8")
+
+    def drop_partial_line(self):
+        """
+        Truncate a partial last line left by a crashed run,
+        so new records start on a line of their own.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as _file:
+            size=_file.seek(0, os.SEEK_END)
+            end=size
+            while end>0:
+                step=min(4096, end)
+                _file.seek(end-step)
+                chunk=_file.read(step)
+                newline_idx=chunk.rfind(b"\n")
+                if newline_idx>=0:
+                    end=end-step+newline_idx+1
+                    break
+                end-=step
+            if end<size:
+                self.log.info(f"Dropping {size-end} bytes of partial record on {self.path}")
+                _file.truncate(end)
+
+    def import_csv(self, csv_path:str):
+        _df=pd.read_csv(csv_path)
+        _df=_df.astype(object).where(_df.notna(), None)
+        self.log.info(f"Importing {len(_df)} records of {csv_path} to {self.path}")
+        with open(self.path, "a", encoding="utf-8") as _fout:
+            self._write_batch(_fout, _df.to_dict("records"))
+            _fout.flush()
+            os.fsync(_fout.fileno())
+
+    def append(self, records:list):
+        """
+        Append records as 1 batch.
+        """
+        with self._lock:
+            self._write_batch(self._file, records)
+            self._file.flush()
+            self._pending+=len(records)
+            if self._pending>=self.fsync_every:
+                os.fsync(self._file.fileno())
+                self._pending=0
+
+    def _write_batch(self, _file, records:list):
+        batch_id=time.time_ns()
+        lines=[json.dumps({**record, BATCH_KEY:batch_id}, ensure_ascii=False, default=str)
+            for record in records]
+        _file.write("".join(f"{line}\n" for line in lines))
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+def read_records(path:str):
+    """
+    Yield records of a JSONL log, skipping a truncated last line.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as _fin:
+        for line in _fin:
+            if not line.endswith("\n"):
+                # Partial write of a crashed run
+                break
+            yield json.loads(line)
+
+
+def records_to_df(path:str, latest_first:bool=True)->pd.DataFrame:
+    """
+    Records of a JSONL log in the order of the former CSV logs:
+    batches by time, batch's records in their original order.
+    """
+    batches={}
+    for record in read_records(path):
+        batches.setdefault(record.pop(BATCH_KEY, 0), []).append(record)
+    records=[]
+    for batch_id in sorted(batches, reverse=latest_first):
+        records.extend(batches[batch_id])
+    return pd.DataFrame(records)
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+# Modules of the repository are top level scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+
+@pytest.fixture(autouse=True, scope="session")
+def test_log_file(tmp_path_factory):
+    """
+    Loggers configured during tests write aside, not to the repository log.
+    """
+    log_file=config.log_file
+    config.log_file=str(tmp_path_factory.mktemp("logs")/"g_log.txt")
+    yield config.log_file
+    config.log_file=log_file
+
+
+@pytest.fixture
+def work_dir(tmp_path, monkeypatch):
+    """
+    Run test on an empty working folder, files configured by relative
+    paths (manifest, checkpoints, documents folders) are created there.
+    """
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def set_config(monkeypatch):
+    """
+    Set config values for the test, restored after it.
+    """
+    def _set_config(**values):
+        for key, value in values.items():
+            monkeypatch.setattr(config, key, value)
+    return _set_config
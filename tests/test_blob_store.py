@@ -0,0 +1,71 @@
+import os
+import hashlib
+
+import config
+from blob_store import BlobStore, TEXT_EXTRACTED, TEXT_EMPTY
+from download_knesset_corpus import DownloadKnessetCorpus
+from text_extractors import save_extracted_text
+
+SOURCE="KNS_DocumentPlenumSession"
+
+
+def store_doc(store:BlobStore, doc_name:str, content:bytes, url:str=None, etag:str=None):
+    docs_dir=f"{SOURCE}_docs"
+    os.makedirs(docs_dir, exist_ok=True)
+    doc_path=os.path.join(docs_dir, doc_name)
+    with open(doc_path, "wb") as _fout:
+        _fout.write(content)
+    sha256=hashlib.sha256(content).hexdigest()
+    return sha256, store.add_doc(SOURCE, doc_name, doc_path, sha256, len(content), url=url, etag=etag)
+
+
+def test_identical_docs_stored_once(work_dir):
+    store=BlobStore("blobs", "blob_index.sqlite")
+    sha256, exists=store_doc(store, "a.docx", b"content", url="http://x/a.docx")
+    assert not exists
+    assert store_doc(store, "b.docx", b"content", url="http://x/b.docx")==(sha256, True)
+    assert store.get_hash(SOURCE, "b.docx")==sha256
+    assert os.path.samefile(os.path.join(f"{SOURCE}_docs", "b.docx"), store.blob_path(sha256))
+    store.close()
+
+
+def test_conditional_headers(work_dir):
+    store=BlobStore("blobs", "blob_index.sqlite")
+    assert store.conditional_headers(SOURCE, "a.docx")=={}
+    store_doc(store, "a.docx", b"content", etag='"v1"')
+    assert store.conditional_headers(SOURCE, "a.docx")=={"If-None-Match":'"v1"'}
+    os.remove(os.path.join(f"{SOURCE}_docs", "a.docx"))
+    assert store.conditional_headers(SOURCE, "a.docx")=={}
+    store.close()
+
+
+def test_text_is_referenced_not_copied(work_dir, set_config):
+    set_config(extracted_texts_output=["txt"], text_search_index_on_extract=False)
+    os.makedirs(f"{SOURCE}_extracted_texts")
+    store=BlobStore("blobs", "blob_index.sqlite")
+    sha256, _=store_doc(store, "a.docx", b"content")
+    assert store.get_text(sha256)==(None, None)
+    save_extracted_text(SOURCE, "a.docx", "text of a")
+    store.save_text(sha256, "text of a", SOURCE, "a.docx")
+    assert store.get_text(sha256)==(TEXT_EXTRACTED, "text of a")
+    assert sorted(os.listdir(os.path.dirname(store.blob_path(sha256))))==[sha256]
+    # Text removed since, blob is extracted again
+    os.remove(os.path.join(f"{SOURCE}_extracted_texts", "a.docx.txt"))
+    assert store.get_text(sha256)==(None, None)
+    empty_sha256, _=store_doc(store, "c.docx", b"empty")
+    store.save_text(empty_sha256, " ", SOURCE, "c.docx")
+    assert store.get_text(empty_sha256)==(TEXT_EMPTY, "")
+    store.close()
+
+
+def test_doc_name_collision_is_named_apart(work_dir):
+    downloader=DownloadKnessetCorpus()
+    store_doc(downloader.blob_store, "a.docx", b"content", url="http://x/16/a.docx")
+    key_field=config.odata_key_fields[SOURCE]
+    assert downloader.claim_doc_name(SOURCE, {"FilePath":"http://x/16/a.docx", key_field:1})=="a.docx"
+    assert downloader.claim_doc_name(SOURCE, {"FilePath":"http://x/17/a.docx", key_field:2})=="a_2.docx"
+    # Documents of one page claim their names before they are stored
+    assert downloader.claim_doc_name(SOURCE, {"FilePath":"http://x/17/b.docx", key_field:3})=="b.docx"
+    assert downloader.claim_doc_name(SOURCE, {"FilePath":"http://x/18/b.docx", key_field:4})=="b_4.docx"
+    assert downloader.doc_file_name(SOURCE, {"FilePath":"http://x/17/b.docx", key_field:3})=="b.docx"
+    downloader.blob_store.close()
@@ -0,0 +1,16 @@
+import pytest
+
+from corpus_text_stats import count_words_in_file
+
+
+# Hebrew (2 bytes per letter) with niqqud, mixed whitespace, no
+# leading or trailing space
+TEXT="דיון על חוק הַתַּקְצִיב\tסעיף 12\n\nנושא שני  \r\n סוף ✓word"
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64])
+@pytest.mark.parametrize("text", [TEXT, f" {TEXT} ", "", "   ", "מילה"])
+def test_count_words_by_chunks(tmp_path, text, chunk_size):
+    file_path=tmp_path/"doc.docx.txt"
+    file_path.write_text(text, encoding="utf-8")
+    assert count_words_in_file(str(file_path), chunk_size)==len(text.split())
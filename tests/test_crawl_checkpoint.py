@@ -0,0 +1,70 @@
+import json
+
+from crawl_checkpoint import CrawlCheckpoint
+
+
+def test_resume_page_with_done_docs(work_dir):
+    checkpoint=CrawlCheckpoint("checkpoint.json")
+    checkpoint.start_page("KNS_DocumentBill", "KNS_DocumentBill?$skip=100", "page_100.json")
+    checkpoint.doc_done("KNS_DocumentBill", "1.doc")
+    checkpoint.doc_done("KNS_DocumentBill", "2.doc")
+    # Stopped before page is done
+    checkpoint.close()
+
+    resumed=CrawlCheckpoint("checkpoint.json").get("KNS_DocumentBill")
+    assert resumed["page_token"]=="KNS_DocumentBill?$skip=100"
+    assert resumed["page_file"]=="page_100.json"
+    assert resumed["done_docs"]==["1.doc", "2.doc"]
+    assert not resumed["completed"]
+
+
+def test_documents_are_appended_not_rewritten(work_dir):
+    checkpoint=CrawlCheckpoint("checkpoint.json")
+    checkpoint.start_page("KNS_DocumentBill", None, "page_0.json")
+    state_before=(work_dir/"checkpoint.json").read_text()
+    for idx in range(3):
+        checkpoint.doc_done("KNS_DocumentBill", f"{idx}.doc")
+    assert (work_dir/"checkpoint.json").read_text()==state_before
+    assert len((work_dir/"checkpoint.json.docs.jsonl").read_text().splitlines())==3
+
+    checkpoint.page_done("KNS_DocumentBill", "KNS_DocumentBill?$skip=100")
+    assert (work_dir/"checkpoint.json.docs.jsonl").read_text()==""
+    checkpoint.close()
+
+
+def test_docs_of_done_page_are_dropped(work_dir):
+    checkpoint=CrawlCheckpoint("checkpoint.json")
+    checkpoint.start_page("KNS_DocumentBill", None, "page_0.json")
+    checkpoint.page_done("KNS_DocumentBill", "KNS_DocumentBill?$skip=100")
+    checkpoint.close()
+    # Documents log left behind by a stop between state save and log truncation
+    with open("checkpoint.json.docs.jsonl", "w", encoding="utf-8") as _fout:
+        _fout.write(json.dumps({"source":"KNS_DocumentBill", "page_file":"page_0.json", "doc":"1.doc"})+"\n")
+        _fout.write('{"source": "KNS_Docu')
+
+    resumed=CrawlCheckpoint("checkpoint.json").get("KNS_DocumentBill")
+    assert resumed["page_token"]=="KNS_DocumentBill?$skip=100"
+    assert resumed["done_docs"]==[]
+
+
+def test_completed_and_reset(work_dir):
+    checkpoint=CrawlCheckpoint("checkpoint.json")
+    checkpoint.start_page("KNS_DocumentBill", None, "page_0.json")
+    checkpoint.page_done("KNS_DocumentBill", None)
+    assert CrawlCheckpoint("checkpoint.json").get("KNS_DocumentBill")["completed"]
+    checkpoint.reset("KNS_DocumentBill")
+    assert CrawlCheckpoint("checkpoint.json").get("KNS_DocumentBill")["page_token"] is None
+
+
+def test_walk_options_kept_across_pages(work_dir):
+    checkpoint=CrawlCheckpoint("checkpoint.json")
+    options={"$filter":"LastUpdatedDate ge datetime'2021-01-01T00:00:00'", "$top":1000}
+    checkpoint.start_walk("KNS_DocumentBill", options)
+    checkpoint.start_page("KNS_DocumentBill", None, "page_0.json")
+    checkpoint.page_done("KNS_DocumentBill", "KNS_DocumentBill?$skip=1000", "2021-02-01T00:00:00")
+    checkpoint.close()
+
+    resumed=CrawlCheckpoint("checkpoint.json").get("KNS_DocumentBill")
+    assert resumed["query_options"]==options
+    assert resumed["high_water_mark"]=="2021-02-01T00:00:00"
+    assert resumed["page_token"]=="KNS_DocumentBill?$skip=1000"
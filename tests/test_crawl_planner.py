@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+import config
+from crawl_planner import CrawlPlanner
+from download_knesset_corpus import DownloadKnessetCorpus
+
+
+def test_work_items_newest_knesset_first(set_config):
+    set_config(crawl_date_field="LastUpdatedDate")
+    planner=CrawlPlanner(sources=[config.bills, config.plenum_session_ref], knesset_nums=[16, 25, 16],
+        date_from="2023-01-01", date_to="2023-12-31", formats=["docx"])
+    items=planner.work_items()
+    assert [(item["knesset_num"], item["source"]) for item in items]== \
+        [(25, config.bills), (25, config.plenum_session_ref), (16, config.bills), (16, config.plenum_session_ref)]
+    assert items[0]["filter"]=="substringof('//25/',FilePath) and " \
+        "LastUpdatedDate ge datetime'2023-01-01T00:00:00' and LastUpdatedDate lt datetime'2024-01-01T00:00:00'"
+    assert items[0]["formats"]==["docx", "DOCX"]
+
+
+def test_work_items_given_order_and_unfiltered():
+    assert [item["knesset_num"] for item in CrawlPlanner(sources=[config.bills], knesset_nums=[16, 25],
+        priority="given").work_items()]==[16, 25]
+    assert CrawlPlanner(sources=[config.bills]).work_items()== \
+        [{"source":config.bills, "knesset_num":None, "filter":None, "formats":None}]
+
+
+@pytest.mark.parametrize("kwargs", [{"sources":["KNS_Unknown"]}, {"priority":"oldest"}, {"formats":["pdf"]},
+    {"date_from":"01/01/2023"}])
+def test_invalid_plan(kwargs):
+    with pytest.raises(ValueError):
+        CrawlPlanner(**kwargs)
+
+
+def test_work_items_pages_named_apart(work_dir, set_config):
+    set_config(odata_pages_sink=["json"], odata_page_size=2, metrics_export_interval=3600)
+    os.makedirs(config.jsons_dir)
+    page={"odata.metadata":f"http://localhost/$metadata#{config.bills}", "value":[],
+        "odata.nextLink":f"{config.bills}?$skip=2"}
+    plan=CrawlPlanner(sources=[config.bills], knesset_nums=[16, 17])
+    planned=DownloadKnessetCorpus(plan=plan)
+    page_files=[]
+    for idx, item in enumerate(plan.work_items()):
+        planned.start_work_item(idx, 2, item, "1")
+        planned.start_walk(config.bills)
+        page_files.append(planned.save_response_json(page, config.bills))
+    planned.close()
+    full=DownloadKnessetCorpus()
+    full.start_walk(config.bills)
+    page_files.append(full.save_response_json(page, config.bills))
+    full.close()
+    assert page_files[-1]==os.path.join(config.jsons_dir, f"{config.bills}_skip2.json")
+    assert len(set(page_files))==3
@@ -0,0 +1,39 @@
+import json
+
+from delta_sync import DeltaSyncState
+
+
+def test_query_options(work_dir):
+    state=DeltaSyncState("sync_state.json")
+    assert state.query_options("KNS_Bill")=={"$orderby":"LastUpdatedDate"}
+    state.state={"KNS_Bill":{"LastUpdatedDate":"2021-01-01T00:00:00"}}
+    assert state.query_options("KNS_Bill")["$filter"]=="LastUpdatedDate ge datetime'2021-01-01T00:00:00'"
+
+
+def test_high_water_mark_stored_once_walk_is_done(work_dir):
+    state=DeltaSyncState("sync_state.json")
+    state.start_walk("KNS_Bill")
+    assert state.update("KNS_Bill", [{"LastUpdatedDate":"2021-02-01T00:00:00"},
+        {"LastUpdatedDate":None}])=="2021-02-01T00:00:00"
+    assert state.update("KNS_Bill", [{"LastUpdatedDate":"2021-01-01T00:00:00"}])=="2021-02-01T00:00:00"
+    assert state.get_high_water_mark("KNS_Bill") is None
+    assert not (work_dir/"sync_state.json").exists()
+
+    state.walk_done("KNS_Bill")
+    with open("sync_state.json", "r", encoding="utf-8") as _fin:
+        assert json.load(_fin)=={"KNS_Bill":{"LastUpdatedDate":"2021-02-01T00:00:00"}}
+
+
+def test_resumed_walk_and_older_walk(work_dir):
+    state=DeltaSyncState("sync_state.json")
+    state.state={"KNS_Bill":{"LastUpdatedDate":"2021-03-01T00:00:00"}}
+    # Resumed walk continues from records seen before the stop
+    state.start_walk("KNS_Bill", "2021-04-01T00:00:00")
+    state.update("KNS_Bill", [])
+    state.walk_done("KNS_Bill")
+    assert state.get_high_water_mark("KNS_Bill")=="2021-04-01T00:00:00"
+    # High-water mark never goes back
+    state.start_walk("KNS_Bill")
+    state.update("KNS_Bill", [{"LastUpdatedDate":"2020-01-01T00:00:00"}])
+    state.walk_done("KNS_Bill")
+    assert state.get_high_water_mark("KNS_Bill")=="2021-04-01T00:00:00"
@@ -0,0 +1,101 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+import config
+import http_client
+from mock_odata_server import MockOdataServer, PROFILES, FILES_PATH
+from crawl_checkpoint import CrawlCheckpoint
+from download_knesset_corpus import DownloadKnessetCorpus
+from async_odata_engine import AsyncCorpusEngine
+
+
+DOCS_PER_SOURCE=5
+W_NS="http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+
+def make_docx(text:str)->bytes:
+    content=io.BytesIO()
+    with zipfile.ZipFile(content, "w") as _zip:
+        _zip.writestr("word/document.xml", f'<w:document xmlns:w="{W_NS}"><w:body>'
+            f'<w:p><w:r><w:t>{text}</w:t></w:r></w:p></w:body></w:document>')
+    return content.getvalue()
+
+
+def make_tables(files_url:str):
+    """
+    Records of documents sources and their documents, by path under FILES_PATH.
+    """
+    tables={}
+    files={}
+    for source_name in config.datasets_sources:
+        key_field=config.odata_key_fields[source_name]
+        tables[source_name]=[]
+        for idx in range(DOCS_PER_SOURCE):
+            path=f"{idx+16}/{source_name}/{idx}.docx"
+            files[path]=make_docx(f"{source_name} document {idx}")
+            tables[source_name].append({key_field:idx, "FilePath":f"{files_url}{path}",
+                "LastUpdatedDate":f"2021-0{idx+1}-01T00:00:00"})
+    return tables, files
+
+
+@pytest.fixture
+def crawl_config(work_dir, set_config, monkeypatch):
+    set_config(odata_page_size=2, text_extractor_backend="python", extraction_workers=2,
+        extracted_texts_output=["txt"], odata_pages_sink=["json"], min_request_interval_per_host=0,
+        http_max_retries=10, http_backoff_base=0.01, http_backoff_max=0.05, metrics_export_interval=3600)
+    os.makedirs(config.jsons_dir)
+    # Client is created again with test's retries
+    monkeypatch.setattr(http_client, "_http_client", None)
+
+
+def start_server(profile_name:str)->MockOdataServer:
+    server=MockOdataServer({}, profile=PROFILES[profile_name], seed=7)
+    server.tables, server.files=make_tables(server.files_url)
+    config.main_hypelink=server.odata_url
+    return server.start()
+
+
+def run_crawl(engine:str, **kwargs):
+    dkc=DownloadKnessetCorpus(**kwargs)
+    if engine=="async":
+        AsyncCorpusEngine(dkc).run()
+    else:
+        dkc.run()
+
+
+@pytest.mark.parametrize("profile_name", ["none", "flaky", "throttled"])
+@pytest.mark.parametrize("engine", ["sync", "async"])
+def test_crawl_against_mock_server(crawl_config, engine, profile_name):
+    server=start_server(profile_name)
+    try:
+        run_crawl(engine)
+    finally:
+        server.stop()
+
+    checkpoint=CrawlCheckpoint(config.corpus_checkpoint_file)
+    for source_name in config.datasets_sources:
+        assert sorted(os.listdir(f"{source_name}_docs"))==[f"{idx}.docx" for idx in range(DOCS_PER_SOURCE)]
+        for idx in range(DOCS_PER_SOURCE):
+            with open(os.path.join(f"{source_name}_extracted_texts", f"{idx}.docx.txt"), "r",
+                    encoding="utf-8") as _fin:
+                assert _fin.read().strip()==f"{source_name} document {idx}"
+        assert checkpoint.get(source_name)["completed"]
+    if profile_name!="none":
+        # Faults were injected and retried
+        assert any(status!=200 for status in server.status_counts)
+
+
+@pytest.mark.parametrize("engine", ["sync", "async"])
+def test_rerun_skips_downloaded_docs(crawl_config, engine):
+    server=start_server("none")
+    try:
+        run_crawl(engine)
+        files_requests=len([path for path in server.requests if path.startswith(FILES_PATH)])
+        assert files_requests==DOCS_PER_SOURCE*len(config.datasets_sources)
+        run_crawl(engine, incremental=True)
+        assert len([path for path in server.requests if path.startswith(FILES_PATH)])==files_requests
+    finally:
+        server.stop()
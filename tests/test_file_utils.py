@@ -0,0 +1,18 @@
+import os
+
+from file_utils import AtomicStreamWriter, atomic_write_json
+
+
+def test_concurrent_writes_of_same_path(work_dir):
+    first=AtomicStreamWriter("doc.docx")
+    second=AtomicStreamWriter("doc.docx")
+    assert first.tmp_path!=second.tmp_path
+    first.write(b"first")
+    second.write(b"second")
+    second.abort()
+    assert first.commit()[0]==len(b"first")
+    with open("doc.docx", "rb") as _fin:
+        assert _fin.read()==b"first"
+    atomic_write_json("state.json", {"a":1})
+    # Only written files are left
+    assert sorted(os.listdir("."))==["doc.docx", "state.json"]
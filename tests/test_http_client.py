@@ -0,0 +1,50 @@
+import threading
+
+from http_client import HttpClient
+from host_rate_limiter import HostRateLimiter
+
+
+class FakeResponse():
+
+    def __init__(self, status_code:int) -> None:
+        self.status_code=status_code
+        self.headers={}
+        self.closed=False
+
+    def close(self):
+        self.closed=True
+
+
+def make_client(statuses:list)->HttpClient:
+    client=HttpClient(rate_limiter=HostRateLimiter(max_connections_per_host=1, min_interval=0),
+        max_retries=len(statuses)-1)
+    responses=iter(statuses)
+    client.session.get=lambda url, **kwargs: FakeResponse(next(responses))
+    client.backoff_delay=lambda attempt: 0
+    return client
+
+
+def test_stream_holds_host_slot_until_closed():
+    client=make_client([200, 200])
+    other_done=threading.Event()
+
+    def other_request():
+        client.get("https://fs.knesset.gov.il/other.doc")
+        other_done.set()
+
+    with client.stream("https://fs.knesset.gov.il/1.doc") as response:
+        thread=threading.Thread(target=other_request)
+        thread.start()
+        # Body is still being read, the only slot of the host is taken
+        assert not other_done.wait(0.3)
+    assert response.closed
+    assert other_done.wait(5)
+    thread.join()
+
+
+def test_retries_release_host_slot():
+    client=make_client([503, 503, 200])
+    response=client.get("https://knesset.gov.il/Odata/ParliamentInfo.svc/KNS_Bill")
+    assert response.status_code==200
+    # Slot is free again
+    assert client.rate_limiter._get_semaphore("knesset.gov.il").acquire(blocking=False)
@@ -0,0 +1,117 @@
+import os
+import glob
+import json
+
+import pytest
+
+from mock_odata_server import MockOdataServer
+from download_knesset_metadata_tables import DownloadMetadataTables
+from async_odata_engine import AsyncMetadataEngine
+from delta_sync import DeltaSyncState
+
+
+TABLE="KNS_PlenumSession"
+HIGH_WATER_MARK="2021-01-01T00:00:00"
+# Updated since high-water mark, ids not in update order
+UPDATED_RECORDS=[
+    {"PlenumSessionID":5, "LastUpdatedDate":"2021-03-01T00:00:00"},
+    {"PlenumSessionID":1, "LastUpdatedDate":"2021-02-01T00:00:00"},
+    {"PlenumSessionID":7, "LastUpdatedDate":"2021-06-01T00:00:00"},
+    {"PlenumSessionID":2, "LastUpdatedDate":"2021-04-01T00:00:00"},
+    {"PlenumSessionID":9, "LastUpdatedDate":"2021-05-01T00:00:00"},
+]
+OLD_RECORDS=[
+    {"PlenumSessionID":3, "LastUpdatedDate":"2020-01-01T00:00:00"},
+    {"PlenumSessionID":4, "LastUpdatedDate":"2020-02-01T00:00:00"},
+]
+
+
+@pytest.fixture
+def server(work_dir, set_config):
+    with MockOdataServer({TABLE:OLD_RECORDS+UPDATED_RECORDS}) as mock_server:
+        set_config(main_hypelink=mock_server.odata_url, meta_data_tables=[TABLE],
+            odata_page_size=2, odata_pages_sink=["json"], min_request_interval_per_host=0)
+        with open("sync_state.json", "w", encoding="utf-8") as _fout:
+            json.dump({TABLE:{"LastUpdatedDate":HIGH_WATER_MARK}}, _fout)
+        yield mock_server
+
+
+def saved_ids()->list:
+    ids=[]
+    for path in glob.glob(os.path.join(f"{TABLE}_metadata_jsons", "*.json")):
+        with open(path, "r", encoding="utf-8") as _fin:
+            ids.extend(record["PlenumSessionID"] for record in json.load(_fin)["value"])
+    return sorted(ids)
+
+
+@pytest.mark.parametrize("engine", ["sync", "async"])
+def test_incremental_walk_pages_with_fixed_filter(server, engine):
+    dmt=DownloadMetadataTables(incremental=True)
+    if engine=="async":
+        AsyncMetadataEngine(dmt).run()
+    else:
+        dmt.run()
+
+    assert saved_ids()==sorted(record["PlenumSessionID"] for record in UPDATED_RECORDS)
+    page_requests=[path for path in server.requests if f"/{TABLE}?" in path]
+    # All pages are listed with the filter of the walk start
+    assert len(page_requests)==3
+    assert all("2021-01-01T00:00:00" in path for path in page_requests)
+    assert DeltaSyncState().get_high_water_mark(TABLE)=="2021-06-01T00:00:00"
+
+
+def test_resumed_walk_keeps_its_filter(server):
+    dmt=DownloadMetadataTables(incremental=True)
+    dmt.mkdir_per_source(TABLE)
+    dmt.start_walk(TABLE)
+    # Stopped after 1st page
+    page, _, _=dmt.get_metadata_json(TABLE, None)
+    dmt.page_done(TABLE, page)
+    assert DeltaSyncState().get_high_water_mark(TABLE)==HIGH_WATER_MARK
+
+    resumed=DownloadMetadataTables(incremental=True, resume=True)
+    resumed.run()
+    assert saved_ids()==sorted(record["PlenumSessionID"] for record in UPDATED_RECORDS)
+    assert DeltaSyncState().get_high_water_mark(TABLE)=="2021-06-01T00:00:00"
+
+
+def test_incremental_walk_keeps_full_walk_pages(server):
+    DownloadMetadataTables().run()
+    pages_dir=f"{TABLE}_metadata_jsons"
+    full_pages={}
+    for _file in os.listdir(pages_dir):
+        with open(os.path.join(pages_dir, _file), "r", encoding="utf-8") as _fin:
+            full_pages[_file]=_fin.read()
+    assert saved_ids()==sorted(record["PlenumSessionID"] for record in OLD_RECORDS+UPDATED_RECORDS)
+
+    # Record updated since full walk
+    server.tables[TABLE][2]={"PlenumSessionID":5, "LastUpdatedDate":"2021-07-01T00:00:00"}
+    DownloadMetadataTables(incremental=True).run()
+    for _file, content in full_pages.items():
+        with open(os.path.join(pages_dir, _file), "r", encoding="utf-8") as _fin:
+            assert _fin.read()==content
+    # Incremental walk pages are saved aside
+    assert len(set(os.listdir(pages_dir))-set(full_pages))>0
+
+
+@pytest.mark.parametrize("engine", ["sync", "async"])
+def test_record_updated_mid_walk_is_not_skipped(server, engine):
+    get_page=server.get_page
+    pages_listed=[]
+    def get_page_then_update(source_name, options):
+        page=get_page(source_name, options)
+        if not pages_listed:
+            # First walked record is updated once its page is listed
+            server.tables[TABLE][3]={"PlenumSessionID":1, "LastUpdatedDate":"2021-08-01T00:00:00"}
+        pages_listed.append(page)
+        return page
+    server.get_page=get_page_then_update
+
+    dmt=DownloadMetadataTables(incremental=True)
+    if engine=="async":
+        AsyncMetadataEngine(dmt).run()
+    else:
+        dmt.run()
+
+    assert set(saved_ids())==set(record["PlenumSessionID"] for record in UPDATED_RECORDS)
+    assert DeltaSyncState().get_high_water_mark(TABLE)=="2021-08-01T00:00:00"
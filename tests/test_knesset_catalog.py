@@ -0,0 +1,34 @@
+import os
+import json
+
+import config
+from knesset_catalog import KnessetCatalog
+
+
+def save_page(json_dir:str, entity:str, records:list):
+    os.makedirs(json_dir, exist_ok=True)
+    page={"odata.metadata":f"http://localhost/$metadata#{entity}", "value":records}
+    with open(os.path.join(json_dir, f"{entity}_0.json"), "w", encoding="utf-8") as _fout:
+        json.dump(page, _fout)
+
+
+def test_documents_view_joins_sessions_and_bills(work_dir, set_config):
+    set_config(odata_pages_sink=["json"], knesset_catalog_file="catalog.sqlite")
+    save_page(config.jsons_dir, config.plenum_session_ref, [{"DocumentPlenumSessionID":1, "PlenumSessionID":10,
+        "GroupTypeDesc":"דברי הכנסת", "FilePath":"https://fs.knesset.gov.il//16/Plenum/16_ptm_1.doc"}])
+    save_page(f"{config.plenum_session}_metadata_jsons", config.plenum_session,
+        [{"PlenumSessionID":10, "KnessetNum":16, "Name":"ישיבה 1", "StartDate":"2004-03-01T16:00:00"}])
+    save_page(config.jsons_dir, config.bills, [{"DocumentBillID":2, "BillID":20, "GroupTypeDesc":"הצעת חוק",
+        "FilePath":"https://fs.knesset.gov.il//17/law/17_lst_2.doc"}])
+    save_page(f"{config.knesset_bills}_metadata_jsons", config.knesset_bills,
+        [{"BillID":20, "KnessetNum":17, "Name":"חוק", "PublicationDate":"2007-01-01T00:00:00"}])
+    catalog=KnessetCatalog()
+    assert catalog.load()==4
+    assert catalog.load()==0
+    plenum_doc=catalog.document("16_ptm_1.doc")
+    assert (plenum_doc["group_type"], plenum_doc["session_date"], plenum_doc["knesset_num"])== \
+        ("דברי הכנסת", "2004-03-01T16:00:00", 16)
+    bill_doc=catalog.document("17_lst_2.doc", config.bills)
+    assert (bill_doc["bill_id"], bill_doc["session_date"], bill_doc["knesset_num"])==(20, "2007-01-01T00:00:00", 17)
+    assert list(catalog.documents(date_from="2005-01-01")["doc_name"])==["17_lst_2.doc"]
+    catalog.close()
@@ -0,0 +1,74 @@
+from odata_query import build_page_url, build_count_url, page_file_name, add_filter, \
+    listing_query_options, apply_client_paging, get_link_option, walk_id
+
+
+HYPERLINK="http://knesset.gov.il/Odata/ParliamentInfo.svc/"
+
+
+def test_page_url_keeps_options_on_skip_pages(set_config):
+    set_config(main_hypelink=HYPERLINK, odata_download_format="format=json")
+    options={"$filter":"LastUpdatedDate ge datetime'2021-01-01T00:00:00'", "$top":2}
+    url=build_page_url("KNS_PlenumSession", "KNS_PlenumSession?$skip=2", options)
+    assert url==(f"{HYPERLINK}KNS_PlenumSession?$format=json"
+        "&$filter=LastUpdatedDate%20ge%20datetime'2021-01-01T00:00:00'&$top=2&$skip=2")
+    # Options of server next links are not repeated
+    url=build_page_url("KNS_PlenumSession", "KNS_PlenumSession?$top=2&$skip=4", options)
+    assert url.count("$top=")==1
+
+
+def test_count_url_is_filtered(set_config):
+    set_config(main_hypelink=HYPERLINK)
+    assert build_count_url("KNS_Bill", {"$filter":"BillID gt 5", "$top":10})== \
+        f"{HYPERLINK}KNS_Bill/$count?$filter=BillID%20gt%205"
+
+
+def test_add_filter():
+    assert add_filter({}, "a eq 1")=={"$filter":"a eq 1"}
+    assert add_filter({"$filter":"a eq 1"}, "b eq 2")=={"$filter":"(a eq 1) and (b eq 2)"}
+
+
+def test_listing_options(set_config):
+    set_config(odata_page_size=1000, odata_filter_ms_words=True, ms_words_suffix=["doc", "docx"])
+    options=listing_query_options("KNS_DocumentBill", {"$orderby":"LastUpdatedDate"})
+    assert options["$top"]==1000
+    assert options["$orderby"]=="LastUpdatedDate,DocumentBillID"
+    assert options["$filter"]=="endswith(FilePath,'.doc') or endswith(FilePath,'.docx')"
+    assert options["$select"].startswith("DocumentBillID,")
+
+
+def test_client_paging(set_config):
+    set_config(odata_page_size=2)
+    page=apply_client_paging("KNS_Bill", "KNS_Bill?$skip=2", {"value":[{}, {}]})
+    assert page["odata.nextLink"]=="KNS_Bill?$skip=4"
+    # Short page is the last one
+    assert "odata.nextLink" not in apply_client_paging("KNS_Bill", "KNS_Bill?$skip=4", {"value":[{}]})
+    # Server capped page continues from records returned
+    page=apply_client_paging("KNS_Bill", None, {"value":[{}], "odata.nextLink":"KNS_Bill?$skiptoken=9L"})
+    assert page["odata.nextLink"]=="KNS_Bill?$skip=1"
+
+
+def test_keyset_paging(set_config):
+    set_config(main_hypelink=HYPERLINK, odata_page_size=None, odata_download_format="format=json")
+    options={"$filter":"LastUpdatedDate ge datetime'2021-01-01T00:00:00'", "$orderby":"LastUpdatedDate,BillID"}
+    page={"value":[{"BillID":7, "LastUpdatedDate":"2021-03-01T00:00:00"}], "odata.nextLink":"KNS_Bill?$skiptoken=7L"}
+    page=apply_client_paging("KNS_Bill", None, page, options)
+    assert get_link_option(page["odata.nextLink"], "$filter")==("(LastUpdatedDate ge datetime'2021-01-01T00:00:00') and "
+        "((LastUpdatedDate gt datetime'2021-03-01T00:00:00') or "
+        "(LastUpdatedDate eq datetime'2021-03-01T00:00:00' and BillID gt 7))")
+    # Walk's filter is not repeated on next page
+    assert build_page_url("KNS_Bill", page["odata.nextLink"], options).count("$filter=")==1
+    assert page_file_name("KNS_Bill", page["odata.nextLink"]).startswith("KNS_Bill_after")
+    # Page without server's next link is the last one
+    assert "odata.nextLink" not in apply_client_paging("KNS_Bill", None, {"value":[{"BillID":8}]}, options)
+
+
+def test_page_file_name():
+    assert page_file_name("KNS_Bill", "KNS_Bill?$skiptoken=128985L")=="KNS_Bill_128985L"
+    assert page_file_name("KNS_Bill", "KNS_Bill?$skip=1000")=="KNS_Bill_skip1000"
+    assert page_file_name("KNS_Bill", None)=="KNS_Bill_last_json"
+    # Pages of filtered walks are named apart
+    walk=walk_id({"$filter":"LastUpdatedDate ge datetime'2021-01-01T00:00:00'"})
+    assert walk!=walk_id({"$filter":"LastUpdatedDate ge datetime'2021-02-01T00:00:00'"})
+    assert page_file_name("KNS_Bill", "KNS_Bill?$skip=1000", walk)==f"KNS_Bill_{walk}_skip1000"
+    assert page_file_name("KNS_Bill", None, walk)==f"KNS_Bill_{walk}_last_json"
+    assert get_link_option("KNS_Bill?$top=2&$skip=4", "$skip")=="4"
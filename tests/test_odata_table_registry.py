@@ -0,0 +1,61 @@
+import json
+
+import config
+from crawl_metrics import get_metrics
+from odata_query import listing_query_options
+from odata_table_registry import parse_metadata, OdataTableRegistry
+from download_knesset_metadata_tables import DownloadMetadataTables
+from async_odata_engine import AsyncMetadataEngine
+
+
+METADATA=b"""<?xml version="1.0" encoding="utf-8"?>
+<edmx:Edmx Version="1.0" xmlns:edmx="http://schemas.microsoft.com/ado/2007/06/edmx">
+<edmx:DataServices><Schema Namespace="ParliamentInfo" xmlns="http://schemas.microsoft.com/ado/2009/11/edm">
+<EntityType Name="KNS_Bill"><Key><PropertyRef Name="BillID"/></Key>
+<Property Name="BillID" Type="Edm.Int32"/><Property Name="LastUpdatedDate" Type="Edm.DateTime"/></EntityType>
+<EntityType Name="KNS_BillName"><Key><PropertyRef Name="BillID"/><PropertyRef Name="NameID"/></Key>
+<Property Name="BillID" Type="Edm.Int32"/><Property Name="NameID" Type="Edm.Int32"/></EntityType>
+<EntityContainer Name="ParliamentInfoDb">
+<EntitySet Name="KNS_Bill" EntityType="ParliamentInfo.KNS_Bill"/>
+<EntitySet Name="KNS_BillName" EntityType="ParliamentInfo.KNS_BillName"/>
+</EntityContainer></Schema></edmx:DataServices></edmx:Edmx>"""
+
+
+def make_registry(work_dir)->OdataTableRegistry:
+    with open("odata_tables.json", "w", encoding="utf-8") as _fout:
+        json.dump(parse_metadata(METADATA), _fout)
+    return OdataTableRegistry(cache_file="odata_tables.json")
+
+
+def test_parse_metadata():
+    tables=parse_metadata(METADATA)
+    assert tables["KNS_Bill"]=={"entity_type":"KNS_Bill", "keys":["BillID"],
+        "fields":["BillID", "LastUpdatedDate"]}
+    assert tables["KNS_BillName"]["keys"]==["BillID", "NameID"]
+
+
+def test_composite_keys_order_paging(work_dir, set_config):
+    set_config(odata_page_size=100)
+    registry=make_registry(work_dir)
+    assert registry.key_fields("KNS_BillName")==["BillID", "NameID"]
+    assert registry.key_fields("KNS_Unknown")==[]
+    options=listing_query_options("KNS_BillName", {"$orderby":"LastUpdatedDate"},
+        key_fields=registry.key_fields("KNS_BillName"))
+    assert options["$orderby"]=="LastUpdatedDate,BillID,NameID"
+
+
+def test_resolve_tables_leaves_config(work_dir, set_config):
+    set_config(metadata_tables_pattern=r"^KNS_", odata_page_size=100)
+    key_fields_before=dict(config.odata_key_fields)
+    dmt=DownloadMetadataTables(all_tables=True)
+    dmt.registry=make_registry(work_dir)
+    assert dmt.resolve_tables()=={"KNS_Bill":["BillID"], "KNS_BillName":["BillID", "NameID"]}
+    assert config.odata_key_fields==key_fields_before
+
+
+def test_async_metadata_engine_stops_exporter_on_error(work_dir, set_config):
+    # Nothing listens on port 9, counts fail
+    set_config(main_hypelink="http://127.0.0.1:9/Odata/ParliamentInfo.svc/", http_max_retries=0,
+        meta_data_tables=["KNS_Bill"])
+    AsyncMetadataEngine(DownloadMetadataTables()).run()
+    assert get_metrics()._exporter is None
@@ -0,0 +1,42 @@
+import os
+
+import pandas as pd
+
+from record_log import JsonlRecordLog, read_records, records_to_df, BATCH_KEY
+
+
+def test_records_appended_and_read_back(work_dir):
+    record_log=JsonlRecordLog("log.jsonl", fsync_every=2)
+    record_log.append([{"doc_name":"a.doc", "source":"s"}, {"doc_name":"b.doc", "source":"s"}])
+    record_log.append([{"doc_name":"c.doc", "source":"s"}])
+    record_log.close()
+    records=list(read_records("log.jsonl"))
+    assert [record["doc_name"] for record in records]==["a.doc", "b.doc", "c.doc"]
+    assert records[0][BATCH_KEY]==records[1][BATCH_KEY]!=records[2][BATCH_KEY]
+    # Latest batch first, batch records in their order
+    assert list(records_to_df("log.jsonl")["doc_name"])==["c.doc", "a.doc", "b.doc"]
+    assert list(records_to_df("log.jsonl", latest_first=False)["doc_name"])==["a.doc", "b.doc", "c.doc"]
+
+
+def test_partial_line_dropped(work_dir):
+    record_log=JsonlRecordLog("log.jsonl")
+    record_log.append([{"doc_name":"a.doc"}])
+    record_log.close()
+    # Crashed run left a partial record
+    with open("log.jsonl", "a", encoding="utf-8") as _fout:
+        _fout.write('{"doc_name": "b.d')
+    assert [record["doc_name"] for record in read_records("log.jsonl")]==["a.doc"]
+    record_log=JsonlRecordLog("log.jsonl")
+    record_log.append([{"doc_name":"c.doc"}])
+    record_log.close()
+    assert [record["doc_name"] for record in read_records("log.jsonl")]==["a.doc", "c.doc"]
+
+
+def test_legacy_csv_imported_once(work_dir):
+    pd.DataFrame([{"doc_name":"a.doc", "source":"s"}, {"doc_name":"b.doc", "source":None}]) \
+        .to_csv("log.csv", index=False)
+    JsonlRecordLog("log.jsonl", legacy_csv="log.csv").close()
+    JsonlRecordLog("log.jsonl", legacy_csv="log.csv").close()
+    assert list(read_records("log.jsonl"))[1]["source"] is None
+    assert len(records_to_df("log.jsonl"))==2
+    assert os.path.exists("log.csv")
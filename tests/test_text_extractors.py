@@ -0,0 +1,69 @@
+import time
+import zipfile
+
+from text_extractors import ExtractionEngine, TextExtractor, DocxTextExtractor
+
+
+W_NS="http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+MC_NS="http://schemas.openxmlformats.org/markup-compatibility/2006"
+# Body paragraph with a tab, a table cell, and a text box stored
+# as DrawingML with its VML fallback
+DOCUMENT_XML=(f'<w:document xmlns:w="{W_NS}" xmlns:mc="{MC_NS}"><w:body>'
+    '<w:p><w:r><w:t>Hello</w:t><w:tab/><w:t>world</w:t></w:r>'
+    '<w:r><mc:AlternateContent><mc:Choice Requires="wps"><w:drawing><w:txbxContent>'
+    '<w:p><w:r><w:t>BOX</w:t></w:r></w:p></w:txbxContent></w:drawing></mc:Choice>'
+    '<mc:Fallback><w:pict><w:txbxContent><w:p><w:r><w:t>BOX</w:t></w:r></w:p>'
+    '</w:txbxContent></w:pict></mc:Fallback></mc:AlternateContent></w:r></w:p>'
+    '<w:tbl><w:tr><w:tc><w:p><w:r><w:t>cell</w:t></w:r></w:p></w:tc></w:tr></w:tbl>'
+    '</w:body></w:document>')
+
+
+class SleepyTextExtractor(TextExtractor):
+    """
+    Process safe extractor hanging on documents named 'hang*'.
+    """
+    suffixes=["txt"]
+
+    def extract(self, doc_path:str)->str:
+        if doc_path.startswith("hang"):
+            time.sleep(60)
+        return f"text of {doc_path}"
+
+
+def make_engine(timeout:float)->ExtractionEngine:
+    engine=ExtractionEngine(backend="python", workers=1, timeout=timeout)
+    engine.extractors={"txt":SleepyTextExtractor()}
+    return engine
+
+
+def test_extract_texts():
+    engine=make_engine(timeout=30)
+    try:
+        results=list(engine.extract_texts(["a.txt", "b.txt", "c.pdf"]))
+    finally:
+        engine.close()
+    assert [(doc_path, text) for doc_path, text, _ in results]== \
+        [("a.txt", "text of a.txt"), ("b.txt", "text of b.txt"), ("c.pdf", None)]
+    assert isinstance(results[2][2], ValueError)
+
+
+def test_timed_out_worker_is_recycled():
+    engine=make_engine(timeout=1)
+    start=time.monotonic()
+    try:
+        results=list(engine.extract_texts(["hang.txt", "a.txt", "b.txt"]))
+    finally:
+        engine.close()
+    assert isinstance(results[0][2], TimeoutError)
+    # Documents queued behind the hung worker run on a new pool
+    assert [(doc_path, text, err) for doc_path, text, err in results[1:]]== \
+        [("a.txt", "text of a.txt", None), ("b.txt", "text of b.txt", None)]
+    assert time.monotonic()-start<30
+
+
+def test_docx_extractor(tmp_path):
+    doc_path=str(tmp_path/"doc.docx")
+    with zipfile.ZipFile(doc_path, "w") as _zip:
+        _zip.writestr("word/document.xml", DOCUMENT_XML)
+    # Body paragraphs, then text boxes, fallback copies are skipped
+    assert DocxTextExtractor().extract(doc_path)=="Hello\tworld\ncell BOX"
@@ -0,0 +1,85 @@
+import os
+import json
+import sqlite3
+
+import config
+from text_search_index import TextSearchIndex, normalize_hebrew, make_snippet
+
+
+def save_page(json_dir:str, entity:str, records:list):
+    os.makedirs(json_dir, exist_ok=True)
+    page={"odata.metadata":f"http://localhost/$metadata#{entity}", "value":records}
+    with open(os.path.join(json_dir, f"{entity}_0.json"), "w", encoding="utf-8") as _fout:
+        json.dump(page, _fout)
+
+
+def save_text(doc_name:str, text:str):
+    texts_dir=f"{config.plenum_session_ref}_extracted_texts"
+    os.makedirs(texts_dir, exist_ok=True)
+    with open(os.path.join(texts_dir, f"{doc_name}.txt"), "w", encoding="utf-8") as _fout:
+        _fout.write(text)
+
+
+def test_normalize_hebrew():
+    assert normalize_hebrew("שָׁלוֹם צה\"ל בית־ספר מלך")=="שלומ צהל בית ספר מלכ"
+
+
+def test_snippet_of_extracted_text():
+    text="פתיחה "+"מילה "*30+"דיון על צה\"ל והתַּקְצִיב "+"סוף "*30
+    highlighted=normalize_hebrew(text).replace("צהל", "\x01צהל\x02")
+    snippet=make_snippet(text, highlighted)
+    assert snippet.startswith("...") and snippet.endswith("...")
+    assert "[צה\"ל] והתַּקְצִיב" in snippet
+    assert len(snippet.strip(".").split())==16
+    assert make_snippet("אחת שתיים", "\x01אחת\x02 שתיימ")=="[אחת] שתיים"
+
+
+def test_build_and_search(work_dir, set_config):
+    set_config(datasets_sources=[config.plenum_session_ref], odata_pages_sink=["json"],
+        knesset_catalog_file="catalog.sqlite", text_search_index_file="search.sqlite",
+        text_shards_dir="shards")
+    save_page(config.jsons_dir, config.plenum_session_ref, [
+        {"DocumentPlenumSessionID":idx, "PlenumSessionID":idx*10, "LastUpdatedDate":"2020-01-01T00:00:00",
+            "FilePath":f"https://fs.knesset.gov.il//{knesset}/Plenum/{knesset}_ptm_{idx}.doc"}
+        for idx, knesset in [(1, 16), (2, 17)]])
+    save_page(f"{config.plenum_session}_metadata_jsons", config.plenum_session, [
+        {"PlenumSessionID":10, "KnessetNum":16, "StartDate":"2004-03-01T16:00:00"},
+        {"PlenumSessionID":20, "KnessetNum":17, "StartDate":"2007-05-01T16:00:00"}])
+    save_text("16_ptm_1.doc", "דיון על חוק הַתַּקְצִיב")
+    save_text("17_ptm_2.doc", "חוק התקציב אושר")
+    search_index=TextSearchIndex()
+    search_index.build()
+    results=search_index.search("התקציב")
+    assert {result["doc_name"]:result["date"] for result in results}== \
+        {"16_ptm_1.doc":"2004-03-01T16:00:00", "17_ptm_2.doc":"2007-05-01T16:00:00"}
+    assert {result["snippet"] for result in results}=={"דיון על חוק [הַתַּקְצִיב]", "חוק [התקציב] אושר"}
+    # Dates of sessions, not of records updates
+    assert [result["doc_name"] for result in search_index.search("התקציב", date_from="2005-01-01")]== \
+        ["17_ptm_2.doc"]
+    assert search_index.search("התקציב", date_to="2019-12-31", knesset_nums=[16])[0]["knesset_num"]==16
+    # Records of pages downloaded later keep session dates
+    search_index.add_records(config.plenum_session_ref, [{"FilePath":
+        "https://fs.knesset.gov.il//16/Plenum/16_ptm_1.doc"}])
+    assert len(search_index.search("התקציב", date_to="2005-01-01"))==1
+    search_index.close()
+
+
+def test_index_with_extracted_texts_is_migrated(work_dir, set_config):
+    set_config(extracted_texts_output=["txt"])
+    conn=sqlite3.connect("search.sqlite")
+    conn.execute("CREATE VIRTUAL TABLE texts_fts USING fts5(body, raw UNINDEXED)")
+    conn.execute("CREATE TABLE docs (id INTEGER PRIMARY KEY, source TEXT NOT NULL, doc_name TEXT NOT NULL, "
+        "knesset_num INTEGER, updated_at REAL NOT NULL, UNIQUE (source, doc_name))")
+    conn.execute("INSERT INTO docs VALUES (1, ?, '16_ptm_1.doc', 16, 0)", (config.plenum_session_ref,))
+    conn.execute("INSERT INTO texts_fts (rowid, body, raw) VALUES (1, ?, ?)",
+        (normalize_hebrew("חוק הַתַּקְצִיב"), "חוק הַתַּקְצִיב"))
+    conn.commit()
+    conn.close()
+    save_text("16_ptm_1.doc", "חוק הַתַּקְצִיב")
+    search_index=TextSearchIndex("search.sqlite")
+    assert [row[1] for row in search_index.conn.execute("PRAGMA table_info(texts_fts)")]==["body"]
+    assert [result["snippet"] for result in search_index.search("התקציב")]==["חוק [הַתַּקְצִיב]"]
+    # Text removed since indexed, snippet of the normalized text
+    os.remove(os.path.join(f"{config.plenum_session_ref}_extracted_texts", "16_ptm_1.doc.txt"))
+    assert [result["snippet"] for result in search_index.search("התקציב")]==["חוק [התקציב]"]
+    search_index.close()
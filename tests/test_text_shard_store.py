@@ -0,0 +1,79 @@
+import os
+
+from text_shard_store import TextShardStore
+from corpus_text_stats import CorpusTextStats
+
+SOURCE="KNS_DocumentPlenumSession"
+
+
+def test_texts_read_back(work_dir, set_config):
+    set_config(text_shards_commit_every=2)
+    store=TextShardStore("shards", "gzip", max_shard_size=200)
+    texts={f"16_ptm_{idx}.doc":f"text {idx} "*(idx+1) for idx in range(5)}
+    for doc_name, text in texts.items():
+        store.append(SOURCE, doc_name, text)
+    store.append(SOURCE, "16_ptm_0.doc", "new text")
+    texts["16_ptm_0.doc"]="new text"
+    # Read before commit by this store
+    assert store.get_text(SOURCE, "16_ptm_4.doc")==texts["16_ptm_4.doc"]
+    assert len(os.listdir(os.path.join("shards", SOURCE)))>1
+    assert {doc_name:text for _, doc_name, text in store.iter_texts()}==texts
+    store.close()
+    store=TextShardStore("shards", "gzip", max_shard_size=200)
+    assert {doc_name:store.get_text(SOURCE, doc_name) for doc_name in texts}==texts
+    assert store.get_text(SOURCE, "missing.doc") is None
+    store.close()
+
+
+def test_uncommitted_records_cut(work_dir, set_config):
+    set_config(text_shards_commit_every=2)
+    store=TextShardStore("shards", "gzip")
+    for idx in range(3):
+        store.append(SOURCE, f"{idx}.doc", f"text {idx}")
+    # Run stopped before third text was committed
+    shard, _file=store._shards[SOURCE]
+    _file.flush()
+    store.conn.rollback()
+    store._shards={}
+    _file.close()
+    store.conn.close()
+    store=TextShardStore("shards", "gzip")
+    assert store.get_text(SOURCE, "2.doc") is None
+    store.append(SOURCE, "3.doc", "text 3")
+    assert {doc_name:text for _, doc_name, text in store.iter_texts()}== \
+        {"0.doc":"text 0", "1.doc":"text 1", "3.doc":"text 3"}
+    store.close()
+
+
+def test_import_dir_removes_committed_texts(work_dir, set_config):
+    set_config(text_shards_commit_every=2)
+    os.makedirs(f"{SOURCE}_extracted_texts")
+    for idx in range(3):
+        with open(os.path.join(f"{SOURCE}_extracted_texts", f"{idx}.doc.txt"), "w", encoding="utf-8") as _fout:
+            _fout.write(f"text {idx}")
+    store=TextShardStore("shards", "gzip")
+    assert store.import_dir(SOURCE, remove_texts=True)==3
+    assert os.listdir(f"{SOURCE}_extracted_texts")==[]
+    store.close()
+    store=TextShardStore("shards", "gzip")
+    assert store.get_text(SOURCE, "2.doc")=="text 2"
+    store.close()
+
+
+def test_text_stats_count_shard_texts(work_dir, set_config):
+    set_config(text_shards_dir="shards", text_shards_codec="gzip")
+    os.makedirs(f"{SOURCE}_extracted_texts")
+    with open(os.path.join(f"{SOURCE}_extracted_texts", "16_ptm_1.doc.txt"), "w", encoding="utf-8") as _fout:
+        _fout.write("one two three")
+    store=TextShardStore()
+    store.append(SOURCE, "16_ptm_1.doc", "stale text on shards")
+    store.append(SOURCE, "17_ptm_2.docx", "four five")
+    store.close()
+    for _ in range(2):
+        stats_df=CorpusTextStats(workers=1, cache_file="stats_cache.json").files_stats([SOURCE])
+        stats=stats_df.set_index("file")
+        assert sorted(stats.index)==["16_ptm_1.doc.txt", "17_ptm_2.docx.txt"]
+        assert stats.loc["16_ptm_1.doc.txt", "words"]==3
+        assert stats.loc["17_ptm_2.docx.txt", "words"]==2
+        assert stats.loc["17_ptm_2.docx.txt", "size"]==len("four five")
+        assert stats.loc["17_ptm_2.docx.txt", "knesset_num"]==17
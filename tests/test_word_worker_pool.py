@@ -0,0 +1,134 @@
+import threading
+import multiprocessing
+from types import SimpleNamespace
+
+import pytest
+
+import word_worker_pool
+from word_worker_pool import WordWorkerPool, WordWorker
+
+
+class FakeProcess():
+    def __init__(self, alive:bool=True) -> None:
+        self.alive=alive
+        self.killed=False
+        self.pid=0
+        self.exitcode=None
+
+    def start(self):
+        pass
+
+    def is_alive(self)->bool:
+        return self.alive and not self.killed
+
+    def kill(self):
+        self.killed=True
+
+    def join(self, timeout:float=None):
+        pass
+
+
+def fake_worker(alive:bool=True)->WordWorker:
+    """
+    Worker answering documents from a thread, 'hang*' documents are never answered.
+    """
+    parent_conn, child_conn=multiprocessing.Pipe()
+
+    def serve():
+        while True:
+            try:
+                doc_path=child_conn.recv()
+            except (EOFError, OSError):
+                return
+            if doc_path is None:
+                return
+            if not doc_path.startswith("hang"):
+                child_conn.send(("done", f"text of {doc_path}", 0.0, None, False))
+
+    threading.Thread(target=serve, daemon=True).start()
+    return WordWorker(FakeProcess(alive), parent_conn, None)
+
+
+@pytest.fixture
+def killed_words(monkeypatch):
+    killed=[]
+    monkeypatch.setattr(word_worker_pool, "kill_word", killed.append)
+    monkeypatch.setattr(word_worker_pool, "word_pids", lambda: set())
+    return killed
+
+
+def test_start_failure_fails_document(killed_words, monkeypatch):
+    pool=WordWorkerPool(workers=1, timeout=5, recycle_after=10)
+    starts=iter([TimeoutError("didn't start"), fake_worker()])
+
+    def start_worker():
+        result=next(starts)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(pool, "start_worker", start_worker)
+    results={doc_path:(output_text, err) for doc_path, output_text, _, err in pool.extract_many(["a", "b"])}
+    assert isinstance(results["a"][1], TimeoutError)
+    assert results["b"]==("text of b", None)
+    pool.close()
+
+
+def test_exited_idle_worker_replaced(killed_words, monkeypatch):
+    pool=WordWorkerPool(workers=1, timeout=5, recycle_after=10)
+    exited=fake_worker(alive=False)
+    exited.word_pid=123
+    pool.idle=[exited]
+    monkeypatch.setattr(pool, "start_worker", fake_worker)
+    assert [(doc_path, err) for doc_path, _, _, err in pool.extract_many(["a"])]==[("a", None)]
+    assert killed_words==[123]
+    pool.close()
+
+
+def test_closed_worker_fails_document(killed_words, monkeypatch):
+    pool=WordWorkerPool(workers=1, timeout=5, recycle_after=10)
+    worker=fake_worker()
+    worker.conn.close()
+    monkeypatch.setattr(pool, "start_worker", lambda: worker)
+    assert [doc_path for doc_path, _, _, err in pool.extract_many(["a"]) if err is not None]==["a"]
+    assert worker.process.killed
+
+
+def test_timed_out_worker_killed(killed_words, monkeypatch):
+    pool=WordWorkerPool(workers=2, timeout=0.2, recycle_after=10)
+    workers=[]
+    monkeypatch.setattr(pool, "start_worker", lambda: workers.append(fake_worker()) or workers[-1])
+    results={doc_path:err for doc_path, _, _, err in pool.extract_many(["a", "hang"])}
+    assert results["a"] is None
+    assert isinstance(results["hang"], TimeoutError)
+    assert [worker.process.killed for worker in workers]==[False, True]
+    pool.close()
+
+
+def test_closed_generator_kills_busy_workers(killed_words, monkeypatch):
+    pool=WordWorkerPool(workers=2, timeout=60, recycle_after=10)
+    workers=[]
+    monkeypatch.setattr(pool, "start_worker", lambda: workers.append(fake_worker()) or workers[-1])
+    results=pool.extract_many(["a", "hang"])
+    assert next(results)[0]=="a"
+    results.close()
+    assert [worker.process.killed for worker in workers]==[False, True]
+    pool.close()
+
+
+def test_start_timeout_kills_word(monkeypatch):
+    killed=[]
+    monkeypatch.setattr(word_worker_pool, "kill_word", killed.append)
+    pids=iter([{1}, {1, 2}])
+    monkeypatch.setattr(word_worker_pool, "word_pids", lambda: next(pids))
+    process=FakeProcess()
+    pool=WordWorkerPool(workers=1, timeout=0.1, recycle_after=10)
+    parent_conn, child_conn=multiprocessing.Pipe()
+    # Worker never sends ready, child end is kept open
+    pool.context=SimpleNamespace(Pipe=lambda: (parent_conn, SimpleNamespace(close=lambda: None)),
+        Process=lambda **kwargs: process)
+    with pytest.raises(TimeoutError):
+        pool.start_worker()
+    assert process.killed
+    assert killed==[2]
+    child_conn.close()
@@ -0,0 +1,529 @@
+'''
+Text extraction backends for documents downloaded from Knesset ODATA.
+* win32com: MS WORD over COM, Windows only.
+* python: .docx parsed from its XML parts, legacy .doc converted
+    by LibreOffice, both running on a process pool.
+'''
+import os
+import logging
+import multiprocessing
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+import zipfile
+import pathlib
+import xml.etree.ElementTree as ET
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, \
+    TimeoutError as FutureTimeoutError
+
+import config
+from crawl_metrics import get_metrics, span
+from text_shard_store import get_text_shard_store
+from text_search_index import get_text_search_index
+
+
+W_NS="{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+MC_NS="{http://schemas.openxmlformats.org/markup-compatibility/2006}"
+W_P=f"{W_NS}p"
+W_T=f"{W_NS}t"
+W_TAB=f"{W_NS}tab"
+W_BR=f"{W_NS}br"
+W_CR=f"{W_NS}cr"
+W_TXBX=f"{W_NS}txbxContent"
+# Text boxes are stored twice, as DrawingML and as VML fallback.
+MC_FALLBACK=f"{MC_NS}Fallback"
+# MS WORD constants: WdStoryType.wdTextFrameStory, MsoShapeType.msoTextBox
+WD_TEXT_FRAME_STORY=5
+MSO_TEXT_BOX=17
+# Ways MS WORD text boxes are read, see Win32ComTextExtractor
+TEXTBOX_EXTRACTIONS=["shapes", "stories"]
+
+
+def get_suffix(file_name:str)->str:
+    return file_name.split(".").pop().lower()
+
+
+class TextExtractor():
+    """
+    Base class of extraction backends, extracting the text of 1 document.
+    """
+    # Lower case file suffixes handled by backend
+    suffixes=[]
+    # Whether backend can run on ProcessPoolExecutor workers
+    process_safe=True
+    # Whether backend runs its own workers, extracting a batch with extract_many()
+    manages_workers=False
+
+    @classmethod
+    def is_available(cls)->bool:
+        """
+        Whether backend can run on this host.
+        """
+        return True
+
+    def extract(self, doc_path:str)->str:
+        raise NotImplementedError
+
+    def init_thread(self):
+        """
+        Called on the thread running a non process safe backend.
+        """
+        return
+
+    def recover(self):
+        """
+        Called after a failed extraction, before next document.
+        """
+        return
+
+    def abandon(self):
+        """
+        Called after extraction timed out, the thread running it is left behind.
+        """
+        return
+
+    def close(self):
+        return
+
+
+class DocxTextExtractor(TextExtractor):
+    """
+    Pure python OXML (.docx) extraction: body paragraphs and text boxes
+    read from 'word/document.xml' inside the zip.
+    """
+    suffixes=["docx"]
+
+    def extract(self, doc_path:str)->str:
+        with zipfile.ZipFile(doc_path) as _zip:
+            root=ET.fromstring(_zip.read("word/document.xml"))
+        paragraphs=[]
+        self._collect_paragraphs(root, paragraphs)
+        text_boxes_texts=[]
+        for text_box in self._find_text_boxes(root):
+            box_paragraphs=[]
+            self._collect_paragraphs(text_box, box_paragraphs)
+            text_boxes_texts.append("\n".join(box_paragraphs))
+        output_text="\n".join(paragraphs)
+        # Same layout as MS WORD extraction: body, then text boxes
+        filtered_text=[t for t in text_boxes_texts if len(t.strip())>0]
+        if len(filtered_text)>0:
+            output_text=output_text+ " " +'\n'.join(filtered_text)
+        return output_text
+
+    def _collect_paragraphs(self, elem, paragraphs:list):
+        for child in elem:
+            if child.tag in (MC_FALLBACK, W_TXBX):
+                continue
+            if child.tag==W_P:
+                paragraphs.append("".join(self._runs_text(child)))
+                continue
+            self._collect_paragraphs(child, paragraphs)
+
+    def _runs_text(self, elem):
+        for child in elem:
+            if child.tag in (MC_FALLBACK, W_TXBX):
+                continue
+            if child.tag==W_T:
+                yield child.text or ""
+            elif child.tag==W_TAB:
+                yield "\t"
+            elif child.tag in (W_BR, W_CR):
+                yield "\n"
+            else:
+                yield from self._runs_text(child)
+
+    def _find_text_boxes(self, elem):
+        for child in elem:
+            if child.tag==MC_FALLBACK:
+                continue
+            if child.tag==W_TXBX:
+                yield child
+                continue
+            yield from self._find_text_boxes(child)
+
+
+class LegacyDocTextExtractor(TextExtractor):
+    """
+    Legacy binary .doc extraction with headless LibreOffice,
+    on a private LibreOffice profile per worker process, so
+    workers don't lock each other.
+    """
+    suffixes=["doc"]
+
+    def __init__(self, timeout:float=None) -> None:
+        self.timeout=timeout if timeout is not None else config.extraction_timeout
+
+    @classmethod
+    def is_available(cls)->bool:
+        return shutil.which(config.libreoffice_path) is not None
+
+    def extract(self, doc_path:str)->str:
+        profile_dir=os.path.join(tempfile.gettempdir(), f"knesset_lo_profile_{os.getpid()}")
+        command=[config.libreoffice_path,
+            f"-env:UserInstallation={pathlib.Path(profile_dir).as_uri()}",
+            "--headless", "--cat", doc_path]
+        completed=subprocess.run(command, capture_output=True, timeout=self.timeout, check=True)
+        return completed.stdout.decode("utf-8", errors="replace")
+
+
+class Win32ComTextExtractor(TextExtractor):
+    """
+    Text extraction from MS WORD, driven by 1 COM object,
+    hence runs on 1 dedicated thread, one document at a time.
+    """
+    suffixes=["doc", "docx"]
+    process_safe=False
+
+    def __init__(self, isolated:bool=False, textbox_extraction:str=None) -> None:
+        """
+        Parameters:
+        * isolated: open a new WORD instance, not shared with other
+            clients (Word workers pool).
+        * textbox_extraction: 'shapes' or 'stories' (faster, callouts
+            included), config.textbox_extraction by default.
+        """
+        self.log=logging.getLogger('default')
+        self.isolated=isolated
+        self.textbox_extraction=textbox_extraction if textbox_extraction is not None \
+            else config.textbox_extraction
+        if self.textbox_extraction not in TEXTBOX_EXTRACTIONS:
+            raise ValueError(f"Unknown textbox extraction {self.textbox_extraction}, "
+                f"expected one of {TEXTBOX_EXTRACTIONS}")
+        self.word_application=None
+
+    def extract(self, doc_path:str)->str:
+        if self.word_application==None:
+            self.init_word_app()
+        with span("open_word_doc"):
+            doc=self.open_word_doc(doc_path)
+        try:
+            output_text=doc.Range().Text
+            ''' Old, slower extraction method '''
+            # for paragraph in doc.Paragraphs:
+            #     full_text.append(paragraph.Range.Text.strip())
+            # output_text="\n".join([ t for t in full_text if len(t.strip())>0])
+
+            # Extract text from Text Box, which appears on
+            # old Knesset documents, originaly extracted from TIFF / PDF images
+            # using OCR.
+            with span("extract_text_boxes"):
+                text_boxes_texts=self.text_boxes_texts(doc)
+            filtered_text=[w for w in text_boxes_texts if w.strip()]
+            if len(filtered_text)>0:
+                output_text=output_text+ " " +'\n'.join([ t for t in text_boxes_texts if len(t.strip())>0])
+        finally:
+            doc.Close(False)
+        return output_text
+
+    def text_boxes_texts(self, doc)->list:
+        if self.textbox_extraction=="stories":
+            return self.stories_text_boxes_texts(doc)
+        return self.shapes_text_boxes_texts(doc)
+
+    def shapes_text_boxes_texts(self, doc)->list:
+        """
+        Texts of text boxes, checking type of every shape of the
+        document, several COM calls per shape.
+        """
+        text_boxes_texts = []
+        for shape in doc.Shapes:
+            # Check if there is textboxs
+            if shape.Type == MSO_TEXT_BOX:
+                # Extract text from the textbox
+                text = shape.TextFrame.TextRange.Text
+                text_boxes_texts.append(text)
+        return text_boxes_texts
+
+    def stories_text_boxes_texts(self, doc)->list:
+        """
+        Texts of text boxes read from WORD's text frame story, 2 COM
+        calls per text box (its text & next one) and none per other
+        shapes. Text of shapes with text other than text boxes
+        (e.g. callouts) is included as well.
+        """
+        text_boxes_texts=[]
+        # Only stories the document has are listed, no error on documents without text boxes
+        for story in doc.StoryRanges:
+            if story.StoryType!=WD_TEXT_FRAME_STORY:
+                continue
+            while story is not None:
+                text_boxes_texts.append(story.Text)
+                story=story.NextStoryRange
+        return text_boxes_texts
+
+    def open_word_doc(self, doc_path:str):
+        return self.word_application.Documents.Open(os.path.abspath(doc_path), ReadOnly=True)
+
+    def init_word_app(self):
+        # Install with 'pip install pywin32'
+        import win32com.client
+        # Main object to open MS WORD docs with
+        if self.isolated:
+            self.word_application = win32com.client.DispatchEx('Word.Application')
+        else:
+            self.word_application = win32com.client.gencache.EnsureDispatch('Word.Application')
+        # Avoid actualy open the docs- all work should be done in the background
+        self.word_application.Visible=False
+
+        # This cal init word with late binding, the code above int early binding
+        # word_application = win32com.client.Dispatch('Word.Application')
+
+    def init_thread(self):
+        import pythoncom
+        pythoncom.CoInitialize()
+
+    def recover(self):
+        # Case err.strerror is 'Call was rejected by callee', WORD is
+        # re-opened on the COM thread with next document
+        self.word_application=None
+
+    def abandon(self):
+        # Hanged MS WORD instance is left, a new one is opened on next document
+        self.word_application=None
+
+    def close(self):
+        if self.word_application is not None:
+            self.word_application.Quit()
+            self.word_application=None
+
+
+def get_extractors(backend:str=None)->dict:
+    """
+    Extractor per lower case file suffix of backend:
+    'win32com', 'win32com_pool', 'python' or 'auto' (win32com on Windows,
+    python elsewhere).
+    """
+    if backend is None:
+        backend=config.text_extractor_backend
+    if backend=="auto":
+        backend="win32com" if os.name=='nt' else "python"
+    if backend not in extractor_backends:
+        raise ValueError(f"Unknown text extractor backend {backend}")
+    extractors={}
+    for extractor in extractor_backends[backend]():
+        if not extractor.is_available():
+            # Documents are left for extraction once backend is installed
+            logging.getLogger('default').warning(
+                f"{type(extractor).__name__} is not available, {extractor.suffixes} files are not extracted")
+            continue
+        for suffix in extractor.suffixes:
+            extractors[suffix]=extractor
+    return extractors
+
+
+def timed_extract(extractor:TextExtractor, doc_path:str):
+    """
+    (text, seconds) of extractor on document, timed where it runs,
+    on the extraction worker.
+    """
+    start=time.perf_counter()
+    output_text=extractor.extract(doc_path)
+    return output_text, time.perf_counter()-start
+
+
+def report_worker_pid(worker_pids):
+    """
+    Process pool initializer, workers are killed by their pids when
+    an extraction hangs.
+    """
+    worker_pids.put(os.getpid())
+
+
+def word_pool_extractors()->list:
+    # word_worker_pool imports this module
+    from word_worker_pool import WordPoolTextExtractor
+    return [WordPoolTextExtractor()]
+
+
+# Backend name to factory of backend's extractors
+extractor_backends={
+    "win32com": lambda: [Win32ComTextExtractor()],
+    "win32com_pool": word_pool_extractors,
+    "python": lambda: [DocxTextExtractor(), LegacyDocTextExtractor()],
+}
+
+
+class ExtractionEngine():
+    """
+    Run extraction backends over documents, process safe backends
+    on a ProcessPoolExecutor, others on a dedicated thread.
+    Extraction of a document exceeding 'timeout' seconds fails.
+    """
+
+    def __init__(self, backend:str=None, workers:int=None, timeout:float=None) -> None:
+        self.log=logging.getLogger('default')
+        self.extractors=get_extractors(backend)
+        self.workers=workers if workers is not None else config.extraction_workers
+        self.timeout=timeout if timeout is not None else config.extraction_timeout
+        self._executor=None
+        # Pids reported by workers of current process pool
+        self._worker_pids=None
+        self._thread_executor=None
+
+    def can_extract(self, file_name:str)->bool:
+        return get_suffix(file_name) in self.extractors
+
+    def extract_texts(self, doc_paths:list):
+        """
+        Extract texts of documents, yield per document
+        (doc_path, text, error), error is None on success.
+        """
+        # [doc_path, extractor, future], futures are replaced when pool is recycled
+        futures=[]
+        # Documents of extractors running their own workers
+        batches={}
+        for doc_path in doc_paths:
+            extractor=self.extractors.get(get_suffix(doc_path))
+            if extractor is not None and extractor.manages_workers:
+                batches.setdefault(extractor, []).append(doc_path)
+            elif extractor is None:
+                futures.append([doc_path, None, self._failed_future(
+                    ValueError(f"File type of {doc_path} is not handled"))])
+            elif extractor.process_safe:
+                futures.append([doc_path, extractor, self._get_executor().submit(
+                    timed_extract, extractor, doc_path)])
+            else:
+                # Submitted on order of results, keeps COM calls serial
+                futures.append([doc_path, extractor, None])
+
+        for extractor, batch in batches.items():
+            for doc_path, output_text, seconds, err in extractor.extract_many(batch):
+                if err is None:
+                    get_metrics().observe("extract_text", seconds)
+                    get_metrics().inc("docs_extracted")
+                elif isinstance(err, TimeoutError):
+                    get_metrics().inc("extraction_timeouts")
+                else:
+                    get_metrics().inc("extraction_failures")
+                yield doc_path, output_text, err
+
+        for idx, (doc_path, extractor, future) in enumerate(futures):
+            if future is None:
+                future=self._get_thread_executor(extractor).submit(timed_extract, extractor, doc_path)
+            try:
+                output_text, seconds=future.result(timeout=self.timeout)
+                get_metrics().observe("extract_text", seconds)
+                get_metrics().inc("docs_extracted")
+                yield doc_path, output_text, None
+            except FutureTimeoutError:
+                get_metrics().inc("extraction_timeouts")
+                self.log.info(f"Extraction of {doc_path} timed out after {self.timeout} seconds")
+                if extractor is not None and not extractor.process_safe:
+                    self._abandon_thread_executor(extractor)
+                elif extractor is not None:
+                    self._recycle_executor(futures[idx+1:])
+                yield doc_path, None, TimeoutError(f"Extraction timed out: {doc_path}")
+            except Exception as err:
+                get_metrics().inc("extraction_failures")
+                if extractor is not None:
+                    extractor.recover()
+                yield doc_path, None, err
+
+    def _get_thread_executor(self, extractor:TextExtractor)->ThreadPoolExecutor:
+        if self._thread_executor is None:
+            self._thread_executor=ThreadPoolExecutor(max_workers=1,
+                initializer=extractor.init_thread)
+        return self._thread_executor
+
+    def _abandon_thread_executor(self, extractor:TextExtractor):
+        # Thread stuck on the timed out document can't be stopped,
+        # next documents run on a new thread.
+        self._thread_executor.shutdown(wait=False, cancel_futures=True)
+        self._thread_executor=None
+        extractor.abandon()
+
+    def _recycle_executor(self, pending:list):
+        """
+        Kill workers of the process pool, the hung worker keeps its slot
+        otherwise. Pending documents are submitted to a new pool.
+        """
+        executor, self._executor=self._executor, None
+        worker_pids, self._worker_pids=self._worker_pids, None
+        # ProcessPoolExecutor has no public API to stop its workers,
+        # each worker reports its pid before it takes documents
+        pids=set()
+        while not worker_pids.empty():
+            pids.add(worker_pids.get())
+        for pid in pids:
+            try:
+                os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+            except OSError:
+                # Worker already exited
+                pass
+        executor.shutdown(wait=False, cancel_futures=True)
+        worker_pids.close()
+        for item in pending:
+            doc_path, extractor, future=item
+            if extractor is None or not extractor.process_safe or future is None:
+                continue
+            # Documents extracted before workers were killed are kept
+            if future.done() and not future.cancelled() and future.exception() is None:
+                continue
+            item[2]=self._get_executor().submit(timed_extract, extractor, doc_path)
+
+    def _failed_future(self, err:Exception)->Future:
+        future=Future()
+        future.set_exception(err)
+        return future
+
+    def _get_executor(self)->ProcessPoolExecutor:
+        if self._executor is None:
+            self._worker_pids=multiprocessing.SimpleQueue()
+            self._executor=ProcessPoolExecutor(max_workers=self.workers,
+                initializer=report_worker_pid, initargs=(self._worker_pids,))
+        return self._executor
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor=None
+            self._worker_pids.close()
+            self._worker_pids=None
+        for extractor in set(self.extractors.values()):
+            if extractor.process_safe or extractor.manages_workers or self._thread_executor is None:
+                extractor.close()
+            else:
+                # COM objects are closed on the thread created them
+                self._thread_executor.submit(extractor.close).result()
+        if self._thread_executor is not None:
+            self._thread_executor.shutdown()
+            self._thread_executor=None
+
+
+def read_extracted_text(source_name:str, file_name:str)->str:
+    """
+    Text saved by save_extracted_text, from '{source}_extracted_texts'
+    or text shards, None if not found.
+    """
+    text_path=os.path.join(f"{source_name}_extracted_texts", f"{file_name}.txt")
+    if os.path.exists(text_path):
+        with open(text_path, "r", encoding="utf-8") as _fin:
+            return _fin.read()
+    if "shards" in config.extracted_texts_output:
+        return get_text_shard_store().get_text(source_name, file_name)
+    return None
+
+
+def save_extracted_text(source_name:str, file_name:str, output_text:str):
+    """
+    Save text extracted from document to '{source}_extracted_texts'
+    and/or text shards, by config.extracted_texts_output.
+    Returns False on documents without text.
+    """
+    log=logging.getLogger('default')
+    log.info(f"\t{len(output_text.split())} words on doc")
+    if len(output_text.strip())==0:
+        log.info("No text found in documet")
+        return False
+    if "txt" in config.extracted_texts_output:
+        output_path=os.path.join(os.getcwd(), f"{source_name}_extracted_texts", f"{file_name}.txt")
+        with span("text_write"), open(output_path, "w", encoding="utf-8") as _fout:
+            _fout.write(output_text)
+    if "shards" in config.extracted_texts_output:
+        with span("text_write"):
+            get_text_shard_store().append(source_name, file_name, output_text)
+    if config.text_search_index_on_extract:
+        get_text_search_index().add_text(source_name, file_name, output_text)
+    return True
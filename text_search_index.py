@@ -0,0 +1,371 @@
+'''
+Full text search over extracted texts, SQLite FTS5 index of texts
+normalized for Hebrew (niqqud & cantillation removed, final letters
+as regular ones, acronyms quotes removed), with documents' source,
+Knesset number and session date (publication date for bills) from the
+catalog of ODATA records for filtering. Snippets are cut from the texts
+as extracted, read back from '{source}_extracted_texts' or text shards,
+the index holds normalized texts only.
+Script builds the index incrementally, or queries it:
+    python text_search_index.py build
+    python text_search_index.py query "חוק התקציב" --knesset 16 17 --date-from 2005-01-01
+'''
+import os
+import re
+import time
+import logging
+import sqlite3
+import argparse
+import threading
+
+import config
+from logger_configurer import configure_logger
+from knesset_numbers import knesset_num_of, FILE_PATH_KNESSET, DOC_NAME_KNESSET
+from knesset_catalog import KnessetCatalog
+from text_shard_store import TextShardStore
+
+
+# Niqqud, cantillation marks & other Hebrew points, not maqaf (U+05BE)
+HEBREW_POINTS=re.compile(r"[\u0591-\u05bd\u05bf-\u05c7]")
+MAQAF="\u05be"
+# Geresh & gershayim (Hebrew or ASCII) inside words, like 'צה"ל'
+HEBREW_QUOTES=re.compile(r"(?<=[\u05d0-\u05ea])[\"'\u05f3\u05f4](?=[\u05d0-\u05ea])")
+# Marks of matches in highlighted texts, not found in extracted texts
+MATCH_START="\x01"
+MATCH_END="\x02"
+MATCH_MARKS=re.compile(f"({MATCH_START}|{MATCH_END})")
+# Words of snippets, around first match
+SNIPPET_WORDS=16
+FINAL_LETTERS=str.maketrans("\u05da\u05dd\u05df\u05e3\u05e5", "\u05db\u05de\u05e0\u05e4\u05e6")
+
+
+def normalize_hebrew(text:str)->str:
+    """
+    Text as indexed and queried: no Hebrew points, final letters
+    as regular letters, no quotes inside words, maqaf as space.
+    """
+    text=HEBREW_POINTS.sub("", text)
+    text=HEBREW_QUOTES.sub("", text.replace(MAQAF, " "))
+    return text.translate(FINAL_LETTERS)
+
+
+def normalized_offsets(text:str)->list:
+    """
+    Offset in text of each character of normalize_hebrew(text),
+    which only removes characters or replaces them by one.
+    """
+    kept=[idx for idx, char in enumerate(text) if not HEBREW_POINTS.match(char)]
+    unpointed="".join(text[idx] for idx in kept)
+    quotes={match.start() for match in HEBREW_QUOTES.finditer(unpointed)}
+    return [offset for idx, offset in enumerate(kept) if idx not in quotes]
+
+
+def make_snippet(text:str, highlighted:str, words:int=SNIPPET_WORDS)->str:
+    """
+    Words of text around its first match, matches in '[]', by
+    highlighted, its normalized text with matches between MATCH_START
+    & MATCH_END.
+    """
+    # Matches (start, end) in normalized text
+    matches=[]
+    offset=0
+    for part in MATCH_MARKS.split(highlighted):
+        if part==MATCH_START:
+            start=offset
+        elif part==MATCH_END:
+            matches.append((start, offset))
+        else:
+            offset+=len(part)
+    offsets=normalized_offsets(text)
+    matches=[(offsets[start], offsets[end-1]+1) for start, end in matches if end>start]
+    first=matches[0][0] if matches else 0
+    spans=[match.span() for match in re.finditer(r"\S+", text)]
+    first_word=next((idx for idx, (_, end) in enumerate(spans) if end>first), 0)
+    start_word=max(0, min(first_word-words//4, len(spans)-words))
+    window=spans[start_word:start_word+words]
+    if not window:
+        return ""
+    window_start, window_end=window[0][0], window[-1][1]
+    snippet=[]
+    offset=window_start
+    for start, end in matches:
+        start, end=max(start, window_start), min(end, window_end)
+        if start<offset or start>=end:
+            continue
+        snippet.extend([text[offset:start], "[", text[start:end], "]"])
+        offset=end
+    snippet.append(text[offset:window_end])
+    return ("..." if start_word>0 else "")+"".join(snippet)+ \
+        ("..." if start_word+words<len(spans) else "")
+
+
+class TextSearchIndex():
+    """
+    Texts are indexed per (source, document name), a text indexed again
+    replaces the previous one. Texts are indexed normalized, snippets of
+    results are cut from their texts as extracted. Writes are committed
+    every config.text_search_commit_every texts and on close. Thread safe.
+    """
+
+    def __init__(self, index_file:str=None) -> None:
+        self.log=logging.getLogger('default')
+        self.index_file=index_file if index_file is not None else config.text_search_index_file
+        self._lock=threading.Lock()
+        self._pending=0
+        self.conn=sqlite3.connect(self.index_file, check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS docs (
+            id INTEGER PRIMARY KEY,
+            source TEXT NOT NULL,
+            doc_name TEXT NOT NULL,
+            knesset_num INTEGER,
+            updated_at REAL NOT NULL,
+            UNIQUE (source, doc_name))""")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS doc_meta (
+            source TEXT NOT NULL,
+            doc_name TEXT NOT NULL,
+            knesset_num INTEGER,
+            date TEXT,
+            file_path TEXT,
+            PRIMARY KEY (source, doc_name))""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS doc_meta_knesset ON doc_meta (knesset_num, date)")
+        columns=[row[1] for row in self.conn.execute("PRAGMA table_info(texts_fts)")]
+        # Index built with texts as extracted on a 'raw' column keeps
+        # its normalized texts only
+        table="texts_fts_body" if "raw" in columns else "texts_fts"
+        self.conn.execute(f"""CREATE VIRTUAL TABLE IF NOT EXISTS {table}
+            USING fts5(body, tokenize='unicode61 remove_diacritics 2')""")
+        if "raw" in columns:
+            self.log.warning(f"Extracted texts are dropped from {self.index_file}")
+            self.conn.execute("INSERT INTO texts_fts_body (rowid, body) SELECT rowid, body FROM texts_fts")
+            self.conn.execute("DROP TABLE texts_fts")
+            self.conn.execute("ALTER TABLE texts_fts_body RENAME TO texts_fts")
+            self.conn.commit()
+            self.conn.execute("VACUUM")
+        self.conn.commit()
+
+    def add_text(self, source_name:str, doc_name:str, text:str, updated_at:float=None):
+        """
+        Index text of doc_name, replacing its previous text.
+        """
+        with self._lock:
+            row=self.conn.execute("SELECT id FROM docs WHERE source=? AND doc_name=?",
+                (source_name, doc_name)).fetchone()
+            if row is not None:
+                self.conn.execute("DELETE FROM texts_fts WHERE rowid=?", (row[0],))
+                self.conn.execute("DELETE FROM docs WHERE id=?", (row[0],))
+            cursor=self.conn.execute("""INSERT INTO docs (source, doc_name, knesset_num, updated_at)
+                VALUES (?, ?, ?, ?)""", (source_name, doc_name, knesset_num_of(DOC_NAME_KNESSET, doc_name),
+                    updated_at if updated_at is not None else time.time()))
+            self.conn.execute("INSERT INTO texts_fts (rowid, body) VALUES (?, ?)",
+                (cursor.lastrowid, normalize_hebrew(text)))
+            self._pending+=1
+            if self._pending>=config.text_search_commit_every:
+                self.conn.commit()
+                self._pending=0
+
+    def add_records(self, source_name:str, records:list):
+        """
+        Keep Knesset number of ODATA documents records, by FilePath,
+        for filtering texts indexed now or later. Session dates are
+        kept, set on build from the catalog.
+        """
+        rows=[]
+        for record in records:
+            file_path=record.get("FilePath") or ""
+            doc_name=file_path.split("/")[-1]
+            if not doc_name:
+                continue
+            rows.append((source_name, doc_name, knesset_num_of(FILE_PATH_KNESSET, file_path), None, file_path))
+        with self._lock:
+            self.conn.executemany("""INSERT INTO doc_meta VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (source, doc_name) DO UPDATE SET
+                    knesset_num=COALESCE(doc_meta.knesset_num, excluded.knesset_num),
+                    file_path=excluded.file_path""", rows)
+            self.conn.commit()
+
+    def add_catalog_documents(self, sources:list):
+        """
+        Keep Knesset number & session date of documents of sources,
+        from the catalog documents view, loading pages saved since
+        catalog was loaded.
+        """
+        catalog=KnessetCatalog()
+        try:
+            catalog.load()
+            documents_df=catalog.documents(sources=sources)
+        finally:
+            catalog.close()
+        documents_df=documents_df.astype(object).where(documents_df.notna(), None)
+        rows=documents_df[["source", "doc_name", "knesset_num", "session_date", "file_path"]].values.tolist()
+        with self._lock:
+            self.conn.executemany("INSERT OR REPLACE INTO doc_meta VALUES (?, ?, ?, ?, ?)", rows)
+            self.conn.commit()
+        self.log.info(f"{len(rows)} documents records of catalog kept")
+
+    def indexed_times(self, source_name:str)->dict:
+        with self._lock:
+            return dict(self.conn.execute("SELECT doc_name, updated_at FROM docs WHERE source=?",
+                (source_name,)))
+
+    def build(self, sources:list=None, rebuild:bool=False):
+        """
+        Index documents records of the catalog, loaded from saved pages,
+        and texts of sources extracted since they were indexed, from
+        '{source}_extracted_texts' and text shards.
+        """
+        sources=sources if sources is not None else config.datasets_sources
+        if rebuild:
+            with self._lock:
+                for table in ["docs", "doc_meta", "texts_fts"]:
+                    self.conn.execute(f"DELETE FROM {table}")
+                self.conn.commit()
+        self.add_catalog_documents(sources)
+        shard_store=TextShardStore() if os.path.exists(config.text_shards_dir) else None
+        for source_name in sources:
+            indexed=self.indexed_times(source_name)
+            cnt=0
+            texts_dir=f"{source_name}_extracted_texts"
+            if os.path.exists(texts_dir):
+                with os.scandir(texts_dir) as entries:
+                    for entry in entries:
+                        if not entry.name.endswith(".txt"):
+                            continue
+                        doc_name=entry.name[:-len(".txt")]
+                        mtime=entry.stat().st_mtime
+                        if indexed.get(doc_name, -1)>=mtime:
+                            continue
+                        with open(entry.path, "r", encoding="utf-8") as _fin:
+                            self.add_text(source_name, doc_name, _fin.read(), mtime)
+                        indexed[doc_name]=mtime
+                        cnt+=1
+                        if cnt%1000==0:
+                            self.log.info(f"{cnt} texts of {source_name} indexed")
+            if shard_store is not None:
+                mtimes=shard_store.text_mtimes(source_name)
+                for doc_name, mtime in mtimes.items():
+                    if indexed.get(doc_name, -1)<mtime:
+                        self.add_text(source_name, doc_name, shard_store.get_text(source_name, doc_name), mtime)
+                        cnt+=1
+            self.commit()
+            self.log.info(f"{cnt} texts of {source_name} indexed")
+        if shard_store is not None:
+            shard_store.close()
+        self.optimize()
+
+    def search(self, query:str, sources:list=None, knesset_nums:list=None,
+            date_from:str=None, date_to:str=None, limit:int=20)->list:
+        """
+        Documents matching FTS5 query (words, "phrases", AND/OR/NOT,
+        prefix*), best first, as dicts of source, doc_name, knesset_num,
+        date and snippet of the text as extracted.
+        Parameters:
+        * knesset_nums: Knesset numbers, of session, FilePath or document name.
+        * date_from, date_to: ISO dates, inclusive, of documents' session
+            (publication for bills), documents not on catalog are left out.
+        """
+        sql=[f"""SELECT d.source, d.doc_name, COALESCE(m.knesset_num, d.knesset_num), m.date,
+                highlight(texts_fts, 0, '{MATCH_START}', '{MATCH_END}')
+            FROM texts_fts JOIN docs d ON d.id=texts_fts.rowid
+            LEFT JOIN doc_meta m ON m.source=d.source AND m.doc_name=d.doc_name
+            WHERE texts_fts MATCH ?"""]
+        params=[normalize_hebrew(query)]
+        if sources:
+            sql.append(f"AND d.source IN ({','.join('?'*len(sources))})")
+            params.extend(sources)
+        if knesset_nums:
+            sql.append(f"AND COALESCE(m.knesset_num, d.knesset_num) IN ({','.join('?'*len(knesset_nums))})")
+            params.extend(int(num) for num in knesset_nums)
+        if date_from:
+            sql.append("AND substr(m.date, 1, 10)>=?")
+            params.append(date_from)
+        if date_to:
+            sql.append("AND substr(m.date, 1, 10)<=?")
+            params.append(date_to)
+        sql.append("ORDER BY bm25(texts_fts) LIMIT ?")
+        params.append(limit)
+        with self._lock:
+            rows=self.conn.execute(" ".join(sql), params).fetchall()
+        return [{"source":row[0], "doc_name":row[1], "knesset_num":row[2], "date":row[3],
+            "snippet":self.snippet(row[0], row[1], row[4])} for row in rows]
+
+    def snippet(self, source_name:str, doc_name:str, highlighted:str)->str:
+        """
+        Snippet of document's text as extracted, by highlighted, its
+        normalized text with matches marked. Cut from the normalized
+        text when text is not found or changed since indexed.
+        """
+        # Imported here, extraction indexes texts on this module
+        from text_extractors import read_extracted_text
+        normalized=MATCH_MARKS.sub("", highlighted)
+        text=read_extracted_text(source_name, doc_name)
+        if text is None or normalize_hebrew(text)!=normalized:
+            text=normalized
+        return make_snippet(text, highlighted)
+
+    def commit(self):
+        with self._lock:
+            self.conn.commit()
+            self._pending=0
+
+    def optimize(self):
+        # Merge index segments, faster queries after large builds
+        with self._lock:
+            self.conn.execute("INSERT INTO texts_fts (texts_fts) VALUES ('optimize')")
+            self.conn.commit()
+
+    def close(self):
+        self.commit()
+        with self._lock:
+            self.conn.close()
+
+
+_text_search_index=None
+_text_search_index_lock=threading.Lock()
+
+
+def get_text_search_index()->TextSearchIndex:
+    """
+    Index shared by extraction of the process.
+    """
+    global _text_search_index
+    with _text_search_index_lock:
+        if _text_search_index is None:
+            _text_search_index=TextSearchIndex()
+        return _text_search_index
+
+
+def close_text_search_index():
+    global _text_search_index
+    with _text_search_index_lock:
+        if _text_search_index is not None:
+            _text_search_index.close()
+            _text_search_index=None
+
+
+if __name__=='__main__':
+    parser=argparse.ArgumentParser(description="Full text search index of extracted Knesset texts")
+    subparsers=parser.add_subparsers(dest="command", required=True)
+    build_parser=subparsers.add_parser("build", help="Index texts extracted since last build")
+    build_parser.add_argument("--sources", nargs="+", help="Sources to index, datasets_sources by default")
+    build_parser.add_argument("--rebuild", action="store_true", help="Index all texts from scratch")
+    query_parser=subparsers.add_parser("query", help="Search indexed texts")
+    query_parser.add_argument("query", help="FTS5 query, like 'תקציב' or '\"חוק התקציב\"'")
+    query_parser.add_argument("--sources", nargs="+")
+    query_parser.add_argument("--knesset", nargs="+", type=int, help="Knesset numbers")
+    query_parser.add_argument("--date-from", help="ISO date, like 2005-01-01")
+    query_parser.add_argument("--date-to", help="ISO date, inclusive")
+    query_parser.add_argument("--limit", type=int, default=20)
+    args=parser.parse_args()
+
+    log=configure_logger('default')
+    search_index=TextSearchIndex()
+    if args.command=="build":
+        log.info("Program start")
+        search_index.build(args.sources, args.rebuild)
+        log.info("Program ends")
+    else:
+        for result in search_index.search(args.query, args.sources, args.knesset,
+                args.date_from, args.date_to, args.limit):
+            print(f"{result['source']}/{result['doc_name']} (Knesset {result['knesset_num']}, "
+                f"{result['date']}): {result['snippet']}")
+    search_index.close()
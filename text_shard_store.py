@@ -0,0 +1,305 @@
+'''
+Compressed shards of extracted texts: texts of a source are appended
+as JSONL records ({"doc_name", "text"}) to a few large shard files
+('{store_dir}/{source}/{source}-00000.jsonl.gz'), instead of a '.txt'
+file per document. Each record is compressed on its own (gzip member,
+or zstd frame), so a shard is still a valid '.gz'/'.zst' file read by
+standard tools, and a text is read back by its byte offset, indexed
+on SQLite.
+Script converts existing '{source}_extracted_texts' folders.
+'''
+import os
+import gzip
+import json
+import time
+import logging
+import sqlite3
+import argparse
+import threading
+
+import config
+from logger_configurer import configure_logger
+
+
+# Shard file suffix per codec
+CODEC_SUFFIXES={"gzip":".jsonl.gz", "zstd":".jsonl.zst"}
+
+
+def import_zstandard():
+    try:
+        import zstandard
+    except ImportError as err:
+        raise ImportError("zstandard is required for 'zstd' text shards, "
+            "'pip install zstandard'") from err
+    return zstandard
+
+
+class TextShardStore():
+    """
+    Shards are only appended to, a text saved again is appended as a
+    new record and the index points to it. Index writes are committed
+    every config.text_shards_commit_every texts and on close, after the
+    shards are fsync'ed, so the index never points past durable records.
+    Records past the indexed end of a shard (a run stopped while
+    appending) are cut on next append. Thread safe.
+    """
+
+    def __init__(self, store_dir:str=None, codec:str=None, max_shard_size:int=None) -> None:
+        self.log=logging.getLogger('default')
+        self.store_dir=store_dir if store_dir is not None else config.text_shards_dir
+        self.codec=codec if codec is not None else config.text_shards_codec
+        self.max_shard_size=max_shard_size if max_shard_size is not None else config.text_shard_max_size
+        if self.codec not in CODEC_SUFFIXES:
+            raise ValueError(f"Unknown text shards codec {self.codec}, expected one of {list(CODEC_SUFFIXES)}")
+        self.zstd=import_zstandard() if self.codec=="zstd" else None
+        os.makedirs(self.store_dir, exist_ok=True)
+        self._lock=threading.Lock()
+        self._pending=0
+        # Shard open for append per source: (shard name, file object)
+        self._shards={}
+        self.conn=sqlite3.connect(os.path.join(self.store_dir, "index.sqlite"), check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS texts (
+            source TEXT NOT NULL,
+            doc_name TEXT NOT NULL,
+            shard TEXT NOT NULL,
+            offset INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (source, doc_name))""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS texts_shard ON texts (shard, offset)")
+        self.conn.commit()
+
+    def shard_path(self, source_name:str, shard:str)->str:
+        return os.path.join(self.store_dir, source_name, shard)
+
+    def compress(self, data:bytes)->bytes:
+        if self.codec=="zstd":
+            return self.zstd.ZstdCompressor().compress(data)
+        return gzip.compress(data)
+
+    def decompress(self, shard:str, data:bytes)->bytes:
+        if shard.endswith(CODEC_SUFFIXES["zstd"]):
+            return import_zstandard().ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def _shard_for_append(self, source_name:str, size:int):
+        """
+        Open shard of source to append a record of size bytes,
+        a new shard once current one is full.
+        """
+        suffix=CODEC_SUFFIXES[self.codec]
+        if source_name in self._shards:
+            shard, _file=self._shards[source_name]
+            if _file.tell()+size<=self.max_shard_size or _file.tell()==0:
+                return shard, _file
+            # Full shard's records are indexed on next commit
+            _file.flush()
+            os.fsync(_file.fileno())
+            _file.close()
+            del self._shards[source_name]
+            shard_number=int(shard.split("-")[-1].split(".")[0])+1
+        else:
+            source_dir=os.path.join(self.store_dir, source_name)
+            os.makedirs(source_dir, exist_ok=True)
+            shards=sorted(_file for _file in os.listdir(source_dir) if _file.startswith(f"{source_name}-"))
+            shard_number=int(shards[-1].split("-")[-1].split(".")[0]) if shards else 0
+            if shards and shards[-1].endswith(suffix):
+                shard=shards[-1]
+                _file=open(self.shard_path(source_name, shard), "r+b")
+                # Cut records appended after last indexed record
+                row=self.conn.execute("SELECT MAX(offset+length) FROM texts WHERE shard=?", (shard,)).fetchone()
+                _file.truncate(row[0] or 0)
+                _file.flush()
+                os.fsync(_file.fileno())
+                _file.seek(0, os.SEEK_END)
+                if _file.tell()+size<=self.max_shard_size or _file.tell()==0:
+                    self._shards[source_name]=(shard, _file)
+                    return shard, _file
+                _file.close()
+            if shards:
+                shard_number+=1
+        shard=f"{source_name}-{shard_number:05d}{suffix}"
+        _file=open(self.shard_path(source_name, shard), "wb")
+        self._shards[source_name]=(shard, _file)
+        return shard, _file
+
+    def append(self, source_name:str, doc_name:str, text:str, updated_at:float=None):
+        """
+        Append text of doc_name to current shard of source, readable
+        by this store at once, by others once committed.
+        """
+        record=json.dumps({"doc_name":doc_name, "text":text}, ensure_ascii=False)+"\n"
+        data=self.compress(record.encode("utf-8"))
+        with self._lock:
+            shard, _file=self._shard_for_append(source_name, len(data))
+            offset=_file.tell()
+            _file.write(data)
+            self.conn.execute("""INSERT OR REPLACE INTO texts
+                (source, doc_name, shard, offset, length, updated_at) VALUES (?, ?, ?, ?, ?, ?)""",
+                (source_name, doc_name, shard, offset, len(data),
+                    updated_at if updated_at is not None else time.time()))
+            self._pending+=1
+            if self._pending>=config.text_shards_commit_every:
+                self._commit()
+
+    def _commit(self):
+        for _, _file in self._shards.values():
+            _file.flush()
+            os.fsync(_file.fileno())
+        self.conn.commit()
+        self._pending=0
+
+    def commit(self):
+        """
+        Fsync shards appended to, then commit their index.
+        """
+        with self._lock:
+            self._commit()
+
+    def get_text(self, source_name:str, doc_name:str)->str:
+        """
+        Text of doc_name, None if not stored.
+        """
+        with self._lock:
+            row=self.conn.execute("SELECT shard, offset, length FROM texts WHERE source=? AND doc_name=?",
+                (source_name, doc_name)).fetchone()
+            if row is None:
+                return None
+            shard, offset, length=row
+            if source_name in self._shards:
+                self._shards[source_name][1].flush()
+        with open(self.shard_path(source_name, shard), "rb") as _fin:
+            _fin.seek(offset)
+            data=_fin.read(length)
+        return json.loads(self.decompress(shard, data))["text"]
+
+    def sources(self)->list:
+        with self._lock:
+            return [row[0] for row in self.conn.execute("SELECT DISTINCT source FROM texts ORDER BY source")]
+
+    def text_mtimes(self, source_name:str)->dict:
+        """
+        Document name to time its text was stored, of source.
+        """
+        with self._lock:
+            return dict(self.conn.execute("SELECT doc_name, updated_at FROM texts WHERE source=?",
+                (source_name,)))
+
+    def iter_texts(self, sources:list=None, read_size:int=8*1024**2, doc_names:set=None):
+        """
+        Yield (source, doc_name, text) of current texts, of doc_names
+        only if given, reading shards sequentially in large blocks.
+        """
+        sources=self.sources() if sources is None else sources
+        for source_name in sources:
+            with self._lock:
+                rows=self.conn.execute("""SELECT doc_name, shard, offset, length FROM texts
+                    WHERE source=? ORDER BY shard, offset""", (source_name,)).fetchall()
+                if source_name in self._shards:
+                    self._shards[source_name][1].flush()
+            _fin, current_shard=None, None
+            block, block_offset=b"", 0
+            try:
+                for doc_name, shard, offset, length in rows:
+                    if doc_names is not None and doc_name not in doc_names:
+                        continue
+                    if shard!=current_shard:
+                        if _fin is not None:
+                            _fin.close()
+                        _fin=open(self.shard_path(source_name, shard), "rb")
+                        current_shard=shard
+                        block, block_offset=b"", 0
+                    if offset<block_offset or offset+length>block_offset+len(block):
+                        _fin.seek(offset)
+                        block, block_offset=_fin.read(max(length, read_size)), offset
+                    data=block[offset-block_offset:offset-block_offset+length]
+                    yield source_name, doc_name, json.loads(self.decompress(shard, data))["text"]
+            finally:
+                if _fin is not None:
+                    _fin.close()
+
+    def import_dir(self, source_name:str, texts_dir:str=None, remove_texts:bool=False)->int:
+        """
+        Append '.txt' files of texts_dir ('{source}_extracted_texts' by
+        default) not stored yet, or modified since.
+        Returns number of texts imported.
+        """
+        texts_dir=texts_dir if texts_dir is not None else f"{source_name}_extracted_texts"
+        stored_mtimes=self.text_mtimes(source_name)
+        cnt=0
+        # Files are removed once their texts are committed
+        to_remove=[]
+        with os.scandir(texts_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".txt"):
+                    continue
+                doc_name=entry.name[:-len(".txt")]
+                mtime=entry.stat().st_mtime
+                if stored_mtimes.get(doc_name, -1)<mtime:
+                    with open(entry.path, "r", encoding="utf-8") as _fin:
+                        self.append(source_name, doc_name, _fin.read(), mtime)
+                    cnt+=1
+                    if cnt%1000==0:
+                        self.log.info(f"{cnt} texts of {texts_dir} imported")
+                if remove_texts:
+                    to_remove.append(entry.path)
+                if len(to_remove)>=config.text_shards_commit_every:
+                    self.commit()
+                    for path in to_remove:
+                        os.remove(path)
+                    to_remove=[]
+        self.commit()
+        for path in to_remove:
+            os.remove(path)
+        self.log.info(f"{cnt} texts of {texts_dir} imported to {self.store_dir}")
+        return cnt
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            for shard, _file in self._shards.values():
+                _file.close()
+            self._shards={}
+            self.conn.close()
+
+
+_text_shard_store=None
+_text_shard_store_lock=threading.Lock()
+
+
+def get_text_shard_store()->TextShardStore:
+    """
+    Store shared by extraction of the process.
+    """
+    global _text_shard_store
+    with _text_shard_store_lock:
+        if _text_shard_store is None:
+            _text_shard_store=TextShardStore()
+        return _text_shard_store
+
+
+def close_text_shard_store():
+    global _text_shard_store
+    with _text_shard_store_lock:
+        if _text_shard_store is not None:
+            _text_shard_store.close()
+            _text_shard_store=None
+
+
+if __name__=='__main__':
+    parser=argparse.ArgumentParser(description="Convert extracted texts folders to compressed shards")
+    parser.add_argument("sources", nargs="*", help="Sources to convert, datasets_sources by default")
+    parser.add_argument("--remove-texts", action="store_true",
+        help="Remove '.txt' files once stored on shards")
+    args=parser.parse_args()
+
+    log=configure_logger('default')
+    log.info("Program start")
+
+    store=TextShardStore()
+    for source in args.sources or config.datasets_sources:
+        if os.path.exists(f"{source}_extracted_texts"):
+            store.import_dir(source, remove_texts=args.remove_texts)
+    store.close()
+
+    log.info("Program ends")
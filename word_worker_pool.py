@@ -0,0 +1,315 @@
+'''
+Pool of MS WORD worker processes for text extraction on Windows hosts:
+each worker process drives its own isolated WORD instance (DispatchEx),
+documents are fed to idle workers, a watchdog kills a worker (and its
+WORD) stuck on a document past the timeout, and workers are recycled
+after a number of documents or on COM errors ('Call was rejected by
+callee'), so 1 hung document doesn't stall extraction. A worker that
+fails to start fails its document, with the WORD it opened killed.
+Requires pywin32.
+'''
+import os
+import time
+import signal
+import logging
+import importlib.util
+import multiprocessing
+from collections import deque
+from multiprocessing.connection import wait
+
+import config
+from crawl_metrics import get_metrics
+from text_extractors import TextExtractor, Win32ComTextExtractor
+
+
+# Seconds between watchdog checks of busy workers
+WATCHDOG_INTERVAL=0.5
+# Window class of MS WORD main window
+WORD_WINDOW_CLASS="OpusApp"
+
+
+def word_pids()->set:
+    """
+    Process ids of running MS WORD instances.
+    """
+    import pywintypes
+    import win32api
+    import win32con
+    import win32process
+    pids=set()
+    for pid in win32process.EnumProcesses():
+        try:
+            handle=win32api.OpenProcess(win32con.PROCESS_QUERY_INFORMATION|win32con.PROCESS_VM_READ, False, pid)
+        except pywintypes.error:
+            # System & other users processes
+            continue
+        try:
+            if os.path.basename(win32process.GetModuleFileNameEx(handle, None)).lower()=="winword.exe":
+                pids.add(pid)
+        except pywintypes.error:
+            pass
+        finally:
+            win32api.CloseHandle(handle)
+    return pids
+
+
+def kill_word(word_pid:int):
+    try:
+        os.kill(word_pid, signal.SIGTERM)
+    except OSError:
+        # WORD already exited with its worker
+        pass
+
+
+def find_word_pid(word_application)->int:
+    """
+    Process id of a WORD instance, found by its window with a unique
+    caption, None if not found.
+    """
+    import win32gui
+    import win32process
+    caption=f"knesset-word-worker-{os.getpid()}"
+    word_application.Caption=caption
+    hwnd=win32gui.FindWindow(WORD_WINDOW_CLASS, caption)
+    if not hwnd:
+        return None
+    return win32process.GetWindowThreadProcessId(hwnd)[1]
+
+
+def word_worker(conn, recycle_after:int):
+    """
+    Worker process: open an isolated WORD, send ("ready", word_pid),
+    then per document path received send ("done", text, seconds, error, recycle).
+    Exits after recycle_after documents, on a COM error or on None.
+    """
+    import pythoncom
+    pythoncom.CoInitialize()
+    extractor=Win32ComTextExtractor(isolated=True)
+    try:
+        extractor.init_word_app()
+        conn.send(("ready", find_word_pid(extractor.word_application)))
+        for _ in range(recycle_after):
+            doc_path=conn.recv()
+            if doc_path is None:
+                break
+            start=time.perf_counter()
+            try:
+                output_text=extractor.extract(doc_path)
+            except Exception as err:
+                # WORD may be left unusable, worker is replaced
+                com_error=type(err).__name__=="com_error"
+                conn.send(("done", None, time.perf_counter()-start, f"{type(err).__name__}: {err}", com_error))
+                if com_error:
+                    break
+                continue
+            conn.send(("done", output_text, time.perf_counter()-start, None, False))
+    finally:
+        try:
+            extractor.close()
+        finally:
+            pythoncom.CoUninitialize()
+
+
+class WordWorker():
+    """
+    Parent side of a worker process, with the document it works on.
+    """
+
+    def __init__(self, process, conn, word_pid:int) -> None:
+        self.process=process
+        self.conn=conn
+        self.word_pid=word_pid
+        self.docs_cnt=0
+        self.doc_path=None
+        self.started_at=None
+
+    def assign(self, doc_path:str):
+        self.doc_path=doc_path
+        self.started_at=time.monotonic()
+        self.conn.send(doc_path)
+
+
+class WordWorkerPool():
+    """
+    Workers are started on demand, up to 'workers', and kept
+    between batches until close().
+    """
+
+    def __init__(self, workers:int=None, timeout:float=None, recycle_after:int=None) -> None:
+        self.log=logging.getLogger('default')
+        self.workers=workers if workers is not None else config.word_pool_workers
+        self.timeout=timeout if timeout is not None else config.extraction_timeout
+        self.recycle_after=recycle_after if recycle_after is not None else config.word_worker_recycle_after
+        # Worker processes are spawned, not forked, on all platforms
+        self.context=multiprocessing.get_context("spawn")
+        self.idle=[]
+
+    def start_worker(self)->WordWorker:
+        """
+        Start a worker and wait for its WORD to open. WORD processes
+        started meanwhile are killed with a worker that didn't get
+        ready, its pid isn't known yet. Workers are started 1 at a time.
+        """
+        word_pids_before=word_pids()
+        parent_conn, child_conn=self.context.Pipe()
+        process=self.context.Process(target=word_worker, args=(child_conn, self.recycle_after),
+            name="word-worker", daemon=True)
+        process.start()
+        child_conn.close()
+        try:
+            # Opening WORD is bounded by the documents timeout as well
+            if not parent_conn.poll(self.timeout):
+                raise TimeoutError(f"MS WORD worker didn't start in {self.timeout} seconds")
+            try:
+                _, word_pid=parent_conn.recv()
+            except EOFError:
+                process.join()
+                raise RuntimeError(f"MS WORD worker failed to start, exit code {process.exitcode}")
+        except Exception:
+            process.kill()
+            process.join()
+            for pid in word_pids()-word_pids_before:
+                kill_word(pid)
+            parent_conn.close()
+            raise
+        if word_pid is None:
+            # WORD window wasn't found, pid of WORD started meanwhile
+            new_pids=word_pids()-word_pids_before
+            word_pid=new_pids.pop() if len(new_pids)==1 else None
+        get_metrics().inc("word_workers_started")
+        self.log.info(f"MS WORD worker {process.pid} started, WORD process {word_pid}")
+        return WordWorker(process, parent_conn, word_pid)
+
+    def get_worker(self)->WordWorker:
+        """
+        Idle worker, exited ones are dropped, else a new one.
+        """
+        while self.idle:
+            worker=self.idle.pop()
+            if worker.process.is_alive():
+                return worker
+            self.kill(worker)
+        return self.start_worker()
+
+    def extract_many(self, doc_paths:list):
+        """
+        Extract texts of documents on the workers, yield per document
+        as completed (doc_path, text, seconds, error), error is None
+        on success. Busy workers are killed if the generator is closed
+        before all documents are yielded.
+        """
+        pending=deque(doc_paths)
+        # Connection to busy worker
+        busy={}
+        try:
+            yield from self._extract_pending(pending, busy)
+        finally:
+            for worker in busy.values():
+                self.kill(worker)
+
+    def _extract_pending(self, pending:deque, busy:dict):
+        while pending or busy:
+            while pending and len(busy)<self.workers:
+                start=time.monotonic()
+                try:
+                    worker=self.get_worker()
+                except (TimeoutError, RuntimeError, OSError) as err:
+                    doc_path=pending.popleft()
+                    self.log.error(f"MS WORD worker didn't start for {doc_path}: {err}")
+                    yield doc_path, None, time.monotonic()-start, err
+                    continue
+                doc_path=pending.popleft()
+                try:
+                    worker.assign(doc_path)
+                except OSError as err:
+                    # Worker exited since it was checked
+                    self.kill(worker)
+                    yield doc_path, None, time.monotonic()-start, \
+                        RuntimeError(f"MS WORD worker exited before {doc_path}: {err}")
+                    continue
+                busy[worker.conn]=worker
+            if not busy:
+                continue
+            for conn in wait(list(busy), timeout=WATCHDOG_INTERVAL):
+                worker=busy.pop(conn)
+                try:
+                    _, output_text, seconds, error, recycle=conn.recv()
+                except (EOFError, OSError):
+                    self.kill(worker)
+                    yield worker.doc_path, None, time.monotonic()-worker.started_at, \
+                        RuntimeError(f"MS WORD worker exited on {worker.doc_path}")
+                    continue
+                worker.docs_cnt+=1
+                if recycle or worker.docs_cnt>=self.recycle_after:
+                    self.retire(worker)
+                else:
+                    self.idle.append(worker)
+                yield worker.doc_path, output_text, seconds, RuntimeError(error) if error else None
+            # Watchdog
+            now=time.monotonic()
+            for conn, worker in list(busy.items()):
+                if now-worker.started_at>self.timeout:
+                    del busy[conn]
+                    self.log.info(f"Extraction of {worker.doc_path} timed out after {self.timeout} seconds, "
+                        f"killing MS WORD worker {worker.process.pid}")
+                    self.kill(worker)
+                    get_metrics().inc("word_workers_killed")
+                    yield worker.doc_path, None, now-worker.started_at, \
+                        TimeoutError(f"Extraction timed out: {worker.doc_path}")
+
+    def retire(self, worker:WordWorker):
+        """
+        Stop worker and its WORD gracefully, killed if it doesn't exit.
+        """
+        try:
+            worker.conn.send(None)
+        except OSError:
+            # Worker exited by itself, after recycle_after documents
+            pass
+        worker.process.join(self.timeout)
+        if worker.process.is_alive():
+            self.kill(worker)
+            return
+        worker.conn.close()
+        get_metrics().inc("word_workers_recycled")
+
+    def kill(self, worker:WordWorker):
+        worker.process.kill()
+        worker.process.join()
+        if worker.word_pid is not None:
+            kill_word(worker.word_pid)
+        worker.conn.close()
+
+    def close(self):
+        for worker in self.idle:
+            self.retire(worker)
+        self.idle=[]
+
+
+class WordPoolTextExtractor(TextExtractor):
+    """
+    Extraction backend over WordWorkerPool, documents of a batch
+    are extracted by ExtractionEngine with extract_many().
+    """
+    suffixes=["doc", "docx"]
+    process_safe=False
+    manages_workers=True
+
+    def __init__(self, workers:int=None, timeout:float=None, recycle_after:int=None) -> None:
+        self.pool=WordWorkerPool(workers, timeout, recycle_after)
+
+    @classmethod
+    def is_available(cls)->bool:
+        return os.name=='nt' and importlib.util.find_spec("win32com") is not None
+
+    def extract_many(self, doc_paths:list):
+        return self.pool.extract_many(doc_paths)
+
+    def extract(self, doc_path:str)->str:
+        for _, output_text, _, err in self.extract_many([doc_path]):
+            if err is not None:
+                raise err
+            return output_text
+
+    def close(self):
+        self.pool.close()